@@ -0,0 +1,325 @@
+"""Controller for the IngestionJob model."""
+
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional, Union
+from sqlalchemy import func, inspect, or_, select, text, update
+from sqlalchemy.orm import aliased, scoped_session
+from api.db import Database
+from api.models.ingestion_job import (
+    IngestionJob,
+    JOB_CANCELLED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+)
+from app.utils import Utils
+
+
+class JobController:
+    """
+    Controller for the IngestionJob model, the persistent queue of ingestion jobs. Every
+    thread gets its own session on the shared engine, so one controller serves the API
+    routes and the scheduler threads.
+    """
+
+    def __init__(self, db: Optional[Database] = None):
+        self.db = db or Database()
+        self.session = scoped_session(self.db.session_maker)
+        IngestionJob.__table__.create(self.db.engine, checkfirst=True)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self) -> None:
+        """Adds the nullable columns added since the table of a database was created."""
+        table = IngestionJob.__table__
+        existing = {
+            column["name"] for column in inspect(self.db.engine).get_columns(table.name)
+        }
+        with self.db.engine.begin() as connection:
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=self.db.engine.dialect)
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} "
+                        f"ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+
+    def enqueue(
+        self,
+        book_filename: str,
+        action: str = "generate",
+        priority: int = 0,
+        resume: bool = False,
+        incremental: bool = False,
+        fast: bool = False,
+    ) -> IngestionJob:
+        """
+        Queues an ingestion job, a book with a pending job of the same action gets that
+        job back instead of a second one.
+
+        Args:
+        book_filename (str): The book to ingest.
+        action (str): "generate" to build the embeddings database, "enrich" to summarize
+            it, "reindex" to rebuild its nearest neighbour index.
+        priority (int): Higher priorities are run first, ties run in queueing order.
+        resume (bool): Whether to continue from the checkpoint of the last run.
+        incremental (bool): Whether to only re-embed the pages that changed.
+        fast (bool): Whether to embed the raw chunks and queue the enrichment after.
+        Returns:
+        IngestionJob: The queued (or already pending) job.
+        """
+        pending = self.session.scalars(
+            select(IngestionJob).filter(
+                IngestionJob.book_filename == book_filename,
+                IngestionJob.action == action,
+                IngestionJob.status.in_([JOB_QUEUED, JOB_RUNNING]),
+            )
+        ).first()
+        if pending:
+            return pending
+        job = IngestionJob(
+            book_filename=book_filename,
+            action=action,
+            status=JOB_QUEUED,
+            priority=priority,
+            resume=resume,
+            incremental=incremental,
+            fast=fast,
+            cancel_requested=False,
+            created_at=datetime.utcnow(),
+        )
+        self.session.add(job)
+        self.session.commit()
+        return job
+
+    def get(self, idx: int) -> Optional[IngestionJob]:
+        """Retrieves a job with its latest state."""
+        return self.session.get(IngestionJob, idx, populate_existing=True)
+
+    def list(self, limit: int = 1000, offset: int = 0) -> List[IngestionJob]:
+        """List the jobs, newest first."""
+        stmt = (
+            select(IngestionJob)
+            .order_by(IngestionJob.idx.desc())
+            .limit(limit)
+            .offset(offset)
+            .execution_options(populate_existing=True)
+        )
+        return list(self.session.scalars(stmt))
+
+    def cancel(self, idx: int) -> Optional[IngestionJob]:
+        """
+        Cancels a job, queued jobs are cancelled right away, running jobs are flagged
+        and stopped by their worker at the next progress update.
+        """
+        job = self.get(idx)
+        if not job:
+            return None
+        if job.status == JOB_QUEUED:
+            job.status = JOB_CANCELLED
+            job.finished_at = datetime.utcnow()
+        elif job.status == JOB_RUNNING:
+            job.cancel_requested = True
+        self.session.commit()
+        return job
+
+    def claim_next(self, max_running: int, owner: str) -> Optional[IngestionJob]:
+        """
+        Marks the next queued job as running for a worker, highest priority first.
+        Nothing is claimed while max_running jobs are running server wide, and books
+        with a running job are skipped. Both checks are part of the conditional update
+        that claims the job, so workers of different processes never exceed the cap or
+        run a book twice.
+
+        Args:
+        max_running (int): The maximum number of jobs running across every process.
+        owner (str): The identifier of the claiming worker, stored with its heartbeat.
+        Returns:
+        Optional[IngestionJob]: The claimed job, None if there is nothing to run.
+        """
+        self.session.expire_all()
+        queued = list(
+            self.session.scalars(
+                select(IngestionJob)
+                .filter(IngestionJob.status == JOB_QUEUED)
+                .order_by(
+                    IngestionJob.priority.desc(),
+                    IngestionJob.created_at,
+                    IngestionJob.idx,
+                )
+            )
+        )
+        other = aliased(IngestionJob)
+        running = (
+            select(func.count(other.idx))
+            .where(other.status == JOB_RUNNING)
+            .scalar_subquery()
+        )
+        busy_book = (
+            select(other.idx)
+            .where(
+                other.status == JOB_RUNNING,
+                other.book_filename == IngestionJob.book_filename,
+            )
+            .exists()
+        )
+        for job in queued:
+            now = datetime.utcnow()
+            claimed = self.session.execute(
+                update(IngestionJob)
+                .where(
+                    IngestionJob.idx == job.idx,
+                    IngestionJob.status == JOB_QUEUED,
+                    running < max_running,
+                    ~busy_book,
+                )
+                .values(
+                    status=JOB_RUNNING, owner=owner, started_at=now, heartbeat_at=now
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            self.session.commit()
+            if claimed:
+                return self.get(job.idx)
+        return None
+
+    def heartbeat(self, owner: str) -> int:
+        """Refreshes the heartbeat of the running jobs of a worker, returns how many."""
+        beating = self.session.execute(
+            update(IngestionJob)
+            .where(IngestionJob.status == JOB_RUNNING, IngestionJob.owner == owner)
+            .values(heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.session.commit()
+        return beating
+
+    def update_progress(self, idx: int, progress: str, owner: str) -> bool:
+        """
+        Stores the latest progress event of a job and refreshes its heartbeat, returns
+        True if it must stop: it was cancelled, or requeued because its heartbeat went
+        stale.
+        """
+        owned = self.session.execute(
+            update(IngestionJob)
+            .where(
+                IngestionJob.idx == idx,
+                IngestionJob.status == JOB_RUNNING,
+                IngestionJob.owner == owner,
+            )
+            .values(progress=progress, heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.session.commit()
+        job = self.get(idx)
+        return not owned or not job or job.cancel_requested
+
+    def finish(
+        self,
+        idx: int,
+        status: str,
+        error: Optional[str] = None,
+        owner: Optional[str] = None,
+    ) -> None:
+        """Marks a job as done, failed or cancelled, only if the owner still runs it."""
+        stmt = update(IngestionJob).where(IngestionJob.idx == idx)
+        if owner is not None:
+            stmt = stmt.where(
+                IngestionJob.status == JOB_RUNNING, IngestionJob.owner == owner
+            )
+        self.session.execute(
+            stmt.values(
+                status=status, error=error, finished_at=datetime.utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+        self.session.commit()
+
+    def requeue_interrupted(
+        self, stale_seconds: Optional[float] = None, owner: Optional[str] = None
+    ) -> int:
+        """
+        Puts the running jobs whose worker stopped beating back in the queue, a full
+        generation resumes from its checkpoint. Jobs with a pending cancel are
+        cancelled. Jobs of workers that are still alive in another process are left
+        alone.
+
+        Args:
+        stale_seconds (Optional[float]): Age of the heartbeat after which a worker is
+            considered dead, API_JOB_STALE_SECONDS by default.
+        owner (Optional[str]): Requeues the jobs of this worker whatever their
+            heartbeat, for a worker that is shutting down.
+        Returns:
+        int: The number of jobs requeued or cancelled.
+        """
+        if owner is not None:
+            stopped = IngestionJob.owner == owner
+        else:
+            stale_seconds = (
+                stale_seconds
+                if stale_seconds is not None
+                else Utils.API_JOB_STALE_SECONDS
+            )
+            cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+            stopped = or_(
+                IngestionJob.heartbeat_at.is_(None), IngestionJob.heartbeat_at < cutoff
+            )
+        self.session.expire_all()
+        interrupted = list(
+            self.session.scalars(
+                select(IngestionJob).filter(IngestionJob.status == JOB_RUNNING, stopped)
+            )
+        )
+        requeued = 0
+        for job in interrupted:
+            if job.cancel_requested:
+                values = {"status": JOB_CANCELLED, "finished_at": datetime.utcnow()}
+            else:
+                values = {
+                    "status": JOB_QUEUED,
+                    "resume": job.action == "generate" and not job.incremental,
+                }
+            # Conditional update, a heartbeat newer than the select keeps the job
+            requeued += self.session.execute(
+                update(IngestionJob)
+                .where(
+                    IngestionJob.idx == job.idx,
+                    IngestionJob.status == JOB_RUNNING,
+                    stopped,
+                )
+                .values(owner=None, heartbeat_at=None, **values)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        self.session.commit()
+        return requeued
+
+
+_shared: Optional[JobController] = None
+_shared_lock = threading.Lock()
+
+
+def shared_controller() -> JobController:
+    """Returns the job controller of the API database, creating the table once."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = JobController()
+        return _shared
+
+
+def job_query(method: str, *args, **kwargs) -> Union[None, dict, List[dict]]:
+    """
+    Calls a method of the shared job controller and returns its jobs as dicts, detached
+    from the session of the calling thread. The queue is read with synchronous
+    SQLAlchemy, the API routes run this with asyncio.to_thread.
+
+    Args:
+    method (str): The controller method, e.g. get, list, enqueue or cancel.
+    Returns:
+    Union[None, dict, List[dict]]: The job, the jobs, or None if there is no such job.
+    """
+    result = getattr(shared_controller(), method)(*args, **kwargs)
+    if isinstance(result, list):
+        return [job.as_dict() for job in result]
+    return result.as_dict() if result else None
@@ -0,0 +1,165 @@
+"""Ingestion job scheduler."""
+
+import os
+import socket
+import threading
+import uuid
+from typing import List, Optional
+from api.controllers.job import JobController, shared_controller
+from api.models.ingestion_job import (
+    IngestionJob,
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_FAILED,
+)
+from app.generate_embeddings import EmbeddingsGenerator
+from app.resource_pool import resource_pool
+from app.utils import Utils
+
+
+class IngestionScheduler:
+    """
+    Runs the queued ingestion jobs on a fixed number of worker threads, so the
+    ingestions of the whole server never exceed API_MAX_INGESTION_JOBS no matter how
+    many clients ask for them, and they keep running after the requesting client
+    disconnects. Every API process runs its own scheduler on the shared queue: jobs are
+    claimed under the owner id of the process, kept alive with a heartbeat, and only
+    requeued once it goes stale.
+    """
+
+    def __init__(
+        self, workers: Optional[int] = None, poll_seconds: Optional[float] = None
+    ):
+        self.workers = max(
+            1, workers if workers is not None else Utils.API_MAX_INGESTION_JOBS
+        )
+        self.poll_seconds = (
+            poll_seconds if poll_seconds is not None else Utils.API_JOB_POLL_SECONDS
+        )
+        self._token = uuid.uuid4().hex[:8]
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def owner(self) -> str:
+        """Identifies the jobs of this process, the pid tells forked copies apart."""
+        return f"{socket.gethostname()}:{os.getpid()}:{self._token}"
+
+    def start(self) -> None:
+        """Requeues the jobs of dead workers, then starts the workers and heartbeat."""
+        if self._threads:
+            return
+        self._requeue_stale(shared_controller())
+        self._stop.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"ingestion-worker-{number}", daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+        thread = threading.Thread(
+            target=self._beat, name="ingestion-heartbeat", daemon=True
+        )
+        self._threads.append(thread)
+        thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stops the workers and puts their running jobs back in the queue, so any process
+        resumes them from their checkpoint.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        try:
+            shared_controller().requeue_interrupted(owner=self.owner)
+        except Exception as exc:
+            Utils.logger.error("Failed to requeue the running ingestion jobs: %s", exc)
+
+    def wake(self) -> None:
+        """Makes an idle worker look for a job now instead of at the next poll."""
+        self._wakeup.set()
+
+    def _requeue_stale(self, controller: JobController) -> None:
+        requeued = controller.requeue_interrupted()
+        if requeued:
+            Utils.logger.warning("Requeued %s interrupted ingestion jobs.", requeued)
+            self.wake()
+
+    def _beat(self) -> None:
+        """Keeps the claimed jobs alive and takes over the ones of dead processes."""
+        controller = shared_controller()
+        while not self._stop.wait(Utils.API_JOB_HEARTBEAT_SECONDS):
+            try:
+                controller.heartbeat(self.owner)
+                self._requeue_stale(controller)
+            except Exception as exc:
+                Utils.logger.error("Failed to beat the ingestion jobs: %s", exc)
+
+    def _work(self) -> None:
+        controller = shared_controller()
+        while not self._stop.is_set():
+            try:
+                job = controller.claim_next(self.workers, self.owner)
+            except Exception as exc:
+                Utils.logger.error("Failed to claim an ingestion job: %s", exc)
+                job = None
+            if not job:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+                continue
+            self._run(controller, job)
+
+    def _run(self, controller: JobController, job: IngestionJob) -> None:
+        Utils.logger.info(
+            "Running %s job %s for %s.", job.action, job.idx, job.book_filename
+        )
+        # The job rewrites the store and the page text of the book, so the pooled
+        # handles opened before or while it runs are stale once it ends.
+        output_folder = Utils.strip_extension(job.book_filename)
+        resource_pool.invalidate(output_folder)
+        try:
+            with resource_pool.lease(output_folder):
+                self._execute(controller, job)
+        finally:
+            resource_pool.invalidate(output_folder)
+
+    def _execute(self, controller: JobController, job: IngestionJob) -> None:
+        generator = EmbeddingsGenerator(job.book_filename)
+        if job.action == "enrich":
+            events = generator.enrich_embeddings(stream=True)
+        elif job.action == "reindex":
+            events = generator.reindex_embeddings(stream=True)
+        else:
+            events = generator.generate_embeddings(
+                stream=True,
+                resume=job.resume,
+                incremental=job.incremental,
+                fast=job.fast,
+            )
+        status, error = JOB_DONE, None
+        try:
+            for event in events:
+                if self._stop.is_set():
+                    return
+                payload = event.removeprefix("data: ").strip()
+                if controller.update_progress(job.idx, payload, self.owner):
+                    status = JOB_CANCELLED
+                    break
+        except Exception as exc:
+            Utils.logger.error("Ingestion job %s failed: %s", job.idx, exc)
+            status, error = JOB_FAILED, str(exc)
+        finally:
+            events.close()
+        controller.finish(job.idx, status, error, owner=self.owner)
+        Utils.logger.info("Ingestion job %s finished: %s", job.idx, status)
+        if status == JOB_DONE and job.action == "generate" and job.fast:
+            controller.enqueue(
+                job.book_filename, action="enrich", priority=job.priority - 1
+            )
+
+
+scheduler = IngestionScheduler()
@@ -3,13 +3,20 @@
 # Must run before importing passlib-backed controllers.
 from api.compat import bcrypt_compat  # noqa: F401
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from api.controllers.recovery import RecoveryController
+from api.controllers.scheduler import scheduler
+from api import offload
 from api.routes import client
 from api.routes import admin
 from api.routes import rbac
+from app.answer_cache import answer_cache
+from app.ollama_client import OllamaError, ollama
+from app.query_cache import query_cache
+from app.resource_pool import resource_pool
 from app.utils import Utils
 
 origins = [
@@ -30,6 +37,12 @@ run.include_router(rbac.router)
 run.mount("/data", StaticFiles(directory=Utils.get_data_path()), name="data")
 
 
+@run.exception_handler(OllamaError)
+async def ollama_error(_request: Request, exc: OllamaError):
+    """Answer 503 when Ollama is down or keeps failing, instead of a bare 500."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
 @run.on_event("startup")
 async def startup_recovery_code():
     """Print a short-lived admin recovery code on startup."""
@@ -37,3 +50,30 @@ async def startup_recovery_code():
     code = controller.generate_code()
     if code:
         Utils.logger.warning("Admin recovery code: %s", code)
+
+
+@run.on_event("startup")
+async def startup_ingestion_scheduler():
+    """Start the ingestion job workers, resuming the jobs interrupted by a restart."""
+    scheduler.start()
+
+
+@run.on_event("shutdown")
+async def shutdown_ingestion_scheduler():
+    """Stop the ingestion job workers, running jobs resume on the next startup."""
+    scheduler.stop()
+
+
+@run.on_event("shutdown")
+async def shutdown_resource_pool():
+    """Close the Chroma clients and stores kept open for the books."""
+    resource_pool.close()
+    query_cache.close()
+    answer_cache.close()
+
+
+@run.on_event("shutdown")
+async def shutdown_workers():
+    """Close the Ollama connection pool and stop the worker processes."""
+    await ollama.close()
+    offload.shutdown()
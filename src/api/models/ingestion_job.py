@@ -0,0 +1,60 @@
+"""DB Model for the ingestion jobs."""
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from api.db import Base
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+class IngestionJob(Base):
+    """
+    DB Model for the ingestion jobs, generate builds a book database, enrich summarizes
+    it and reindex rebuilds its nearest neighbour index.
+    """
+
+    __tablename__ = "ingestion_jobs"
+
+    idx = Column(Integer, primary_key=True, autoincrement=True)
+    book_filename = Column(String, nullable=False)
+    action = Column(String, default="generate", nullable=False)
+    status = Column(String, default=JOB_QUEUED, nullable=False, index=True)
+    priority = Column(Integer, default=0, nullable=False)
+    resume = Column(Boolean, default=False, nullable=False)
+    incremental = Column(Boolean, default=False, nullable=False)
+    fast = Column(Boolean, default=False, nullable=False)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    progress = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    def as_dict(self):
+        """Convert the model to a dictionary"""
+        return {
+            "idx": self.idx,
+            "book_filename": self.book_filename,
+            "action": self.action,
+            "status": self.status,
+            "priority": self.priority,
+            "resume": self.resume,
+            "incremental": self.incremental,
+            "fast": self.fast,
+            "cancel_requested": self.cancel_requested,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "owner": self.owner,
+            "heartbeat_at": (
+                self.heartbeat_at.isoformat() if self.heartbeat_at else None
+            ),
+        }
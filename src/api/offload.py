@@ -0,0 +1,95 @@
+"""Worker processes for the CPU-bound and untrusted work of the API routes."""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from app.utils import Utils
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """Returns the shared process pool, started on first use."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=max(1, Utils.API_PROCESS_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+async def run_in_process(func: Callable, *args):
+    """
+    Runs a picklable function in the process pool without blocking the event loop.
+
+    Args:
+    func (Callable): A module level function or static method.
+    Returns:
+    The result of the function.
+    """
+    return await asyncio.wrap_future(process_pool().submit(func, *args))
+
+
+def _call_isolated(connection, func: Callable, args: tuple) -> None:
+    """Body of an isolated process: tells it started, then sends the outcome."""
+    connection.send(("started", None))
+    try:
+        outcome = ("result", func(*args))
+    except Exception as exc:
+        outcome = ("error", exc)
+    try:
+        connection.send(outcome)
+    except Exception as exc:
+        # The result or the exception could not be pickled
+        connection.send(("error", RuntimeError(str(exc))))
+    connection.close()
+
+
+async def run_isolated(func: Callable, *args, timeout: float):
+    """
+    Runs a picklable function in a process of its own, for untrusted code: the process
+    is killed if the function outlasts the timeout, without touching the shared pool or
+    the other calls.
+
+    Args:
+    func (Callable): A module level function or static method.
+    timeout (float): Seconds the function may run, counted once the process started.
+    Returns:
+    The result of the function.
+    Raises:
+    asyncio.TimeoutError: The function did not finish in time.
+    BrokenProcessPool: The process died without an answer.
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_call_isolated, args=(sender, func, args))
+    await asyncio.to_thread(process.start)
+    sender.close()
+    try:
+        # Starting a spawned process imports the modules of func, which is not timed
+        await asyncio.to_thread(receiver.recv)
+        if not await asyncio.to_thread(receiver.poll, timeout):
+            raise asyncio.TimeoutError
+        kind, value = await asyncio.to_thread(receiver.recv)
+    except EOFError as exc:
+        raise BrokenProcessPool("The isolated process died without an answer") from exc
+    finally:
+        if process.is_alive():
+            process.kill()
+        await asyncio.to_thread(process.join)
+        receiver.close()
+    if kind == "error":
+        raise value
+    return value
+
+
+def shutdown() -> None:
+    """Stops the process pool, the next call starts a new one."""
+    global _process_pool
+    pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
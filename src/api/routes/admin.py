@@ -1,19 +1,32 @@
 """User routes."""
 
-from typing import List
+import asyncio
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.inspection import inspect
+from api.controllers.job import job_query
 from api.controllers.rbac import require_permission
 from api.controllers.recovery import RecoveryController
+from api.controllers.scheduler import scheduler
 from api.controllers.user import UserController
 from api.db import Database
+from api.models.ingestion_job import IngestionJob
 from api.models.permission import Permission
 from api.models.recovery_code import RecoveryCode
 from api.models.role import Role
 from api.models.user import User
+from api.offload import run_in_process
+from api.schemas.actions import ReindexSchema
 from api.schemas.recovery import RecoveryRequestSchema
 from api.schemas.shared import ListSchema, GetSchemaSchema
 from api.schemas.user import CreateUserSchema, UpdateUserSchema
+from app.index_settings import IndexSettings
+from app.library_index import build_library
+from app.answer_cache import answer_cache
+from app.ollama_client import ollama
+from app.query_cache import query_cache
+from app.resource_pool import resource_pool
+from app.utils import Utils
 
 router = APIRouter(tags=["admin"])
 db = Database()
@@ -34,7 +47,7 @@ async def create_user(
 ):
     """Endpoint for admins to create users."""
     user_controller = UserController()
-    ln = user_controller.create(users)
+    ln = await asyncio.to_thread(user_controller.create, users)
     if ln is not None:
         return {"created_records": ln}
     raise HTTPException(status_code=500)
@@ -66,7 +79,7 @@ async def update_users(
 ):
     """Endpoint for admins to update users."""
     user_controller = UserController()
-    ln = user_controller.update(users)
+    ln = await asyncio.to_thread(user_controller.update, users)
     if ln is not None:
         return {"updated_records": ln}
     raise HTTPException(status_code=500)
@@ -82,6 +95,7 @@ async def get_schema(
         "role": Role,
         "user": User,
         "recovery_code": RecoveryCode,
+        "ingestion_job": IngestionJob,
     }
     if query.model_name not in schema_dict:
         raise HTTPException(status_code=404)
@@ -118,12 +132,75 @@ async def get_schema(
     return columns
 
 
+@router.post("/admin/reindex/{book_filename}")
+async def reindex_book(
+    book_filename: str,
+    settings: ReindexSchema,
+    priority: int = 0,
+    _=Depends(require_permission("manage_db")),
+):
+    """
+    Endpoint for admins to change the index settings of a book and queue the rebuild of
+    its nearest neighbour index from the stored vectors.
+    """
+    output_folder = Utils.strip_extension(book_filename)
+    output_path = Utils.get_output_path(output_folder)
+    with resource_pool.lease(output_folder):
+        if await asyncio.to_thread(Utils.get_embeddings_db, output_folder) is None:
+            raise HTTPException(status_code=404, detail="Embeddings not found")
+    try:
+        index_settings = IndexSettings.load(output_path).update(**settings.model_dump())
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    index_settings.save(output_path)
+    job = await asyncio.to_thread(
+        job_query, "enqueue", book_filename, action="reindex", priority=priority
+    )
+    scheduler.wake()
+    return job
+
+
+@router.post("/admin/library/build")
+async def build_library_index(
+    nlist: Optional[int] = None,
+    m: Optional[int] = None,
+    _=Depends(require_permission("manage_db")),
+):
+    """
+    Endpoint for admins to rebuild the library index searched by /library/search/ from
+    the stored vectors of every ingested book. Training runs in the process pool.
+    """
+    try:
+        entries = await run_in_process(build_library, nlist, m)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return {"entries": entries}
+
+
+@router.get("/admin/resources/")
+async def resource_stats(_=Depends(require_permission("manage_db"))):
+    """Endpoint for admins to see the hit rate and open handles of the resource pool."""
+    return resource_pool.stats()
+
+
+@router.get("/admin/ollama/")
+async def ollama_stats(_=Depends(require_permission("manage_db"))):
+    """Endpoint for admins to see the Ollama latency, tokens, retries and failures."""
+    return ollama.stats()
+
+
+@router.get("/admin/caches/")
+async def cache_stats(_=Depends(require_permission("manage_db"))):
+    """Endpoint for admins to see the hit rate of the question caches."""
+    return {"query_embeddings": query_cache.stats(), "answers": answer_cache.stats()}
+
+
 @router.post("/admin/recover/")
 async def recover_admin(data: RecoveryRequestSchema):
     """Endpoint to recover an admin password using a terminal code."""
     controller = RecoveryController()
-    ok, reason = controller.reset_password(
-        data.username, data.new_password, data.recovery_code
+    ok, reason = await asyncio.to_thread(
+        controller.reset_password, data.username, data.new_password, data.recovery_code
     )
     if ok:
         return {"message": "Password updated"}
@@ -1,19 +1,30 @@
 """Client routes"""
 
+import asyncio
+import json
 import re
 # import time
 import shutil
-import requests
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import aclosing
 from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File
 from fastapi.responses import StreamingResponse
 from api.controllers.auth import login_request, verify_token
+from api.controllers.job import job_query
 from api.controllers.rbac import require_permission
-from api.schemas.actions import AskSchema
+from api.controllers.scheduler import scheduler
+from api.models.ingestion_job import JOB_FINISHED
+from api.offload import run_isolated
+from api.schemas.actions import AskSchema, LibrarySearchSchema
 from api.schemas.auth import LoginRequestSchema
 from api.schemas.exam import ExamGenerateSchema, ExamEvaluateSchema, ExamEvaluateCodeSchema
+from app.answer_cache import answer_cache
 from app.assistant import Assistant
 from app.exam import ExamGenerator
 from app.generate_embeddings import EmbeddingsGenerator
+from app.library_index import shared_library
+from app.ollama_client import OllamaError, ollama
+from app.resource_pool import resource_pool
 from app.utils import Utils
 
 router = APIRouter(tags=["client"])
@@ -23,8 +34,7 @@ router = APIRouter(tags=["client"])
 async def status():
     """Endpoint to check server status."""
     try:
-        r = requests.get(Utils.OLLAMA_URL + "/tags", timeout=2)
-        models = [m["name"] for m in r.json()["models"]]
+        models = await ollama.models()
         if Utils.CHAT_MODEL in models and Utils.EMBEDDINGS_MODEL in models:
             return {"status": "ok"}
         raise HTTPException(
@@ -39,7 +49,7 @@ async def status():
 @router.post("/login/")
 async def login(login_data: LoginRequestSchema, response: Response):
     """Endpoint to log in and generate a token."""
-    token, token_data = login_request(login_data)
+    token, token_data = await asyncio.to_thread(login_request, login_data)
     response.set_cookie(
         key="token",
         value=token,
@@ -80,7 +90,12 @@ async def upload_book(
     try:
         book_filename = Utils.strip_extension(file.filename)
         with open(Utils.get_data_path() / (book_filename + ".pdf"), "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+        # Keyed like the readers, which strip the extension of the saved file name
+        # again.
+        output_folder = Utils.strip_extension(book_filename + ".pdf")
+        resource_pool.invalidate(output_folder)
+        answer_cache.invalidate(output_folder)
         return {"message": "File uploaded successfully"}
     except Exception as e:
         Utils.logger.critical(e)
@@ -90,6 +105,11 @@ async def upload_book(
 @router.get("/load_books/")
 async def load_books(_=Depends(require_permission("load_books"))):
     """Endpoint to see uploaded books."""
+    return await asyncio.to_thread(list_books)
+
+
+def list_books() -> list:
+    """Lists the uploaded books with their ingestion progress, opening their stores."""
     books_folder_path = Utils.get_data_path()
     pdf_files = []
     for file in books_folder_path.iterdir():
@@ -110,17 +130,84 @@ async def load_books(_=Depends(require_permission("load_books"))):
 async def generate_embeddings(
     book_filename: str,
     resume: bool = False,
+    incremental: bool = False,
+    fast: bool = False,
+    priority: int = 0,
     _=Depends(require_permission("generate_embeddings")),
 ):
-    """Endpoint to generate the embeddings database."""
+    """
+    Endpoint to generate the embeddings database, queues an ingestion job and streams
+    its progress. The job keeps running if the client disconnects.
+    """
     # book_filename = book_data.book_filename
     # output_folder = Utils.strip_extension(book_filename)
     # Utils.logger = setup_logging(output_folder)
-    embeddings_generator = EmbeddingsGenerator(book_filename)
-    return StreamingResponse(
-        embeddings_generator.generate_embeddings(stream=True, resume=resume),
-        media_type="text/event-stream",
+    if not (Utils.get_data_path() / book_filename).is_file():
+        raise HTTPException(status_code=404, detail="Book not found")
+    job = await asyncio.to_thread(
+        job_query,
+        "enqueue",
+        book_filename,
+        priority=priority,
+        resume=resume,
+        incremental=incremental,
+        fast=fast,
     )
+    scheduler.wake()
+    return StreamingResponse(tail_job(job["idx"]), media_type="text/event-stream")
+
+
+async def tail_job(idx: int):
+    """Yields the progress events of a job as server-sent events until it finishes."""
+    last_progress = None
+    while True:
+        job = await asyncio.to_thread(job_query, "get", idx)
+        if not job:
+            return
+        if job["progress"] and job["progress"] != last_progress:
+            last_progress = job["progress"]
+            yield f"data: {job['progress']}\n\n"
+        if job["status"] in JOB_FINISHED:
+            status = {"job": job["idx"], "status": job["status"], "error": job["error"]}
+            yield f"data: {json.dumps(status)}\n\n"
+            return
+        await asyncio.sleep(Utils.API_JOB_POLL_SECONDS)
+
+
+@router.get("/jobs/")
+async def list_jobs(
+    limit: int = 100,
+    offset: int = 0,
+    _=Depends(require_permission("generate_embeddings")),
+):
+    """Endpoint to see the ingestion jobs, newest first."""
+    return await asyncio.to_thread(job_query, "list", limit, offset)
+
+
+@router.get("/jobs/{idx}")
+async def get_job(idx: int, _=Depends(require_permission("generate_embeddings"))):
+    """Endpoint to see an ingestion job."""
+    job = await asyncio.to_thread(job_query, "get", idx)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{idx}/events")
+async def job_events(idx: int, _=Depends(require_permission("generate_embeddings"))):
+    """Endpoint to follow the progress of an ingestion job."""
+    if not await asyncio.to_thread(job_query, "get", idx):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(tail_job(idx), media_type="text/event-stream")
+
+
+@router.post("/jobs/{idx}/cancel")
+async def cancel_job(idx: int, _=Depends(require_permission("generate_embeddings"))):
+    """Endpoint to cancel a queued or running ingestion job."""
+    job = await asyncio.to_thread(job_query, "cancel", idx)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @router.get("/embeddings/{book_filename}")
@@ -132,13 +219,17 @@ async def list_embeddings(
 ):
     """Paginated embeddings list for a book."""
     output_folder = Utils.strip_extension(book_filename)
-    collection = Utils.get_embeddings_db(output_folder)
-    if not collection:
-        raise HTTPException(status_code=404, detail="Embeddings not found")
-    total = collection.count()
-    records = collection.get(
-        include=["documents", "metadatas"], limit=limit, offset=offset
-    )
+    with resource_pool.lease(output_folder):
+        collection = await asyncio.to_thread(Utils.get_embeddings_db, output_folder)
+        if not collection:
+            raise HTTPException(status_code=404, detail="Embeddings not found")
+        total = await asyncio.to_thread(collection.count)
+        records = await asyncio.to_thread(
+            collection.get,
+            include=["documents", "metadatas"],
+            limit=limit,
+            offset=offset,
+        )
     items = []
     for idx, doc in enumerate(records.get("documents", [])):
         meta = (records.get("metadatas") or [None])[idx] or {}
@@ -191,18 +282,106 @@ async def ask_question(query: AskSchema, _=Depends(require_permission("ask"))):
     #     ]
     # }
     output_folder = Utils.strip_extension(query.book_filename)
-    embeddings_collection = Utils.get_embeddings_db(output_folder)
-    if not embeddings_collection:
+    # The pooled handles of the book stay open until the answer is sent, even if the
+    # book is evicted or re-ingested meanwhile
+    with resource_pool.lease(output_folder):
+        embeddings_collection = await asyncio.to_thread(
+            Utils.get_embeddings_db, output_folder
+        )
+        if not embeddings_collection:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Embeddings for {query.book_filename} not generated."
+                    " Please run 'generate_embeddings' first."
+                ),
+            )
+        if query.stream:
+            return StreamingResponse(
+                stream_book_answer(query.book_filename, query.question),
+                media_type="text/event-stream",
+            )
+        assistant = await asyncio.to_thread(
+            Assistant, query.book_filename, embeddings_collection
+        )
+        data = await assistant.ask_async(query.question)
+        return data
+
+
+@router.post("/library/search/")
+async def search_library(
+    query: LibrarySearchSchema, _=Depends(require_permission("ask"))
+):
+    """Endpoint to find the chunks closest to a question across every ingested book."""
+    library = await asyncio.to_thread(shared_library)
+    if library is None:
         raise HTTPException(
-            status_code=400,
-            detail=(
-                f"Embeddings for {query.book_filename} not generated."
-                " Please run 'generate_embeddings' first."
-            ),
+            status_code=404,
+            detail="The library index is not built. "
+            "Please run the library build first.",
         )
-    assistant = Assistant(query.book_filename, embeddings_collection)
-    data = assistant.ask(query.question)
-    return data
+    embeddings = await Assistant.aembed_question(query.question)
+    if not embeddings:
+        raise HTTPException(
+            status_code=502, detail="The question could not be embedded"
+        )
+    found = await asyncio.to_thread(
+        library.query,
+        embeddings[:1],
+        n_results=query.n_results,
+        nprobe=query.nprobe,
+    )
+    return [
+        {
+            "book": book,
+            "id": record_id,
+            "distance": distance,
+            "document": document,
+            **(metadata or {}),
+        }
+        for book, record_id, distance, document, metadata in zip(
+            found["books"][0],
+            found["ids"][0],
+            found["distances"][0],
+            found["documents"][0],
+            found["metadatas"][0],
+        )
+    ]
+
+
+async def stream_answer(assistant: Assistant, question: str):
+    """
+    Yields the references and then the answer of a question as server-sent events. When
+    the client disconnects the response task is cancelled, closing the Ollama stream
+    with it.
+    """
+    try:
+        async with aclosing(assistant.ask_stream_async(question)) as events:
+            async for event in events:
+                yield f"data: {json.dumps(event)}\n\n"
+    except OllamaError as exc:
+        yield f"data: {json.dumps({'error': str(exc)})}\n\n"
+
+
+async def stream_book_answer(book_filename: str, question: str):
+    """
+    Same as stream_answer for a book, leasing its handles while the answer streams. The
+    lease is taken by the stream itself, a response that is never sent holds none.
+    """
+    output_folder = Utils.strip_extension(book_filename)
+    with resource_pool.lease(output_folder):
+        embeddings_collection = await asyncio.to_thread(
+            Utils.get_embeddings_db, output_folder
+        )
+        if not embeddings_collection:
+            yield f"data: {json.dumps({'error': 'Embeddings not found'})}\n\n"
+            return
+        assistant = await asyncio.to_thread(
+            Assistant, book_filename, embeddings_collection
+        )
+        async with aclosing(stream_answer(assistant, question)) as events:
+            async for event in events:
+                yield event
 
 
 @router.get("/exam/options/{book_filename}")
@@ -212,7 +391,7 @@ async def exam_options(
 ):
     """Return available chapters/topics for exam generation."""
     generator = ExamGenerator(book_filename)
-    options = generator.get_options()
+    options = await asyncio.to_thread(generator.get_options)
     return {"book_filename": book_filename, **options}
 
 
@@ -225,7 +404,7 @@ async def exam_topic_search(
 ):
     """Search topics by substring for a given book."""
     generator = ExamGenerator(book_filename)
-    results = generator.search_topics(query=query, limit=limit)
+    results = await asyncio.to_thread(generator.search_topics, query=query, limit=limit)
     return {"book_filename": book_filename, "topics": results}
 
 
@@ -237,7 +416,8 @@ async def generate_exam(
     """Generate an ephemeral exam based on chapters or topics."""
     generator = ExamGenerator(payload.book_filename)
     try:
-        exam = generator.generate_exam(
+        exam = await asyncio.to_thread(
+            generator.generate_exam,
             mode=payload.mode,
             difficulty=payload.difficulty,
             chapter_numbers=payload.chapter_numbers,
@@ -256,7 +436,8 @@ async def evaluate_exam_answer(
     _=Depends(require_permission("exam")),
 ):
     """Evaluate an open-text exam answer."""
-    result = ExamGenerator.evaluate_open_text(
+    result = await asyncio.to_thread(
+        ExamGenerator.evaluate_open_text,
         question=payload.question,
         expected_answer=payload.expected_answer,
         user_answer=payload.user_answer,
@@ -270,12 +451,27 @@ async def evaluate_exam_code(
     payload: ExamEvaluateCodeSchema,
     _=Depends(require_permission("exam")),
 ):
-    """Evaluate a code-fill exam answer."""
-    result = ExamGenerator.evaluate_code(
-        code=payload.code,
-        function_name=payload.function_name,
-        tests=payload.tests,
-    )
+    """
+    Evaluate a code-fill exam answer, in a process of its own so it cannot stall the
+    server or the other evaluations.
+    """
+    try:
+        result = await run_isolated(
+            ExamGenerator.evaluate_code,
+            payload.code,
+            payload.function_name,
+            payload.tests,
+            timeout=Utils.API_CODE_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        return {
+            "status": "error",
+            "feedback": (
+                f"Code did not finish in {Utils.API_CODE_TIMEOUT_SECONDS} seconds."
+            ),
+        }
+    except BrokenProcessPool:
+        return {"status": "error", "feedback": "Code crashed the evaluation process."}
     return result
 
 
@@ -1,5 +1,6 @@
 """Pydantic basemodel for a question."""
 
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -8,9 +9,28 @@ class AskSchema(BaseModel):
 
     question: str
     book_filename: str
+    stream: bool = False
+
+
+class LibrarySearchSchema(BaseModel):
+    """Pydantic basemodel for a question searched across every book."""
+
+    question: str
+    n_results: int = 10
+    nprobe: Optional[int] = None
 
 
 class GenerateEmbeddingsSchema(BaseModel):
     """Pydantic basemodel for a question."""
 
     book_filename: str
+
+
+class ReindexSchema(BaseModel):
+    """Pydantic basemodel for the settings of a reindex, None keeps the saved value."""
+
+    space: Optional[str] = None
+    m: Optional[int] = None
+    ef_construction: Optional[int] = None
+    ef_search: Optional[int] = None
+    quantization: Optional[str] = None
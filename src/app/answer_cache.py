@@ -0,0 +1,207 @@
+"""Semantic cache of the answers of the assistant."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+from .utils import Utils
+
+
+class AnswerCache:
+    """
+    SQLite cache of the answers given per book, looked up by the embedding of the
+    question: a new question whose cosine similarity with an answered one reaches the
+    threshold gets the stored answer and references without calling the chat model.
+    Entries are scoped by the chat and embeddings models, expire after ttl_seconds and
+    past max_entries per book the least recently used ones are evicted. Re-ingesting a
+    book invalidates its entries. The file is shared by every API worker and only
+    created by the first stored answer.
+    """
+
+    def __init__(
+        self,
+        path: Union[None, str, Path] = None,
+        max_entries: Optional[int] = None,
+        threshold: Optional[float] = None,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.path = (
+            Path(path)
+            if path
+            else Utils.get_embeddings_cache_path(Utils.ANSWER_CACHE_FILENAME)
+        )
+        self.max_entries = (
+            max_entries if max_entries is not None else Utils.ANSWER_CACHE_SIZE
+        )
+        self.threshold = (
+            threshold if threshold is not None else Utils.ANSWER_CACHE_THRESHOLD
+        )
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None else Utils.ANSWER_CACHE_TTL_SECONDS
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def model() -> str:
+        """Returns the scope of the entries, answers depend on both models."""
+        return f"{Utils.CHAT_MODEL}\0{Utils.EMBEDDINGS_MODEL}"
+
+    def _connect(self, create: bool = False) -> Optional[sqlite3.Connection]:
+        if self._connection is None:
+            if not create and not self.path.exists():
+                return None
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY, book TEXT NOT NULL, model TEXT NOT NULL, "
+                "question TEXT NOT NULL, vector BLOB NOT NULL, answer TEXT NOT NULL, "
+                "refs TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS answers_book ON answers(book, model)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def get(self, book: str, embedding: List[float]) -> Optional[dict]:
+        """
+        Looks up the answer of the most similar question asked about a book.
+
+        Args:
+        book (str): The output folder of the book.
+        embedding (List[float]): The embedding of the new question.
+        Returns:
+        Optional[dict]: The cached answer and references, None if no question is close
+            enough.
+        """
+        if self.max_entries <= 0 or not embedding:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            connection = self._connect()
+            rows = []
+            if connection is not None:
+                rows = connection.execute(
+                    "SELECT id, vector FROM answers "
+                    "WHERE book = ? AND model = ? AND created >= ?",
+                    (book, self.model(), time.time() - self.ttl_seconds),
+                ).fetchall()
+            rows = [row for row in rows if len(row[1]) == query.nbytes]
+            if not rows:
+                self.misses += 1
+                return None
+            vectors = np.frombuffer(b"".join(row[1] for row in rows), np.float32)
+            vectors = vectors.reshape(len(rows), -1)
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            similarities = vectors @ query / np.maximum(norms, 1e-12)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = rows[best][0]
+            connection.execute(
+                "UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id)
+            )
+            connection.commit()
+            answer, refs = connection.execute(
+                "SELECT answer, refs FROM answers WHERE id = ?", (entry_id,)
+            ).fetchone()
+            self.hits += 1
+        return {"answer": answer, "references": json.loads(refs)}
+
+    def put(
+        self,
+        book: str,
+        question: str,
+        embedding: List[float],
+        answer: str,
+        references: List[dict],
+    ) -> None:
+        """Stores the answer to a question about a book, evicting past max_entries."""
+        if self.max_entries <= 0 or not embedding or not answer:
+            return
+        now = time.time()
+        vector = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            connection = self._connect(create=True)
+            connection.execute(
+                "INSERT INTO answers "
+                "(book, model, question, vector, answer, refs, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    book,
+                    self.model(),
+                    question,
+                    vector,
+                    answer,
+                    json.dumps(references),
+                    now,
+                    now,
+                ),
+            )
+            self._evict(connection, book, now)
+            connection.commit()
+
+    def _evict(self, connection: sqlite3.Connection, book: str, now: float) -> None:
+        """Deletes the expired entries and the least recently used ones of the book."""
+        expired = connection.execute(
+            "DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        excess = connection.execute(
+            "DELETE FROM answers WHERE id IN (SELECT id FROM answers "
+            "WHERE book = ? AND model = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (book, self.model(), self.max_entries),
+        ).rowcount
+        self.evictions += expired + excess
+
+    def invalidate(self, book: str) -> None:
+        """Drops the answers of a book, for when it is ingested or uploaded again."""
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return
+            connection.execute("DELETE FROM answers WHERE book = ?", (book,))
+            connection.commit()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Returns the hit/miss/eviction counters and the number of answers stored."""
+        with self._lock:
+            connection = self._connect()
+            entries = 0
+            if connection is not None:
+                (entries,) = connection.execute(
+                    "SELECT COUNT(*) FROM answers"
+                ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": entries,
+            }
+
+    def close(self) -> None:
+        """Closes the underlying sqlite connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+answer_cache = AnswerCache()
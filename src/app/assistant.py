@@ -1,9 +1,13 @@
 """Module for the LLM assistant."""
 
-from typing import List, Union
-import requests
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Iterator, List, Tuple, Union
 from chromadb.api.models.Collection import Collection
-import pymupdf
+from .answer_cache import answer_cache
+from .ollama_client import ollama
+from .query_cache import query_cache
+from .resource_pool import resource_pool
 from .utils import Utils
 
 
@@ -14,18 +18,48 @@ class Assistant:
         self, book_filename: str, embeddings_collection: Union[None, Collection]
     ):
         self.book_filename = book_filename
+        self.output_folder = Utils.strip_extension(book_filename)
         self.embeddings_collection = embeddings_collection
-        self.book = pymupdf.open(f"{Utils.get_data_path()}/{self.book_filename}")
-
-    def get_rag_documents(self, question: str) -> List[str]:
-        """Retrieve related document references from the vectordb and pull related pages from the book."""
-        response = requests.post(
-            Utils.OLLAMA_URL + "/embed",
-            json={"model": Utils.EMBEDDINGS_MODEL, "input": question},
-            timeout=180,
-        )
+        self.pages = resource_pool.pages(book_filename)
+
+    def get_rag_documents(self, question: str) -> Tuple[str, List[dict]]:
+        """
+        Retrieve related document references from the vectordb and pull related pages
+        from the book.
+
+        Args:
+        question (str): The question asked about the book.
+        Returns:
+        Tuple[str, List[dict]]: The text of the related pages and their references.
+        """
+        return self.retrieve(self.embed_question(question))
+
+    @staticmethod
+    def embed_question(question: str) -> List[list]:
+        """Embeds a question, reusing the vector of the same question asked before."""
+        embedding = query_cache.get(question)
+        if embedding is not None:
+            return [embedding]
+        embeddings = ollama.embed(question)
+        if embeddings:
+            query_cache.put(question, embeddings[0])
+        return embeddings
+
+    @staticmethod
+    async def aembed_question(question: str) -> List[list]:
+        """Same as embed_question, without blocking the event loop."""
+        embedding = await asyncio.to_thread(query_cache.get, question)
+        if embedding is not None:
+            return [embedding]
+        embeddings = await ollama.aembed(question)
+        if embeddings:
+            await asyncio.to_thread(query_cache.put, question, embeddings[0])
+        return embeddings
+
+    def retrieve(self, query_embeddings) -> Tuple[str, List[dict]]:
+        """Query the vectordb with the embedded question and pull the related pages."""
         results = self.embeddings_collection.query(
-            query_embeddings=response.json().get("embeddings", ""),
+            query_embeddings=query_embeddings,
             n_results=Utils.N_DOCUMENTS,
         )
         rag_documents = ""
@@ -39,43 +73,181 @@ class Assistant:
                 continue
             surrounding_pages = [page - 1, page, page + 1]
             for surrounding_page in surrounding_pages:
-                if surrounding_page not in pages:
+                if surrounding_page not in pages and 0 <= surrounding_page < len(
+                    self.pages
+                ):
                     pages.add(surrounding_page)
                     title = metadata.get("title", "")
+                    page_text = self.pages.page_text(surrounding_page)
                     rag_documents += (
-                        f"\n{title}, page {surrounding_page}: "
-                        f"\n{self.book.load_page(surrounding_page).get_text()}\n"
+                        f"\n{title}, page {surrounding_page}: " f"\n{page_text}\n"
                     )
             references.append(
                 {"section": metadata["title"], "pages": surrounding_pages}
             )
         return rag_documents, references
 
-    def ask(self, question: str) -> dict:
-        """Ask the LLM model a question, the function calls the embeedings db for context."""
-        rag_documents, references = self.get_rag_documents(question)
-        response = requests.post(
-            Utils.OLLAMA_URL + "/generate",
-            json={
-                "model": Utils.CHAT_MODEL,
-                "options": {
-                    "num_predict": 2048,  # Number of max tokens in the output
-                    "num_ctx": 8196,  # Input + output context length
-                },
-                "stream": False,
-                "prompt": (
-                    f"The user will make a question about the book {self.book.metadata.get('title', '')}"
-                    f"from the authors: {self.book.metadata.get('author', '')}"
-                    "The RAG system indentified a related page from the book."
-                    f"These are previou, actual page and next page from the book to provide context: {rag_documents}."
-                    f"Based on those pages respond to this user question: {question}"
-                ),
+    def generate_payload(self, question: str, rag_documents: str) -> dict:
+        """Returns the /generate request answering the question from the given pages."""
+        return {
+            "model": Utils.CHAT_MODEL,
+            "options": {
+                "num_predict": 2048,  # Number of max tokens in the output
+                "num_ctx": 8196,  # Input + output context length
             },
-            timeout=300,
+            "stream": False,
+            "prompt": (
+                f"The user will make a question about the book {self.pages.metadata.get('title', '')}"
+                f"from the authors: {self.pages.metadata.get('author', '')}"
+                "The RAG system indentified a related page from the book."
+                f"These are previou, actual page and next page from the book to provide context: {rag_documents}."
+                f"Based on those pages respond to this user question: {question}"
+            ),
+        }
+
+    @staticmethod
+    def _vector(embeddings: List[list]) -> List[float]:
+        return embeddings[0] if embeddings else []
+
+    @staticmethod
+    def _cached_events(cached: dict) -> List[dict]:
+        return [
+            {"references": cached["references"]},
+            {"token": cached["answer"]},
+            {"done": True},
+        ]
+
+    def ask(self, question: str) -> dict:
+        """
+        Ask the LLM model a question, the function calls the embeedings db for context.
+        The answer to a close enough question asked before is returned from the answer
+        cache.
+        """
+        embeddings = self.embed_question(question)
+        cached = answer_cache.get(self.output_folder, self._vector(embeddings))
+        if cached:
+            return cached
+        rag_documents, references = self.retrieve(embeddings)
+        response = ollama.post(
+            "/generate", self.generate_payload(question, rag_documents), task="answer"
         )
+        if "response" in response:
+            answer_cache.put(
+                self.output_folder,
+                question,
+                self._vector(embeddings),
+                response["response"],
+                references,
+            )
         return {
-            "answer": response.json().get(
-                "response", "Error retrieving the LLM response"
-            ),
+            "answer": response.get("response", "Error retrieving the LLM response"),
+            "references": references,
+        }
+
+    def ask_stream(self, question: str) -> Iterator[dict]:
+        """
+        Same as ask, streaming the answer: yields the references as soon as retrieval is
+        done, then one {"token": ...} per piece of the answer Ollama generates and
+        {"done": True} at the end, or {"error": ...} if Ollama rejects the request.
+        """
+        embeddings = self.embed_question(question)
+        cached = answer_cache.get(self.output_folder, self._vector(embeddings))
+        if cached:
+            yield from self._cached_events(cached)
+            return
+        rag_documents, references = self.retrieve(embeddings)
+        yield {"references": references}
+        tokens = []
+        for chunk in ollama.stream(
+            "/generate", self.generate_payload(question, rag_documents), task="answer"
+        ):
+            event = self._answer_event(chunk)
+            if not event:
+                continue
+            if "token" in event:
+                tokens.append(event["token"])
+            if "done" in event:
+                answer_cache.put(
+                    self.output_folder,
+                    question,
+                    self._vector(embeddings),
+                    "".join(tokens),
+                    references,
+                )
+            yield event
+
+    @staticmethod
+    def _answer_event(chunk: dict) -> Union[None, dict]:
+        if chunk.get("error"):
+            return {"error": chunk["error"]}
+        if chunk.get("done"):
+            return {"done": True}
+        if chunk.get("response"):
+            return {"token": chunk["response"]}
+        return None
+
+    async def ask_stream_async(self, question: str) -> AsyncIterator[dict]:
+        """
+        Same as ask_stream without blocking the event loop. Closing the generator closes
+        the Ollama connection, which stops the generation.
+        """
+        embeddings = await self.aembed_question(question)
+        cached = await asyncio.to_thread(
+            answer_cache.get, self.output_folder, self._vector(embeddings)
+        )
+        if cached:
+            for event in self._cached_events(cached):
+                yield event
+            return
+        rag_documents, references = await asyncio.to_thread(self.retrieve, embeddings)
+        yield {"references": references}
+        tokens = []
+        chunks = ollama.astream(
+            "/generate", self.generate_payload(question, rag_documents), task="answer"
+        )
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                event = self._answer_event(chunk)
+                if not event:
+                    continue
+                if "token" in event:
+                    tokens.append(event["token"])
+                if "done" in event:
+                    await asyncio.to_thread(
+                        answer_cache.put,
+                        self.output_folder,
+                        question,
+                        self._vector(embeddings),
+                        "".join(tokens),
+                        references,
+                    )
+                yield event
+
+    async def ask_async(self, question: str) -> dict:
+        """
+        Same as ask for the API, without blocking the event loop: Ollama is called
+        through the pooled async client and the vectordb query runs in a worker thread.
+        """
+        embeddings = await self.aembed_question(question)
+        cached = await asyncio.to_thread(
+            answer_cache.get, self.output_folder, self._vector(embeddings)
+        )
+        if cached:
+            return cached
+        rag_documents, references = await asyncio.to_thread(self.retrieve, embeddings)
+        response = await ollama.apost(
+            "/generate", self.generate_payload(question, rag_documents), task="answer"
+        )
+        if "response" in response:
+            await asyncio.to_thread(
+                answer_cache.put,
+                self.output_folder,
+                question,
+                self._vector(embeddings),
+                response["response"],
+                references,
+            )
+        return {
+            "answer": response.get("response", "Error retrieving the LLM response"),
             "references": references,
         }
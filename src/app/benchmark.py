@@ -0,0 +1,190 @@
+"""
+Benchmark of the vector store backends on build time, query latency, recall, memory and
+disk. A backend can be suffixed with a quantization, e.g. flat:int8, to measure its
+recall loss.
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.index_settings import IndexSettings
+from app.utils import Utils
+from app.vector_store import BACKENDS, create_store, open_store
+
+CONFIGURATIONS = ("chroma", "flat", "flat:float16", "flat:int8", "hnsw")
+
+
+def _rss_mb() -> float:
+    """Returns the resident memory in MB, the peak where /proc is missing."""
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        resident_pages = int(statm.read_text(encoding="utf-8").split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    """
+    Unit length random vectors grouped around count / 50 centers, closer to text
+    embeddings than plain noise. Unit length keeps the ranking the same under L2 and
+    cosine distance.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 50), dim))
+    vectors = centers[rng.integers(0, len(centers), count)]
+    vectors = vectors + rng.normal(scale=0.3, size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """
+    Unit length queries near random stored vectors, the way a question lands near the
+    chunks that answer it. Queries drawn away from the data make every neighbour a near
+    tie.
+    """
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), count)]
+    queries = queries + rng.normal(
+        scale=0.3 / np.sqrt(vectors.shape[1]), size=queries.shape
+    )
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    """Returns the exact top k rows by cosine similarity for every query."""
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (queries / np.linalg.norm(queries, axis=1, keepdims=True)).T
+    return [set(np.argsort(-scores[:, column])[:k]) for column in range(len(queries))]
+
+
+def run_backend(
+    backend: str,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    truth: List[set],
+    batch_size: int = 512,
+) -> Dict[str, float]:
+    """
+    Builds a store of the backend in a temporary folder and measures it.
+
+    Args:
+    backend (str): The vector store backend, optionally followed by :quantization.
+    vectors (np.ndarray): The vectors to store.
+    queries (np.ndarray): The query vectors, searched one at a time.
+    k (int): The number of neighbours per query.
+    truth (List[set]): The exact neighbours of every query.
+    batch_size (int): The number of vectors per upsert call.
+    Returns:
+    Dict[str, float]: build_s, query_ms (median), p95_ms, recall@k, disk_mb, and rss_mb,
+        the memory taken by opening the built store and querying it.
+    """
+    backend, _, quantization = backend.partition(":")
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder)
+        IndexSettings.defaults().update(quantization=quantization or "none").save(path)
+        started = time.perf_counter()
+        store = create_store(path, backend=backend)
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start : start + batch_size]
+            store.upsert(
+                ids=[str(row) for row in range(start, start + len(batch))],
+                embeddings=batch.tolist(),
+                metadatas=[{"page": row} for row in range(start, start + len(batch))],
+            )
+        if hasattr(store, "compact"):
+            store.compact()
+        build_s = time.perf_counter() - started
+        del store
+        gc.collect()
+        baseline = _rss_mb()
+        store = open_store(path, backend=backend)
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            results = store.query(
+                query_embeddings=[query.tolist()], n_results=k, include=[]
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len(expected & {int(row) for row in results["ids"][0]})
+        return {
+            "build_s": round(build_s, 3),
+            "query_ms": round(float(np.median(latencies)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            f"recall@{k}": round(hits / (k * len(queries)), 4),
+            "rss_mb": round(_rss_mb() - baseline, 1),
+            "disk_mb": round(
+                sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+                / (1024 * 1024),
+                1,
+            ),
+        }
+
+
+def benchmark(
+    count: int = 20000,
+    dim: int = 768,
+    queries: int = 200,
+    k: Optional[int] = None,
+    backends: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Runs every backend in its own process so their memory figures do not mix. Recall is
+    measured at N_DOCUMENTS, the number of chunks the assistant retrieves, unless k is
+    given.
+    """
+    k = k or Utils.N_DOCUMENTS
+    vectors = make_vectors(count, dim)
+    query_vectors = make_queries(vectors, queries)
+    truth = exact_neighbours(vectors, query_vectors, k)
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for backend in backends or list(CONFIGURATIONS):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[backend] = executor.submit(
+                run_backend, backend, vectors, query_vectors, k, truth
+            ).result()
+        Utils.logger.info("%s: %s", backend, results[backend])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector store benchmark")
+    parser.add_argument("--count", type=int, default=20000, help="Stored vectors.")
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimension.")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries.")
+    parser.add_argument(
+        "--k", type=int, help="Neighbours per query, defaults to N_DOCUMENTS."
+    )
+    parser.add_argument(
+        "--backends",
+        help=(
+            f"Dash-separated backends out of {', '.join(BACKENDS)}, each optionally "
+            f"suffixed with :float16 or :int8. Defaults to {', '.join(CONFIGURATIONS)}."
+        ),
+        required=False,
+    )
+    args = parser.parse_args()
+    report = benchmark(
+        args.count,
+        args.dim,
+        args.queries,
+        args.k,
+        args.backends.split("-") if args.backends else None,
+    )
+    print(json.dumps(report, indent=2))
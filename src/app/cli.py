@@ -3,9 +3,12 @@
 import argparse
 from pathlib import Path
 import sys
+from typing import Optional
 from dotenv import load_dotenv
 from app.assistant import Assistant
 from app.generate_embeddings import EmbeddingsGenerator
+from app.index_settings import IndexSettings
+from app.ollama_client import OllamaError
 from app.utils import Utils
 from app.logging import setup_logging
 
@@ -13,8 +16,9 @@ from app.logging import setup_logging
 class AppCLI:
     """Entry point for the application."""
 
-    def __init__(self, book_filename: str = ""):
+    def __init__(self, book_filename: str = "", index_settings: Optional[dict] = None):
         self.book_filename = book_filename
+        self.index_settings = index_settings or {}
         self.output_folder = Utils.strip_extension(book_filename)
         Utils.logger = setup_logging(self.output_folder)
         self.embeddings_collection = Utils.get_embeddings_db(self.output_folder)
@@ -36,6 +40,63 @@ class AppCLI:
             Utils.logger.critical("Embeddings generation failed, see logs for details.")
             sys.exit(1)
 
+    def updatedb(self) -> None:
+        """
+        Wrapper for re-embedding only the pages that changed since the last generatedb
+        """
+        Utils.logger.info("Updating embeddings database...")
+        embeddings_generator = EmbeddingsGenerator(self.book_filename)
+        embeddings = embeddings_generator.generate_embeddings(incremental=True)
+        if embeddings:
+            self.embeddings_collection = embeddings
+        else:
+            Utils.logger.critical("Embeddings update failed, see logs for details.")
+            sys.exit(1)
+
+    def fastdb(self) -> None:
+        """
+        Wrapper for generating a searchable database from the raw chunks, enriching it
+        after
+        """
+        Utils.logger.info("Generating raw embeddings database...")
+        embeddings_generator = EmbeddingsGenerator(self.book_filename)
+        embeddings = embeddings_generator.generate_embeddings(fast=True)
+        if not embeddings:
+            Utils.logger.critical("Embeddings generation failed, see logs for details.")
+            sys.exit(1)
+        self.embeddings_collection = embeddings
+        self.enrichdb()
+
+    def enrichdb(self) -> None:
+        """
+        Wrapper for summarizing the chunks stored by fastdb that are not enriched yet
+        """
+        Utils.logger.info("Enriching embeddings database...")
+        embeddings_generator = EmbeddingsGenerator(self.book_filename)
+        embeddings = embeddings_generator.enrich_embeddings()
+        if embeddings:
+            self.embeddings_collection = embeddings
+        else:
+            Utils.logger.critical("Embeddings enrichment failed, see logs for details.")
+            sys.exit(1)
+
+    def reindex(self) -> None:
+        """
+        Wrapper for rebuilding the nearest neighbour index from the stored vectors, with
+        the index settings given on the command line over the ones saved for the book
+        """
+        Utils.logger.info("Reindexing embeddings database...")
+        settings = IndexSettings.load(Utils.get_output_path(self.output_folder)).update(
+            **self.index_settings
+        )
+        embeddings_generator = EmbeddingsGenerator(self.book_filename)
+        embeddings = embeddings_generator.reindex_embeddings(settings)
+        if embeddings:
+            self.embeddings_collection = embeddings
+        else:
+            Utils.logger.critical("Reindexing failed, see logs for details.")
+            sys.exit(1)
+
     def ask(self) -> str:
         """
         Wrapper for calling the chat module
@@ -49,10 +110,21 @@ class AppCLI:
                 if user_input == "exit":
                     Utils.logger.info("Finalizing session...")
                     break
-                data = assistant.ask(user_input)
-                print(data.get("answer", ""))
-                print("References: ")
-                print("\n".join(list(data.get("references", ""))))
+                try:
+                    for event in assistant.ask_stream(user_input):
+                        if "references" in event:
+                            print("References: ")
+                            for reference in event["references"]:
+                                print("{section}, pages {pages}".format(**reference))
+                        elif "token" in event:
+                            print(event["token"], end="", flush=True)
+                        elif "error" in event:
+                            print(
+                                f"Error retrieving the LLM response: {event['error']}"
+                            )
+                except OllamaError as exc:
+                    print(f"Error retrieving the LLM response: {exc}")
+                print()
         else:
             Utils.logger.critical(
                 "Embeddings database has not been generated or cannot be found, run generatedb first"
@@ -67,7 +139,15 @@ class AppCLI:
 
 if __name__ == "__main__":
     load_dotenv(dotenv_path=Path(__file__).resolve().parents[2] / ".env")
-    valid_actions = ["generatedb", "ask", "all"]
+    valid_actions = [
+        "generatedb",
+        "updatedb",
+        "fastdb",
+        "enrichdb",
+        "reindex",
+        "ask",
+        "all",
+    ]
     parser = argparse.ArgumentParser(description="AI app")
     parser.add_argument(
         "--book",
@@ -85,9 +165,41 @@ if __name__ == "__main__":
         ),
         required=False,
     )
+    parser.add_argument(
+        "--space", help="reindex: distance space, cosine, ip or l2.", required=False
+    )
+    parser.add_argument("--m", type=int, help="reindex: HNSW graph degree.")
+    parser.add_argument(
+        "--ef-construction", type=int, help="reindex: HNSW build candidate list size."
+    )
+    parser.add_argument(
+        "--ef-search", type=int, help="reindex: HNSW search candidate list size."
+    )
+    parser.add_argument(
+        "--quantization",
+        help="reindex: flat vector quantization, none, float16 or int8.",
+        required=False,
+    )
     args = parser.parse_args()
-    cli = AppCLI(args.book)
-    switch = {"generatedb": cli.generatedb, "ask": cli.ask, "all": cli.all}
+    cli = AppCLI(
+        args.book,
+        {
+            "space": args.space,
+            "m": args.m,
+            "ef_construction": args.ef_construction,
+            "ef_search": args.ef_search,
+            "quantization": args.quantization,
+        },
+    )
+    switch = {
+        "generatedb": cli.generatedb,
+        "updatedb": cli.updatedb,
+        "fastdb": cli.fastdb,
+        "enrichdb": cli.enrichdb,
+        "reindex": cli.reindex,
+        "ask": cli.ask,
+        "all": cli.all,
+    }
     if args.actions == "all" or not args.actions:
         cli.all()
     else:
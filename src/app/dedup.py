@@ -0,0 +1,134 @@
+"""Near-duplicate detection for parsed chunks."""
+
+from __future__ import annotations
+
+import hashlib
+import random
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from .utils import Utils
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+class ChunkDeduplicator:
+    """
+    Finds chunks whose text was already seen during an ingestion, so repeated
+    boilerplate (copyright lines, running headers, sidebars) is embedded once. Exact
+    mode compares a hash of the normalized text, near mode also compares MinHash
+    signatures of word shingles, bucketed with LSH bands so each chunk is only compared
+    with a few candidates.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        threshold: Optional[float] = None,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+    ):
+        self.mode = (mode if mode is not None else Utils.DEDUP_MODE).lower()
+        self.threshold = threshold if threshold is not None else Utils.DEDUP_THRESHOLD
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = random.Random(num_perm)  # nosec B311
+        self._a = np.array(
+            [rng.randrange(1, _MERSENNE_PRIME) for _ in range(num_perm)],
+            dtype=np.uint64,
+        )
+        self._b = np.array(
+            [rng.randrange(0, _MERSENNE_PRIME) for _ in range(num_perm)],
+            dtype=np.uint64,
+        )
+        self._exact: Dict[str, str] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[tuple, List[str]] = defaultdict(list)
+        self.covered_pages: Dict[str, Set[int]] = defaultdict(set)
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("exact", "near")
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercases the text and collapses whitespace and punctuation runs."""
+        return re.sub(r"[\W_]+", " ", text.lower()).strip()
+
+    def find_duplicate(self, chunk_id: str, text: str, page: int) -> Optional[str]:
+        """
+        Checks a chunk against the chunks seen so far. New chunks are registered,
+        duplicates add their page to the pages covered by the first chunk with that
+        text.
+
+        Args:
+        chunk_id (str): The id of the chunk.
+        text (str): The chunk text.
+        page (int): The page the chunk was parsed from.
+        Returns:
+        Optional[str]: The id of the chunk it duplicates, None if the chunk is new.
+        """
+        normalized = self.normalize(text)
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        original = self._exact.get(digest)
+        signature = None
+        if original is None and self.mode == "near":
+            signature = self.signature(normalized)
+            original = self._find_similar(signature)
+        if original is not None:
+            self.covered_pages[original].add(page)
+            self.skipped += 1
+            return original
+        self._exact[digest] = chunk_id
+        if signature is not None:
+            self._signatures[chunk_id] = signature
+            for band in self._band_keys(signature):
+                self._buckets[band].append(chunk_id)
+        return None
+
+    def signature(self, normalized: str) -> np.ndarray:
+        """Computes the MinHash signature of the word shingles of a normalized text."""
+        words = normalized.split()
+        size = min(self.shingle_size, max(1, len(words)))
+        shingles = {
+            " ".join(words[start : start + size])
+            for start in range(max(1, len(words) - size + 1))
+        }
+        hashes = np.array(
+            [
+                int.from_bytes(
+                    hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(),
+                    "little",
+                )
+                & _MERSENNE_PRIME
+                for shingle in shingles
+            ],
+            dtype=np.uint64,
+        )
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        rows = self.num_perm // self.bands
+        return [
+            (band, signature[band * rows : (band + 1) * rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def _find_similar(self, signature: np.ndarray) -> Optional[str]:
+        checked = set()
+        for band in self._band_keys(signature):
+            for candidate in self._buckets.get(band, []):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold:
+                    return candidate
+        return None
@@ -0,0 +1,179 @@
+"""Persistent content-addressed cache for embeddings."""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import List, Optional, Union
+
+from .utils import Utils
+
+
+class EmbeddingsCache:
+    """
+    SQLite cache of embedding vectors keyed by a hash of the embeddings model and the
+    embedded text, shared by every book so rebuilds only pay for text not seen before.
+    Rows are evicted least recently used first once the cache grows past max_bytes. The
+    size of the rows is tracked as they are written, the table is only summed again when
+    that running total says the cache is full.
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        path: Union[None, str, Path] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.model = model if model is not None else Utils.EMBEDDINGS_MODEL
+        self.path = Path(path) if path else Utils.get_embeddings_cache_path()
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else Utils.EMBEDDINGS_CACHE_MAX_MB * 1024 * 1024
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+        )
+        self._connection.commit()
+        self._size = self._total_size()
+
+    def key(self, text: str) -> str:
+        """Returns the cache key for a text embedded with the cache model."""
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Looks up the embeddings of several texts, refreshing the recency of the hits.
+
+        Args:
+        texts (List[str]): The texts whose embeddings are required.
+        Returns:
+        List[Optional[List[float]]]: The cached vectors, None for the texts not in the
+            cache.
+        """
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            rows = {}
+            for key in keys:
+                row = self._connection.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    rows[key] = row[0]
+            if rows:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in rows],
+                )
+                self._connection.commit()
+            self.hits += sum(1 for key in keys if key in rows)
+            self.misses += sum(1 for key in keys if key not in rows)
+        return [array("f", rows[key]).tolist() if key in rows else None for key in keys]
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        """Stores the embeddings of several texts, skipping empty vectors."""
+        now = time.time()
+        records = {}
+        for text, embedding in zip(texts, embeddings):
+            if not embedding:
+                continue
+            vector = array("f", embedding).tobytes()
+            key = self.key(text)
+            records[key] = (key, vector, len(vector), now)
+        if not records:
+            return
+        with self._lock:
+            keys = list(records)
+            replaced = 0
+            for start in range(0, len(keys), 900):
+                batch = keys[start : start + 900]
+                replaced += self._connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchone()[0]
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                records.values(),
+            )
+            self._size += sum(record[2] for record in records.values()) - replaced
+            self._evict()
+            self._connection.commit()
+
+    def _total_size(self) -> int:
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def _evict(self) -> None:
+        """Deletes the least recently used rows until the cache fits in max_bytes."""
+        if self._size <= self.max_bytes:
+            return
+        # Other processes may write to the file too, recount before evicting
+        self._size = self._total_size()
+        excess = self._size - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM embeddings ORDER BY last_used ASC"
+        ):
+            victims.append((key,))
+            excess -= size
+            self._size -= size
+            if excess <= 0:
+                break
+        self._connection.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        """Returns the hit/miss/eviction counters and the current cache size."""
+        with self._lock:
+            entries, size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def log_stats(self) -> None:
+        """Logs the cache counters."""
+        stats = self.stats()
+        Utils.logger.info(
+            "Embeddings cache: %s hits, %s misses (hit rate %s), %s evictions, "
+            "%s entries, %s bytes",
+            stats["hits"],
+            stats["misses"],
+            stats["hit_rate"],
+            stats["evictions"],
+            stats["entries"],
+            stats["bytes"],
+        )
+
+    def close(self) -> None:
+        """Closes the underlying sqlite connection."""
+        with self._lock:
+            self._connection.close()
@@ -8,9 +8,10 @@ from datetime import datetime
 from typing import Dict, List, Optional
 from uuid import uuid4
 
-import requests
 import pymupdf
 
+from app.ollama_client import ollama
+from app.resource_pool import resource_pool
 from app.utils import Utils
 
 
@@ -125,17 +126,7 @@ class ExamGenerator:
             )
             prompts.append(prompt)
             Utils.logger.warning("Exam prompt: %s", self._safe_text(prompt))
-            response = requests.post(
-                Utils.OLLAMA_URL + "/generate",
-                json={
-                    "model": Utils.CHAT_MODEL,
-                    "options": {"temperature": 0.2},
-                    "stream": False,
-                    "prompt": prompt,
-                },
-                timeout=300,
-            )
-            raw = response.json().get("response", "").strip()
+            raw = ollama.generate(prompt, {"temperature": 0.2}, task="exam").strip()
             Utils.logger.warning("Exam raw response: %s", self._safe_text(raw))
             data = self._extract_questions_from_raw(raw)
             if not data:
@@ -200,17 +191,7 @@ class ExamGenerator:
             "Context:\n"
             f"{context}"
         )
-        response = requests.post(
-            Utils.OLLAMA_URL + "/generate",
-            json={
-                "model": Utils.CHAT_MODEL,
-                "options": {"temperature": 0},
-                "stream": False,
-                "prompt": prompt,
-            },
-            timeout=180,
-        )
-        raw = response.json().get("response", "").strip()
+        raw = ollama.generate(prompt, {"temperature": 0}, task="grade").strip()
         data = ExamGenerator._safe_json(raw) or {}
         status = str(data.get("status", "incorrect")).strip().lower()
         if status not in {"correct", "incorrect", "needs_more"}:
@@ -376,17 +357,8 @@ class ExamGenerator:
             f"Context:\n{context_text[:1500]}"
         )
         try:
-            response = requests.post(
-                Utils.OLLAMA_URL + "/generate",
-                json={
-                    "model": Utils.CHAT_MODEL,
-                    "options": {"temperature": 0},
-                    "stream": False,
-                    "prompt": prompt,
-                },
-                timeout=60,
-            )
-            raw = response.json().get("response", "").strip().lower()
+            raw = ollama.generate(prompt, {"temperature": 0}, task="classify")
+            raw = raw.strip().lower()
             if "code" in raw:
                 return "code_fill"
             if "open" in raw:
@@ -398,16 +370,13 @@ class ExamGenerator:
         return "multiple_choice"
 
     def _extract_chapter_text(self, page_start: int, page_end: int) -> str:
-        texts = []
-        with pymupdf.open(f"{Utils.get_data_path()}/{self.book_filename}") as book:
-            for page in range(page_start, page_end + 1):
-                try:
-                    page_text = book.load_page(page).get_text()
-                    if page_text:
-                        texts.append(page_text)
-                except Exception:
-                    continue
-        return "\n\n".join(texts)
+        with resource_pool.lease(Utils.strip_extension(self.book_filename)):
+            pages = resource_pool.pages(self.book_filename)
+            return "\n\n".join(
+                page_text
+                for page_text in pages.pages_text(page_start, page_end)
+                if page_text
+            )
 
     @staticmethod
     def _chunk_text(text: str, max_chars: int = 200000) -> List[str]:
@@ -0,0 +1,707 @@
+"""Flat NumPy vector store backed by a memory-mapped float32 matrix."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+QUANTIZATIONS = ("none", "float16", "int8")
+_SCORE_BLOCK_ROWS = 1024
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """
+    Evaluates a Chroma style metadata filter: {"key": value}, {"key": {"$op": value}}
+    with $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, combined with $and / $or.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if not _compare(value, operator, operand):
+                return False
+    return True
+
+
+def _compare(value, operator: str, operand) -> bool:
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lt":
+        return value < operand
+    if operator == "$lte":
+        return value <= operand
+    raise ValueError(f"Unsupported where operator {operator}")
+
+
+def _compare_column(values: np.ndarray, operator: str, operand) -> np.ndarray:
+    """Vectorized _compare over an object column, None stands for a missing key."""
+    if operator == "$eq":
+        return np.asarray(values == operand, dtype=bool)
+    if operator == "$ne":
+        return ~np.asarray(values == operand, dtype=bool)
+    if operator in ("$in", "$nin"):
+        found = np.zeros(len(values), dtype=bool)
+        for item in operand:
+            found |= np.asarray(values == item, dtype=bool)
+        return found if operator == "$in" else ~found
+    present = np.asarray(values != None, dtype=bool)  # noqa: E711
+    result = np.zeros(len(values), dtype=bool)
+    if not present.any():
+        if operator not in ("$gt", "$gte", "$lt", "$lte"):
+            raise ValueError(f"Unsupported where operator {operator}")
+        return result
+    values = values[present]
+    if operator == "$gt":
+        result[present] = values > operand
+    elif operator == "$gte":
+        result[present] = values >= operand
+    elif operator == "$lt":
+        result[present] = values < operand
+    elif operator == "$lte":
+        result[present] = values <= operand
+    else:
+        raise ValueError(f"Unsupported where operator {operator}")
+    return result
+
+
+class FlatVectorStore:
+    """
+    Exact nearest neighbour store for a single book: L2 normalized float32 vectors
+    appended to a raw file that is memory-mapped for search, so a query is one
+    vectorized dot product and opening a book costs no index load. Ids, metadata and
+    documents live in a sqlite sidecar. The methods mirror the subset of chromadb's
+    Collection used by the app, and distances are cosine distances. A live row mask and
+    one column per metadata key are kept in memory next to the records, so filters are
+    evaluated with array comparisons.
+
+    With float16 or int8 quantization a compressed copy of the vectors (int8 with one
+    scale per vector) is scanned instead, and only the rescore * n_results best
+    candidates are scored again against the float32 rows, which stay on disk and are
+    paged in on demand.
+    """
+
+    VECTORS_FILENAME = "vectors.f32"
+    CODES_FILENAME = "vectors.codes"
+    SCALES_FILENAME = "vectors.scales"
+    SIDECAR_FILENAME = "vectors.sqlite3"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        name: str = "embeddings",
+        quantization: Optional[str] = None,
+        rescore: int = 4,
+    ):
+        self.path = Path(path)
+        self.name = name
+        self.rescore = max(1, rescore)
+        self._requested_quantization = quantization
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+            str(self.path / self.SIDECAR_FILENAME), check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, "
+            "metadata TEXT NOT NULL, document TEXT)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._connection.commit()
+        self._load()
+
+    @classmethod
+    def exists(cls, path: Union[str, Path]) -> bool:
+        """Checks if a flat store was written to the folder."""
+        return (Path(path) / cls.SIDECAR_FILENAME).exists()
+
+    @classmethod
+    def remove(cls, path: Union[str, Path]) -> None:
+        """Deletes the store files from the folder."""
+        for file_name in (
+            cls.VECTORS_FILENAME,
+            cls.CODES_FILENAME,
+            cls.SCALES_FILENAME,
+            cls.SIDECAR_FILENAME,
+        ):
+            file_path = Path(path) / file_name
+            if file_path.exists():
+                file_path.unlink()
+
+    @classmethod
+    def create(
+        cls,
+        path: Union[str, Path],
+        name: str = "embeddings",
+        quantization: Optional[str] = None,
+    ) -> "FlatVectorStore":
+        """Creates an empty store, replacing any store already in the folder."""
+        cls.remove(path)
+        return cls(path, name=name, quantization=quantization)
+
+    def _load(self) -> None:
+        row = self._connection.execute(
+            "SELECT value FROM settings WHERE key = 'dim'"
+        ).fetchone()
+        self.dim = int(row[0]) if row else 0
+        row = self._connection.execute(
+            "SELECT value FROM settings WHERE key = 'quantization'"
+        ).fetchone()
+        if row:
+            self.quantization = row[0]
+        else:
+            self.quantization = (self._requested_quantization or "none").lower()
+            if self.quantization not in QUANTIZATIONS:
+                raise ValueError(
+                    f"Unknown quantization '{self.quantization}', "
+                    f"valid values = {', '.join(QUANTIZATIONS)}"
+                )
+            self._connection.execute(
+                "INSERT INTO settings (key, value) VALUES ('quantization', ?)",
+                (self.quantization,),
+            )
+            self._connection.commit()
+        self._rows: Dict[str, int] = {}
+        self._metadatas: Dict[int, dict] = {}
+        for record_id, record_row, metadata in self._connection.execute(
+            "SELECT id, row, metadata FROM records ORDER BY row"
+        ):
+            self._rows[record_id] = record_row
+            self._metadatas[record_row] = json.loads(metadata)
+        self._ids = {
+            record_row: record_id for record_id, record_row in self._rows.items()
+        }
+        self._live = np.zeros(0, dtype=bool)
+        self._columns: Dict[str, np.ndarray] = {}
+        self._map_vectors()
+        self._index_metadata(list(self._metadatas))
+
+    def _index_metadata(self, rows: Sequence[int]) -> None:
+        """Copies the liveness and metadata of the rows to the mask and the columns."""
+        size = max(self.total_rows, max(rows, default=-1) + 1)
+        if len(self._live) < size:
+            capacity = max(size, 2 * len(self._live))
+            extra = capacity - len(self._live)
+            self._live = np.concatenate([self._live, np.zeros(extra, dtype=bool)])
+            for key, column in self._columns.items():
+                self._columns[key] = np.concatenate(
+                    [column, np.full(extra, None, dtype=object)]
+                )
+        for record_row in rows:
+            metadata = self._metadatas.get(record_row)
+            self._live[record_row] = metadata is not None
+            metadata = metadata or {}
+            for key in metadata.keys() - self._columns.keys():
+                self._columns[key] = np.full(len(self._live), None, dtype=object)
+            for key, column in self._columns.items():
+                column[record_row] = metadata.get(key)
+
+    def _where_mask(self, where: Optional[dict]) -> np.ndarray:
+        """Returns the mask of the live rows matching a Chroma style metadata filter."""
+        live = self._live[: self.total_rows]
+        if not where:
+            return live.copy()
+        return live & self._match_columns(where)
+
+    def _match_columns(self, where: dict) -> np.ndarray:
+        size = self.total_rows
+        mask = np.ones(size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._match_columns(clause)
+                continue
+            if key == "$or":
+                matched = np.zeros(size, dtype=bool)
+                for clause in condition:
+                    matched |= self._match_columns(clause)
+                mask &= matched
+                continue
+            column = self._columns.get(key)
+            values = (
+                column[:size]
+                if column is not None
+                else np.full(size, None, dtype=object)
+            )
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                mask &= _compare_column(values, operator, operand)
+        return mask
+
+    def _map_vectors(self) -> None:
+        vectors_path = self.path / self.VECTORS_FILENAME
+        size = vectors_path.stat().st_size if vectors_path.exists() else 0
+        self.total_rows = size // (4 * self.dim) if self.dim else 0
+        self._matrix = (
+            np.memmap(
+                vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self.total_rows, self.dim),
+            )
+            if self.total_rows
+            else np.zeros((0, self.dim), dtype=np.float32)
+        )
+        self._codes = None
+        self._scales = None
+        if self.quantization == "none":
+            return
+        codes_path = self.path / self.CODES_FILENAME
+        scales_path = self.path / self.SCALES_FILENAME
+        code_size = 2 if self.quantization == "float16" else 1
+        expected = self.total_rows * self.dim * code_size
+        if (codes_path.stat().st_size if codes_path.exists() else 0) != expected or (
+            self.quantization == "int8"
+            and (scales_path.stat().st_size if scales_path.exists() else 0)
+            != 4 * self.total_rows
+        ):
+            self._encode_all()
+        if not self.total_rows:
+            return
+        self._codes = np.memmap(
+            codes_path,
+            dtype=np.float16 if self.quantization == "float16" else np.int8,
+            mode="r",
+            shape=(self.total_rows, self.dim),
+        )
+        if self.quantization == "int8":
+            self._scales = np.memmap(
+                scales_path, dtype=np.float32, mode="r", shape=(self.total_rows,)
+            )
+
+    def _read_rows(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Reads float32 rows with plain file reads instead of the memory map, so rescoring
+        a quantized store does not fault whole page cache folios into the process.
+        """
+        size = 4 * self.dim
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        with open(self.path / self.VECTORS_FILENAME, "rb") as handle:
+            for index, row in enumerate(rows):
+                handle.seek(int(row) * size)
+                vectors[index] = np.frombuffer(handle.read(size), dtype=np.float32)
+        return vectors
+
+    def _encode(self, vectors: np.ndarray) -> tuple:
+        """Returns the compressed codes of the vectors and their scales (int8 only)."""
+        if self.quantization == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _encode_all(self) -> None:
+        """Writes the compressed copy of every row again from the float32 file."""
+        blocks = (
+            self._encode(np.asarray(self._matrix[start : start + _SCORE_BLOCK_ROWS]))
+            for start in range(0, self.total_rows, _SCORE_BLOCK_ROWS)
+        )
+        with open(self.path / self.CODES_FILENAME, "wb") as codes_handle:
+            if self.quantization == "float16":
+                for codes, _scales in blocks:
+                    codes_handle.write(codes.tobytes())
+                return
+            with open(self.path / self.SCALES_FILENAME, "wb") as scales_handle:
+                for codes, scales in blocks:
+                    codes_handle.write(codes.tobytes())
+                    scales_handle.write(scales.tobytes())
+
+    def quantize(self, quantization: str) -> None:
+        """
+        Switches the store to another quantization, the compressed copy is rebuilt from
+        the float32 vectors so nothing has to be embedded again.
+        """
+        quantization = quantization.lower()
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization '{quantization}', "
+                f"valid values = {', '.join(QUANTIZATIONS)}"
+            )
+        with self._lock:
+            if quantization == self.quantization:
+                return
+            self._codes = None
+            self._scales = None
+            for file_name in (self.CODES_FILENAME, self.SCALES_FILENAME):
+                file_path = self.path / file_name
+                if file_path.exists():
+                    file_path.unlink()
+            self.quantization = quantization
+            self._connection.execute(
+                "INSERT OR REPLACE INTO settings (key, value) "
+                "VALUES ('quantization', ?)",
+                (quantization,),
+            )
+            self._connection.commit()
+            self._map_vectors()
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def count(self) -> int:
+        """Returns the number of stored records."""
+        return len(self._rows)
+
+    def add(self, ids, embeddings, metadatas=None, documents=None) -> None:
+        """Adds records, existing ids are overwritten."""
+        self.upsert(ids, embeddings, metadatas=metadatas, documents=documents)
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings,
+        metadatas: Optional[Sequence[dict]] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Inserts the records, or replaces them if their id is already stored."""
+        vectors = self._normalize(embeddings)
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+        with self._lock:
+            self._set_dim(vectors.shape[1])
+            rows = []
+            appended = []
+            for record_id, vector in zip(ids, vectors):
+                if record_id in self._rows:
+                    rows.append(self._rows[record_id])
+                else:
+                    rows.append(self.total_rows + len(appended))
+                    appended.append(vector)
+            self._write_vectors(
+                [
+                    (record_row, vector)
+                    for record_row, vector in zip(rows, vectors)
+                    if record_row < self.total_rows
+                ],
+                appended,
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO records (id, row, metadata, document) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (record_id, record_row, json.dumps(metadata or {}), document)
+                    for record_id, record_row, metadata, document in zip(
+                        ids, rows, metadatas, documents
+                    )
+                ],
+            )
+            self._connection.commit()
+            for record_id, record_row, metadata in zip(ids, rows, metadatas):
+                self._rows[record_id] = record_row
+                self._ids[record_row] = record_id
+                self._metadatas[record_row] = dict(metadata or {})
+            self._index_metadata(rows)
+
+    def update(
+        self,
+        ids: Sequence[str],
+        embeddings=None,
+        metadatas: Optional[Sequence[dict]] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Updates stored records, the given metadata keys are merged in."""
+        with self._lock:
+            known = [
+                index for index, record_id in enumerate(ids) if record_id in self._rows
+            ]
+            if embeddings is not None:
+                vectors = self._normalize(embeddings)
+                self._write_vectors(
+                    [(self._rows[ids[index]], vectors[index]) for index in known], []
+                )
+            for index in known:
+                record_row = self._rows[ids[index]]
+                if metadatas is not None:
+                    self._metadatas[record_row].update(metadatas[index] or {})
+                    self._connection.execute(
+                        "UPDATE records SET metadata = ? WHERE id = ?",
+                        (json.dumps(self._metadatas[record_row]), ids[index]),
+                    )
+                if documents is not None:
+                    self._connection.execute(
+                        "UPDATE records SET document = ? WHERE id = ?",
+                        (documents[index], ids[index]),
+                    )
+            self._connection.commit()
+            if metadatas is not None:
+                self._index_metadata([self._rows[ids[index]] for index in known])
+
+    def delete(
+        self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None
+    ) -> None:
+        """
+        Deletes records by id and/or metadata filter. Their vectors stay in the file as
+        dead rows until compact is called.
+        """
+        if ids is None and where is None:
+            return
+        with self._lock:
+            matched = self._where_mask(where)
+            if ids is None:
+                rows = np.flatnonzero(matched).tolist()
+            else:
+                rows = [
+                    self._rows[record_id]
+                    for record_id in ids
+                    if record_id in self._rows and matched[self._rows[record_id]]
+                ]
+            targets = [self._ids[record_row] for record_row in rows]
+            for record_id in targets:
+                record_row = self._rows.pop(record_id)
+                self._ids.pop(record_row, None)
+                self._metadatas.pop(record_row, None)
+            self._index_metadata(rows)
+            self._connection.executemany(
+                "DELETE FROM records WHERE id = ?",
+                [(record_id,) for record_id in targets],
+            )
+            self._connection.commit()
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[dict] = None,
+        include: Iterable[str] = ("metadatas", "documents"),
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> dict:
+        """Returns the records with the given ids and/or matching the filter."""
+        include = list(include)
+        with self._lock:
+            matched = self._where_mask(where)
+            if ids is not None:
+                rows = [
+                    self._rows[record_id]
+                    for record_id in ids
+                    if record_id in self._rows and matched[self._rows[record_id]]
+                ]
+            else:
+                rows = np.flatnonzero(matched).tolist()
+            start = offset or 0
+            rows = rows[start : start + limit if limit is not None else None]
+            return self._records(rows, include)
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Iterable[str] = ("metadatas", "documents", "distances"),
+    ) -> dict:
+        """
+        Top n_results search for one or several query vectors at once, exact unless the
+        store is quantized, in which case the shortlist is rescored in full precision.
+
+        Args:
+        query_embeddings: A vector or a list of vectors.
+        n_results (int): The number of neighbours to return per query.
+        where (dict, optional): A metadata filter on the candidates.
+        include (Iterable[str]): Fields to return, out of metadatas, documents,
+            distances and embeddings.
+        Returns:
+        dict: Chroma style results, one list per query for every returned field.
+        """
+        include = list(include)
+        queries = self._normalize(query_embeddings)
+        results = {"ids": []}
+        for field in include:
+            results[field] = []
+        with self._lock:
+            live = self._where_mask(where)
+            candidates = int(live.sum())
+            top_k = min(n_results, candidates)
+            scores = (
+                self._scores(queries)
+                if candidates
+                else np.zeros((0, len(queries)), dtype=np.float32)
+            )
+            shortlist = (
+                top_k if self._codes is None else min(candidates, top_k * self.rescore)
+            )
+            for column in range(len(queries)):
+                if not top_k:
+                    rows, similarities = [], []
+                else:
+                    column_scores = np.where(live, scores[:, column], -np.inf)
+                    best = np.argpartition(-column_scores, shortlist - 1)[:shortlist]
+                    if self._codes is not None:
+                        best = np.sort(best)
+                        column_scores = np.full(self.total_rows, -np.inf)
+                        column_scores[best] = self._read_rows(best) @ queries[column]
+                        best = best[
+                            np.argpartition(-column_scores[best], top_k - 1)[:top_k]
+                        ]
+                    rows = best[np.argsort(-column_scores[best])].tolist()
+                    similarities = column_scores[rows]
+                records = self._records(rows, include)
+                results["ids"].append(records["ids"])
+                for field in include:
+                    if field == "distances":
+                        results[field].append(
+                            [1.0 - float(value) for value in similarities]
+                        )
+                    else:
+                        results[field].append(records[field])
+        return results
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Similarity of every stored row to every query, computed on the compressed copy
+        in blocks when the store is quantized so no full float32 matrix is materialized.
+        """
+        if self._codes is None:
+            return self._matrix @ queries.T
+        scores = np.empty((self.total_rows, len(queries)), dtype=np.float32)
+        for start in range(0, self.total_rows, _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, self.total_rows)
+            scores[start:end] = self._codes[start:end].astype(np.float32) @ queries.T
+            if self._scales is not None:
+                scores[start:end] *= self._scales[start:end, None]
+        return scores
+
+    def compact(self) -> None:
+        """Rewrites the vectors file without the rows of deleted records."""
+        with self._lock:
+            rows = sorted(self._ids)
+            if len(rows) == self.total_rows:
+                return
+            vectors = np.array(self._matrix[rows]) if rows else None
+            vectors_path = self.path / self.VECTORS_FILENAME
+            temporary_path = vectors_path.with_suffix(".tmp")
+            with open(temporary_path, "wb") as handle:
+                if vectors is not None:
+                    handle.write(vectors.astype(np.float32).tobytes())
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            temporary_path.replace(vectors_path)
+            self._connection.executemany(
+                "UPDATE records SET row = ? WHERE id = ?",
+                [(-1 - new_row, self._ids[row]) for new_row, row in enumerate(rows)],
+            )
+            self._connection.execute("UPDATE records SET row = -1 - row")
+            self._connection.commit()
+            self._load()
+
+    def close(self) -> None:
+        """Closes the sidecar connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _set_dim(self, dim: int) -> None:
+        if self.dim and self.dim != dim:
+            raise ValueError(
+                f"Embedding dimension {dim} does not match the store {self.dim}"
+            )
+        if not self.dim:
+            self.dim = dim
+            self._connection.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('dim', ?)",
+                (str(dim),),
+            )
+            self._connection.commit()
+
+    def _write_vectors(self, replaced: List[tuple], appended: List[np.ndarray]) -> None:
+        vectors_path = self.path / self.VECTORS_FILENAME
+        if replaced:
+            matrix = np.memmap(
+                vectors_path,
+                dtype=np.float32,
+                mode="r+",
+                shape=(self.total_rows, self.dim),
+            )
+            for record_row, vector in replaced:
+                matrix[record_row] = vector
+            matrix.flush()
+            del matrix
+        if appended:
+            with open(vectors_path, "ab") as handle:
+                handle.write(np.asarray(appended, dtype=np.float32).tobytes())
+        if self.quantization != "none":
+            self._write_codes(replaced, appended)
+        self._map_vectors()
+
+    def _write_codes(self, replaced: List[tuple], appended: List[np.ndarray]) -> None:
+        self._codes = None
+        self._scales = None
+        codes_path = self.path / self.CODES_FILENAME
+        scales_path = self.path / self.SCALES_FILENAME
+        if replaced:
+            codes, scales = self._encode(np.asarray([vector for _, vector in replaced]))
+            matrix = np.memmap(
+                codes_path,
+                dtype=codes.dtype,
+                mode="r+",
+                shape=(self.total_rows, self.dim),
+            )
+            for index, (record_row, _vector) in enumerate(replaced):
+                matrix[record_row] = codes[index]
+            matrix.flush()
+            del matrix
+            if scales is not None:
+                stored = np.memmap(
+                    scales_path, dtype=np.float32, mode="r+", shape=(self.total_rows,)
+                )
+                for index, (record_row, _vector) in enumerate(replaced):
+                    stored[record_row] = scales[index]
+                stored.flush()
+                del stored
+        if appended:
+            codes, scales = self._encode(np.asarray(appended, dtype=np.float32))
+            with open(codes_path, "ab") as handle:
+                handle.write(codes.tobytes())
+            if scales is not None:
+                with open(scales_path, "ab") as handle:
+                    handle.write(scales.tobytes())
+
+    def _records(self, rows: List[int], include: List[str]) -> dict:
+        records = {"ids": [self._ids[row] for row in rows]}
+        if "metadatas" in include:
+            records["metadatas"] = [dict(self._metadatas[row]) for row in rows]
+        if "documents" in include:
+            documents = {}
+            for record_id in records["ids"]:
+                found = self._connection.execute(
+                    "SELECT document FROM records WHERE id = ?", (record_id,)
+                ).fetchone()
+                documents[record_id] = found[0] if found else None
+            records["documents"] = [
+                documents[record_id] for record_id in records["ids"]
+            ]
+        if "embeddings" in include:
+            records["embeddings"] = [self._matrix[row].tolist() for row in rows]
+        return records
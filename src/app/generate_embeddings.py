@@ -1,12 +1,68 @@
 """Module for the embeddings generation process."""
 
+import hashlib
 import json
+import multiprocessing
 import re
-import requests
+from collections import deque
+from dataclasses import asdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
 from chromadb.api.models.Collection import Collection
 import pymupdf
+from .answer_cache import answer_cache
+from .dedup import ChunkDeduplicator
+from .embeddings_cache import EmbeddingsCache
+from .headers import HeaderFooterFilter
+from .index_settings import IndexSettings
 from .indexer import IndexBuilder
+from .ollama_client import OllamaError, OllamaUnavailable, ollama
+from .page_store import PageTextStore
+from .pipeline import Pipeline
+from .resource_pool import resource_pool
 from .utils import Utils
+from .vector_store import (
+    VectorStore,
+    create_store,
+    get_backend,
+    open_store,
+    reindex_store,
+    store_exists,
+)
+
+PARSE_PAGES_PER_TASK = 25
+
+
+def _ordered_map(
+    executor: Executor, func: Callable, items: Iterable, window: int
+) -> Iterator:
+    """
+    Lazily maps func over items on the executor, keeping at most `window` calls
+    submitted and yielding the results in the same order as the items.
+    """
+    in_flight = deque()
+    for item in items:
+        in_flight.append(executor.submit(func, item))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def _parse_pages(task: tuple) -> List[Tuple[int, List[Tuple[str, int]]]]:
+    """Process pool worker, opens its own copy of the book and segments pages."""
+    book_path, pages, char_limit, overlap, header_filter = task
+    segmented = []
+    with pymupdf.open(book_path) as book:
+        for page in pages:
+            pdf_page = book.load_page(page)
+            blocks = header_filter.filter_blocks(
+                pdf_page.get_text("blocks") or [], pdf_page.rect.height
+            )
+            segmented.append(
+                (page, EmbeddingsGenerator.segment_page(blocks, char_limit, overlap))
+            )
+    return segmented
 
 
 class EmbeddingsGenerator:
@@ -16,9 +72,16 @@ class EmbeddingsGenerator:
         self.book_filename = book_filename
         self.book_page_length = "..."
         self.output_folder = Utils.strip_extension(book_filename)
-        self.chromaclient = Utils.get_chroma_client(
-            str(Utils.get_output_path(self.output_folder))
+        self.chromaclient = (
+            resource_pool.chroma_client(self.output_folder)
+            if get_backend() == "chroma"
+            else None
         )
+        self.collection = None
+        self.batch_size = 1024
+        self.embeddings_cache = None
+        self.page_toc = []
+        self.pipeline = None
 
     def get_toc(self, book: pymupdf.Document) -> list:
         """
@@ -36,7 +99,13 @@ class EmbeddingsGenerator:
         return toc
 
     def parse_pdf(
-        self, char_limit: int = 2000, overlap: int = 200
+        self,
+        char_limit: int = 2000,
+        overlap: int = 200,
+        workers: int = None,
+        pages: Optional[Set[int]] = None,
+        start_page: int = 0,
+        start_segment: int = -1,
     ) -> tuple[str, int, str, int, int, int]:
         """
         Retrieve an parses the PDF document by page, yielding text, level, title, page, and toc_index for each.
@@ -49,99 +118,227 @@ class EmbeddingsGenerator:
         char_limit (int): limit of character per chunk of text sent to the embedding model.
             default 2k assumin 4 chars = 1 token for the model 512 token limit
         overlap (int): how much character to overlap when splitting a text block into chunks, to retain consistence
+        workers (int, optional): number of processes used to extract the pages, each one
+            opens its own document and parses a range of pages. Defaults to
+            Utils.PDF_PARSE_WORKERS, 1 parses in-process.
+        pages (Set[int], optional): only extract these pages, used to re-ingest changed
+            pages.
+        start_page (int): first page to extract, the pages before it are never loaded.
+        start_segment (int): last segment of start_page already ingested, extraction
+            resumes with the segment after it.
 
         """
         Utils.logger.info("Retrieving /data/%s", self.book_filename)
-        with pymupdf.open(f"{Utils.get_data_path()}/{self.book_filename}") as book:
+        book_path = f"{Utils.get_data_path()}/{self.book_filename}"
+        workers = Utils.PDF_PARSE_WORKERS if workers is None else workers
+        with pymupdf.open(book_path) as book:
             self.book_page_length = book.page_count
             toc = self.get_toc(book)
-            page, toc_index = 0, 0
-            while page < book.page_count and (toc_index + 1) < len(toc):
-                page_obj = book.load_page(page)
-                blocks = page_obj.get_text("blocks") or []
-                raw_segments = []
-                for block in sorted(blocks, key=lambda b: (b[1], b[0])):
-                    block_text = block[4].strip()
-                    if not block_text:
-                        continue
-                    raw_segments.extend(
-                        [seg.strip() for seg in re.split(r"\n{2,}", block_text) if seg.strip()]
-                    )
-                segments = raw_segments
-                segment_chunk = ""
-                segment_index = 0
-                for segment in segments:
-                    if len(segment) > 0:  # Only work with valid segments
-                        if (
-                            len(segment) > char_limit
-                        ):  # Split into chunks if segment bigger than char_limit
-                            start = 0
-                            while start < len(segment):
-                                end = start + char_limit
-                                chunk = segment[start:end]
-                                yield (
-                                    chunk,
-                                    toc[toc_index][0],
-                                    toc[toc_index][1],
-                                    page,
-                                    toc_index,
-                                    segment_index,
-                                )
-                                segment_index += 1
-                                start = (
-                                    end - overlap
-                                )  # overlap to counterweight truncated sentences
-                        else:
-                            if len(segment_chunk) + len(segment) < char_limit:
-                                segment_chunk += ". \n" + segment
-                            else:
-                                data = (
-                                    segment_chunk,
-                                    toc[toc_index][0],
-                                    toc[toc_index][1],
-                                    page,
-                                    toc_index,
-                                    segment_index,
-                                )
-                                segment_chunk = segment
-                                yield data
-                                segment_index += 1
-
-                if len(segment_chunk) > 0:
-                    data = (
-                        segment_chunk,
-                        toc[toc_index][0],
-                        toc[toc_index][1],
-                        page,
-                        toc_index,
-                        segment_index,
+            self.page_toc = self.get_page_toc_indexes(toc, book.page_count)
+            header_filter = HeaderFooterFilter(self.book_filename)
+            header_filter.load(book)
+            selected = [
+                page
+                for page in range(start_page, len(self.page_toc))
+                if pages is None or page in pages
+            ]
+            if start_page and selected:
+                Utils.logger.info(
+                    "Resuming extraction at page %s, segment %s (toc index %s).",
+                    start_page,
+                    start_segment + 1,
+                    self.page_toc[selected[0]],
+                )
+            if workers <= 1:
+                for page in selected:
+                    toc_index = self.page_toc[page]
+                    pdf_page = book.load_page(page)
+                    blocks = header_filter.filter_blocks(
+                        pdf_page.get_text("blocks") or [], pdf_page.rect.height
                     )
-                    yield data
+                    for text, segment_index in self.segment_page(
+                        blocks, char_limit, overlap
+                    ):
+                        if page == start_page and segment_index <= start_segment:
+                            continue
+                        yield (
+                            text,
+                            toc[toc_index][0],
+                            toc[toc_index][1],
+                            page,
+                            toc_index,
+                            segment_index,
+                        )
+        if workers > 1:
+            tasks = [
+                (
+                    book_path,
+                    selected[start : start + PARSE_PAGES_PER_TASK],
+                    char_limit,
+                    overlap,
+                    header_filter,
+                )
+                for start in range(0, len(selected), PARSE_PAGES_PER_TASK)
+            ]
+            # parse_pdf runs inside a pipeline thread, forking a multi-threaded process
+            # can deadlock the children on locks held by the other threads
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                for page_range in _ordered_map(
+                    executor, _parse_pages, tasks, workers * 2
+                ):
+                    for page, segments in page_range:
+                        toc_index = self.page_toc[page]
+                        for text, segment_index in segments:
+                            if page == start_page and segment_index <= start_segment:
+                                continue
+                            yield (
+                                text,
+                                toc[toc_index][0],
+                                toc[toc_index][1],
+                                page,
+                                toc_index,
+                                segment_index,
+                            )
+
+        Utils.logger.info(
+            "The pdf parsing has finished, %s pages parsed.", self.book_page_length
+        )
 
-                page += 1
-                if page >= toc[(toc_index + 1)][2]:
-                    toc_index += 1  # Advancing TOC headers (table of contents)
+    @staticmethod
+    def get_page_toc_indexes(toc: list, page_count: int) -> List[int]:
+        """
+        Computes up front the TOC entry each parsed page belongs to. Parsing stops at
+        the last TOC entry and the TOC index advances at most one entry per page.
+
+        Args:
+        toc (list): The TOC entries as returned by get_toc.
+        page_count (int): The number of pages of the book.
+        Returns:
+        List[int]: The toc_index of every page to parse, the list index is the page
+            number.
+        """
+        page_toc = []
+        page, toc_index = 0, 0
+        while page < page_count and (toc_index + 1) < len(toc):
+            page_toc.append(toc_index)
+            page += 1
+            if page >= toc[(toc_index + 1)][2]:
+                toc_index += 1  # Advancing TOC headers (table of contents)
+        return page_toc
+
+    @staticmethod
+    def segment_page(
+        blocks: list, char_limit: int = 2000, overlap: int = 200
+    ) -> List[Tuple[str, int]]:
+        """
+        Splits the text blocks of a page into chunks of at most char_limit characters.
 
-            Utils.logger.info(
-                "The pdf parsing has finished, %s pages parsed.", book.page_count
+        Args:
+        blocks (list): The blocks returned by page.get_text("blocks").
+        char_limit (int): limit of character per chunk of text.
+        overlap (int): how much character to overlap when splitting a text block into
+            chunks.
+        Returns:
+        List[Tuple[str, int]]: The chunks of the page with their segment index.
+        """
+        raw_segments = []
+        for block in sorted(blocks, key=lambda b: (b[1], b[0])):
+            block_text = block[4].strip()
+            if not block_text:
+                continue
+            raw_segments.extend(
+                [seg.strip() for seg in re.split(r"\n{2,}", block_text) if seg.strip()]
             )
+        chunks = []
+        segment_chunk = ""
+        segment_index = 0
+        for segment in raw_segments:
+            if len(segment) > 0:  # Only work with valid segments
+                if (
+                    len(segment) > char_limit
+                ):  # Split into chunks if segment bigger than char_limit
+                    start = 0
+                    while start < len(segment):
+                        end = start + char_limit
+                        chunks.append((segment[start:end], segment_index))
+                        segment_index += 1
+                        start = (
+                            end - overlap
+                        )  # overlap to counterweight truncated sentences
+                else:
+                    if len(segment_chunk) + len(segment) < char_limit:
+                        segment_chunk += ". \n" + segment
+                    else:
+                        chunks.append((segment_chunk, segment_index))
+                        segment_chunk = segment
+                        segment_index += 1
+
+        if len(segment_chunk) > 0:
+            chunks.append((segment_chunk, segment_index))
+        return chunks
 
     def check_collection(self) -> bool:
         """Checks if the embeddings db for a book exist."""
-        if Utils.COLLECTION_NAME in [
-            collection.name for collection in self.chromaclient.list_collections()
-        ]:
-            return True
-        return False
+        return store_exists(
+            Utils.get_output_path(self.output_folder), client=self.chromaclient
+        )
 
-    def generate_embeddings(self, stream: bool = False, resume: bool = False) -> Collection:
+    def _get_collection(self) -> VectorStore:
+        """Opens the embeddings collection of the book in the vector store."""
+        return open_store(
+            Utils.get_output_path(self.output_folder), client=self.chromaclient
+        )
+
+    def _create_collection(self, replace: bool = False) -> VectorStore:
+        """Creates an empty embeddings collection, replacing the old one if asked."""
+        return create_store(
+            Utils.get_output_path(self.output_folder),
+            client=self.chromaclient,
+            replace=replace,
+        )
+
+    def generate_embeddings(
+        self,
+        stream: bool = False,
+        resume: bool = False,
+        incremental: bool = False,
+        fast: bool = False,
+    ) -> Collection:
         """
         Generates the embeedings using ollama, stores them in a collection.
+
+        Args:
+        stream (bool): If True, returns a generator of server-sent progress events
+            instead of running the whole ingestion before returning.
+        resume (bool): Whether to continue from the last saved checkpoint.
+        incremental (bool): Whether to only re-embed the pages whose content changed
+            since the last ingestion, falls back to a full rebuild if there is nothing
+            to diff against.
+        fast (bool): Whether to embed the raw text without the LLM summaries so the book
+            is searchable right away, the summaries are added later by
+            enrich_embeddings.
         Returns:
         chromadb.api.models.Collection.Collection: The generated collection.
         """
+        events = self._invalidating_answers(
+            self._generate_embeddings(resume=resume, incremental=incremental, fast=fast)
+        )
+        if stream:
+            return events
+        for _event in events:
+            pass
+        return self.collection
+
+    def _generate_embeddings(
+        self, resume: bool = False, incremental: bool = False, fast: bool = False
+    ):
+        """Runs the ingestion, yielding a progress event per stored micro-batch."""
         if not resume:
             self._clear_checkpoint()
+            if not incremental:
+                self._clear_enrichment_state()
         checkpoint = self._load_checkpoint() if resume else None
         if resume and not checkpoint:
             Utils.logger.warning(
@@ -152,112 +349,850 @@ class EmbeddingsGenerator:
         resume_segment = checkpoint.get("segment", -1) if checkpoint else -1
         idx = checkpoint.get("idx", 0) if checkpoint else 0
 
-        if self.check_collection():
+        # Hashing every page extracts the whole book, on resume reuse the hashes of the
+        # interrupted run so extraction only starts at the checkpoint
+        page_hashes = self._load_page_hashes(pending=True) if resume else {}
+        if not page_hashes:
+            page_hashes = self.compute_page_hashes()
+            self._save_page_hashes(page_hashes, pending=True)
+        changed_pages = None
+        if incremental and not resume and self.check_collection():
+            changed_pages = self._get_changed_pages(page_hashes)
+        if changed_pages is not None:
+            Utils.logger.info(
+                "Incremental ingestion, %s changed pages: %s",
+                len(changed_pages),
+                sorted(changed_pages),
+            )
+            collection = self._get_collection()
+            if changed_pages:
+                changed_pages |= self._get_duplicate_pages(collection, changed_pages)
+                collection.delete(where={"page": {"$in": sorted(changed_pages)}})
+        elif self.check_collection():
             if resume:
-                collection = self.chromaclient.get_collection(name="embeddings")
+                collection = self._get_collection()
             else:
                 Utils.logger.info(
                     "Collection '%s' already exists. Deleting it and creating a new one.",
                     Utils.COLLECTION_NAME,
                 )
-                self.chromaclient.delete_collection(Utils.COLLECTION_NAME)
-                collection = self.chromaclient.create_collection(name="embeddings")
+                collection = self._create_collection(replace=True)
+        else:
+            collection = self._create_collection()
+        self.collection = collection
+        index_builder = IndexBuilder(self.book_filename)
+        if resume or changed_pages is not None:
+            index_builder.load_json_index()
         else:
-            collection = self.chromaclient.create_collection(name="embeddings")
-        batch_size = 1024
-        batch = {
+            index_builder.discard_journal()
+        chunks = self._iter_chunks(
+            idx,
+            resume_page if resume else 0,
+            resume_segment if resume else -1,
+            pages=changed_pages,
+        )
+        # Every stage runs in its own thread with bounded queues in between, so pdf
+        # extraction, the ollama calls and chromadb writes overlap. Summaries and
+        # embeddings share one pool so at most OLLAMA_MAX_INFLIGHT requests hit ollama
+        # at once, results come back in submission (page/segment) order.
+        max_inflight = max(1, Utils.OLLAMA_MAX_INFLIGHT)
+        if Utils.EMBEDDINGS_CACHE_MAX_MB > 0:
+            self.embeddings_cache = EmbeddingsCache()
+        # The seen chunks only live for one run, so a resumed or incremental run
+        # cannot tell which of its chunks repeat text stored by an earlier one and
+        # keeps them all
+        deduplicator = (
+            ChunkDeduplicator(mode="off")
+            if resume or changed_pages is not None
+            else ChunkDeduplicator()
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+                self.pipeline = (
+                    Pipeline(chunks, name="parse")
+                    .add_stage(
+                        "dedup",
+                        lambda items: self._skip_duplicates(deduplicator, items),
+                    )
+                    .add_stage(
+                        "summarize",
+                        lambda items: (
+                            map(self._raw_chunk, items)
+                            if fast
+                            else self._summarize_chunks(
+                                executor, index_builder, items, max_inflight
+                            )
+                        ),
+                    )
+                    .add_stage("batch", self._micro_batches)
+                    .add_stage(
+                        "embed",
+                        lambda items: _ordered_map(
+                            executor,
+                            lambda pending: (
+                                pending,
+                                self._embed_texts(pending),
+                            ),
+                            items,
+                            max_inflight,
+                        ),
+                    )
+                    .add_stage(
+                        "persist", lambda items: self._persist(items, index_builder)
+                    )
+                )
+                for page in self.pipeline.run():
+                    progress = {
+                        "progress": f"{page}/{self.book_page_length}",
+                        "pipeline": self.pipeline.stats(),
+                    }
+                    yield f"data: {json.dumps(progress)}\n\n"
+            Utils.logger.info("Ingestion pipeline stats: %s", self.pipeline.stats())
+        finally:
+            if self.embeddings_cache:
+                self.embeddings_cache.log_stats()
+                self.embeddings_cache.close()
+                self.embeddings_cache = None
+        self._record_duplicate_pages(deduplicator)
+        if hasattr(self.collection, "compact"):
+            self.collection.compact()
+        if changed_pages:
+            self._rebuild_index_nodes(index_builder, changed_pages)
+        if not fast and Utils.SUMMARY_MODE == "chapter":
+            # Pages past the start of the last TOC entry are not parsed and have no
+            # TOC index
+            index_builder.rollup_summaries(
+                None
+                if changed_pages is None
+                else sorted(
+                    {
+                        self.page_toc[page]
+                        for page in changed_pages
+                        if page < len(self.page_toc)
+                    }
+                )
+            )
+        index_builder.compact_index()
+        self._save_page_hashes(page_hashes)
+        self._clear_checkpoint()
+        if fast:
+            self._save_enrichment_state("pending", 0, self.collection.count())
+        yield f"data: {json.dumps({'progress': 'done'})}\n\n"
+
+    def enrich_embeddings(self, stream: bool = False, reembed: Optional[bool] = None):
+        """
+        Second ingestion pass for books generated in fast mode. Summarizes the chunks
+        that are not enriched yet, adds their summaries and topics to the index and to
+        the chunk metadata and optionally replaces their vectors with the embedding of
+        the text plus the "Summary:/Topics:" hint. Chunks are marked as enriched as they
+        are updated, so an interrupted pass continues where it stopped.
+
+        Args:
+        stream (bool): If True, returns a generator of server-sent progress events.
+        reembed (bool, optional): Whether to re-embed the enriched chunks with the hint
+            text. Defaults to Utils.ENRICH_REEMBED.
+        Returns:
+        chromadb.api.models.Collection.Collection: The enriched collection.
+        """
+        events = self._invalidating_answers(
+            self._enrich_embeddings(
+                Utils.ENRICH_REEMBED if reembed is None else reembed
+            )
+        )
+        if stream:
+            return events
+        for _event in events:
+            pass
+        return self.collection
+
+    def _invalidating_answers(self, events: Iterator[str]) -> Iterator[str]:
+        """
+        Drops the cached answers of the book when an ingestion pass starts and when it
+        ends, answers cached while it runs may quote chunks it rewrites.
+        """
+        answer_cache.invalidate(self.output_folder)
+        try:
+            yield from events
+        finally:
+            answer_cache.invalidate(self.output_folder)
+
+    def _enrich_embeddings(self, reembed: bool):
+        """Runs the enrichment pass, yielding a progress event per micro-batch."""
+        if not self.check_collection():
+            Utils.logger.warning("No embeddings to enrich for %s.", self.book_filename)
+            return
+        self.collection = self._get_collection()
+        records = self.collection.get(where={"enriched": False}, include=["metadatas"])
+        pending_ids = [
+            record_id
+            for record_id, _metadata in sorted(
+                zip(records["ids"], records["metadatas"]),
+                key=lambda row: (row[1].get("page", 0), row[1].get("segment", 0)),
+            )
+        ]
+        total = self.collection.count()
+        enriched = total - len(pending_ids)
+        Utils.logger.info(
+            "Enriching %s chunks of %s.", len(pending_ids), self.book_filename
+        )
+        self._save_enrichment_state("running", enriched, total)
+        index_builder = IndexBuilder(self.book_filename)
+        index_builder.load_json_index()
+        max_inflight = max(1, Utils.OLLAMA_MAX_INFLIGHT)
+        if reembed and Utils.EMBEDDINGS_CACHE_MAX_MB > 0:
+            self.embeddings_cache = EmbeddingsCache()
+        try:
+            with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+                self.pipeline = (
+                    Pipeline(self._iter_stored_chunks(pending_ids), name="load")
+                    .add_stage(
+                        "summarize",
+                        lambda items: self._summarize_chunks(
+                            executor, index_builder, items, max_inflight
+                        ),
+                    )
+                    .add_stage("batch", self._micro_batches)
+                    .add_stage(
+                        "embed",
+                        lambda items: _ordered_map(
+                            executor,
+                            lambda pending: (
+                                pending,
+                                self._embed_texts(pending) if reembed else [],
+                            ),
+                            items,
+                            max_inflight,
+                        ),
+                    )
+                    .add_stage(
+                        "update",
+                        lambda items: self._persist_enrichment(items, index_builder),
+                    )
+                )
+                for count in self.pipeline.run():
+                    enriched += count
+                    self._save_enrichment_state("running", enriched, total)
+                    progress = {
+                        "enrichment": f"{enriched}/{total}",
+                        "pipeline": self.pipeline.stats(),
+                    }
+                    yield f"data: {json.dumps(progress)}\n\n"
+        finally:
+            if self.embeddings_cache:
+                self.embeddings_cache.log_stats()
+                self.embeddings_cache.close()
+                self.embeddings_cache = None
+        if Utils.SUMMARY_MODE == "chapter":
+            index_builder.rollup_summaries()
+        index_builder.compact_index()
+        self._save_enrichment_state("done", enriched, total)
+        yield f"data: {json.dumps({'enrichment': 'done'})}\n\n"
+
+    def reindex_embeddings(
+        self, settings: Optional[IndexSettings] = None, stream: bool = False
+    ):
+        """
+        Rebuilds the nearest neighbour index of the book from the stored vectors,
+        without calling Ollama, so recall can be traded against latency per book.
+
+        Args:
+        settings (IndexSettings, optional): The index settings to use and save for the
+            book, defaults to the ones saved in the book folder.
+        stream (bool): If True, returns a generator of server-sent progress events.
+        Returns:
+        chromadb.api.models.Collection.Collection: The reindexed collection.
+        """
+        events = self._reindex_embeddings(settings)
+        if stream:
+            return events
+        for _event in events:
+            pass
+        return self.collection
+
+    def _reindex_embeddings(self, settings: Optional[IndexSettings]):
+        if not self.check_collection():
+            Utils.logger.warning("No embeddings to reindex for %s.", self.book_filename)
+            return
+        output_path = Utils.get_output_path(self.output_folder)
+        settings = settings or IndexSettings.load(output_path)
+        Utils.logger.info("Reindexing %s with %s.", self.book_filename, settings)
+        yield f"data: {json.dumps({'reindex': asdict(settings)})}\n\n"
+        self.collection = reindex_store(output_path, settings, client=self.chromaclient)
+        yield f"data: {json.dumps({'reindex': 'done'})}\n\n"
+
+    def _iter_stored_chunks(self, ids: List[str], group_size: int = 256):
+        """Yields the stored chunks with the given ids, in the order of the ids."""
+        for start in range(0, len(ids), group_size):
+            group = ids[start : start + group_size]
+            records = self.collection.get(ids=group, include=["documents", "metadatas"])
+            rows = {
+                record_id: (document, metadata)
+                for record_id, document, metadata in zip(
+                    records["ids"], records["documents"], records["metadatas"]
+                )
+            }
+            for record_id in group:
+                if record_id not in rows:
+                    continue
+                document, metadata = rows[record_id]
+                yield {
+                    "id": record_id,
+                    "text": document,
+                    "metadata": metadata,
+                    "level": metadata.get("level"),
+                    "page": metadata.get("page"),
+                    "toc_index": int(metadata.get("toc_index", -1)),
+                }
+
+    def _persist_enrichment(
+        self, embedded: Iterable, index_builder: IndexBuilder
+    ) -> Iterator[int]:
+        """
+        Writes the summaries of the enriched micro-batches to the collection metadata
+        and the index, with the new vectors if they were re-embedded. Yields the chunks
+        updated.
+        """
+        unsaved = 0
+        for pending, embeddings in embedded:
+            for chunk in pending:
+                index_builder.add_segment(
+                    chunk["toc_index"],
+                    chunk["text"],
+                    summary=chunk["summary"],
+                    topics=chunk["topics"],
+                )
+            update = {
+                "ids": [chunk["id"] for chunk in pending],
+                "metadatas": [
+                    {
+                        **chunk["metadata"],
+                        "summary": chunk["summary"],
+                        "topics": ", ".join(chunk["topics"]),
+                        "enriched": True,
+                    }
+                    for chunk in pending
+                ],
+            }
+            if embeddings and all(embeddings):
+                update["embeddings"] = embeddings
+            self.collection.update(**update)
+            unsaved += len(pending)
+            if unsaved >= self.batch_size:
+                index_builder.write_journal()
+                unsaved = 0
+            yield len(pending)
+
+    def _iter_chunks(
+        self,
+        idx: int,
+        resume_page: int = 0,
+        resume_segment: int = -1,
+        pages: Optional[Set[int]] = None,
+    ):
+        """Yields the parsed chunks past the resume position, with sequential ids."""
+        for text, level, title, page, toc_index, segment_index in self.parse_pdf(
+            pages=pages, start_page=resume_page, start_segment=resume_segment
+        ):
+            idx += 1
+            yield {
+                "idx": idx,
+                "text": text,
+                "level": level,
+                "title": title,
+                "page": page,
+                "toc_index": toc_index,
+                "segment": segment_index,
+            }
+
+    @staticmethod
+    def _skip_duplicates(
+        deduplicator: ChunkDeduplicator, chunks: Iterable[dict]
+    ) -> Iterator[dict]:
+        """Drops the chunks whose text repeats one parsed earlier in this ingestion."""
+        for chunk in chunks:
+            if deduplicator.enabled and deduplicator.find_duplicate(
+                EmbeddingsGenerator.chunk_id(chunk["page"], chunk["segment"]),
+                chunk["text"],
+                chunk["page"],
+            ):
+                continue
+            yield chunk
+
+    def _record_duplicate_pages(self, deduplicator: ChunkDeduplicator) -> None:
+        """
+        Adds to the metadata of the chunks that had duplicates the other pages where
+        their text appears, as a "duplicate_pages" comma separated list.
+        """
+        if not deduplicator.covered_pages:
+            return
+        Utils.logger.info(
+            "Skipped %s duplicated chunks, repeated by %s stored chunks.",
+            deduplicator.skipped,
+            len(deduplicator.covered_pages),
+        )
+        ids = sorted(deduplicator.covered_pages)
+        for start in range(0, len(ids), self.batch_size):
+            records = self.collection.get(
+                ids=ids[start : start + self.batch_size], include=["metadatas"]
+            )
+            if not records["ids"]:
+                continue
+            self.collection.update(
+                ids=records["ids"],
+                metadatas=[
+                    {
+                        **metadata,
+                        "duplicate_pages": ", ".join(
+                            str(page)
+                            for page in sorted(deduplicator.covered_pages[record_id])
+                        ),
+                    }
+                    for record_id, metadata in zip(records["ids"], records["metadatas"])
+                ],
+            )
+
+    def _summarize_chunks(
+        self,
+        executor: ThreadPoolExecutor,
+        index_builder: IndexBuilder,
+        chunks: Iterable[dict],
+        max_inflight: int,
+    ) -> Iterator[dict]:
+        """
+        Summarizes the chunks on the shared pool, keeping their order. In chapter mode
+        the consecutive chunks of a TOC node are packed into windows of
+        SUMMARY_WINDOW_CHARS and summarized with one chat call per window, otherwise
+        every chunk gets its own call.
+        """
+        if Utils.SUMMARY_MODE != "chapter":
+            yield from _ordered_map(
+                executor,
+                lambda chunk: self._summarize_chunk(index_builder, chunk),
+                chunks,
+                max_inflight,
+            )
+            return
+        for window in _ordered_map(
+            executor,
+            lambda window: self._summarize_window(index_builder, window),
+            self._section_windows(chunks),
+            max_inflight,
+        ):
+            yield from window
+
+    @staticmethod
+    def _section_windows(chunks: Iterable[dict]) -> Iterator[List[dict]]:
+        """Groups consecutive chunks of the same TOC node up to SUMMARY_WINDOW_CHARS."""
+        window, window_chars = [], 0
+        for chunk in chunks:
+            if window and (
+                chunk["toc_index"] != window[-1]["toc_index"]
+                or window_chars + len(chunk["text"]) > Utils.SUMMARY_WINDOW_CHARS
+            ):
+                yield window
+                window, window_chars = [], 0
+            window.append(chunk)
+            window_chars += len(chunk["text"])
+        if window:
+            yield window
+
+    @classmethod
+    def _summarize_window(
+        cls, index_builder: IndexBuilder, window: List[dict]
+    ) -> List[dict]:
+        """Summarizes a window of chunks at once, each one gets the window summary."""
+        summary, topics = index_builder.summarize_section(
+            [chunk["text"] for chunk in window]
+        )
+        return [cls._apply_summary(chunk, summary, topics) for chunk in window]
+
+    @classmethod
+    def _summarize_chunk(cls, index_builder: IndexBuilder, chunk: dict) -> dict:
+        """Adds the summary, topics and the hinted embedding text to a chunk."""
+        summary, topics = index_builder.summarize_segment(chunk["text"])
+        return cls._apply_summary(chunk, summary, topics)
+
+    @staticmethod
+    def _apply_summary(chunk: dict, summary: str, topics: List[str]) -> dict:
+        extra_context = ""
+        if summary:
+            extra_context += f"\n\nSummary: {summary}"
+        if topics:
+            extra_context += f"\nTopics: {', '.join(topics)}"
+        chunk["summary"] = summary
+        chunk["topics"] = topics
+        chunk["embedding_text"] = chunk["text"] + extra_context
+        chunk["enriched"] = True
+        return chunk
+
+    @staticmethod
+    def _raw_chunk(chunk: dict) -> dict:
+        """Prepares a chunk to be embedded as is, the enrichment pass summarizes it."""
+        chunk["summary"] = ""
+        chunk["topics"] = []
+        chunk["embedding_text"] = chunk["text"]
+        chunk["enriched"] = False
+        return chunk
+
+    @staticmethod
+    def _micro_batches(chunks):
+        """
+        Groups chunks into micro-batches for a single /embed call, bounded by count and
+        by total characters so a call never exceeds what the embeddings model can take
+        at once.
+        """
+        pending, pending_chars = [], 0
+        for chunk in chunks:
+            text_length = len(chunk["embedding_text"])
+            if pending and pending_chars + text_length > Utils.EMBED_BATCH_CHARS:
+                yield pending
+                pending, pending_chars = [], 0
+            pending.append(chunk)
+            pending_chars += text_length
+            if len(pending) >= Utils.EMBED_BATCH_SIZE:
+                yield pending
+                pending, pending_chars = [], 0
+        if pending:
+            yield pending
+
+    def _persist(
+        self, embedded: Iterable, index_builder: IndexBuilder
+    ) -> Iterator[int]:
+        """
+        Stores the embedded micro-batches in order, flushing to chromadb every full
+        batch and the remainder at the end. Yields the page of the last chunk of each
+        micro-batch.
+        """
+        batch = self._empty_batch()
+        for pending, embeddings in embedded:
+            batch = self._store_chunks(pending, embeddings, batch, index_builder)
+            yield pending[-1]["page"]
+        # Save remaining embeddings that didnt filled a entire batch
+        if batch["ids"]:
+            Utils.logger.info("Saving remaining embeddings to chromadb....")
+            self._flush_batch(batch, index_builder)
+
+    @staticmethod
+    def _empty_batch() -> dict:
+        return {
             "ids": [],
             "embeddings": [],
             "metadatas": [],
             "documents": [],
             "positions": [],
         }
-        session = requests.Session()
-        index_builder = IndexBuilder(self.book_filename)
-        if resume:
-            index_builder.load_json_index()
-        for text, level, title, page, toc_index, segment_index in self.parse_pdf():
-            if resume and (
-                page < resume_page
-                or (page == resume_page and segment_index <= resume_segment)
-            ):
-                continue
-            if stream:
-                yield f"data: {json.dumps({'progress': f'{page}/{self.book_page_length}'})}\n\n"
-            idx += 1
-            summary, topics = index_builder.summarize_segment(text)
-            extra_context = ""
-            if summary:
-                extra_context += f"\n\nSummary: {summary}"
-            if topics:
-                extra_context += f"\nTopics: {', '.join(topics)}"
-            embedding_text = text + extra_context
-            response = session.post(
-                Utils.OLLAMA_URL + "/embed",
-                json={"model": Utils.EMBEDDINGS_MODEL, "input": embedding_text},
-                timeout=180,
-            )
-            payload = response.json()
-            embeddings = payload.get("embeddings", [])
-            if not embeddings or not embeddings[0]:
+
+    def _embed_texts(self, chunks: List[dict]) -> List[list]:
+        """
+        Embeds a micro-batch of chunks with a single /embed call, ollama returns the
+        vectors in the same order as the input list. If the response doesn't line up
+        with the input the chunks are embedded one by one so no vector is mapped to the
+        wrong chunk. Texts already in the embeddings cache are not sent to ollama.
+
+        Args:
+        chunks (List[dict]): The pending chunks, each with an "embedding_text" key.
+        Returns:
+        List[list]: One embedding per chunk, empty lists for the chunks that failed.
+        """
+        texts = [chunk["embedding_text"] for chunk in chunks]
+        cache = self.embeddings_cache
+        embeddings = cache.get_many(texts) if cache else [None] * len(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fetched = self._request_embeddings(missing_texts)
+            for i, embedding in zip(missing, fetched):
+                embeddings[i] = embedding
+            if cache:
+                cache.put_many(missing_texts, fetched)
+        return [embedding or [] for embedding in embeddings]
+
+    def _request_embeddings(self, texts: List[str]) -> List[list]:
+        """
+        Calls /embed for a list of texts, one by one if the batched call fails or its
+        response is short. A text that still fails gets an empty vector and is skipped,
+        only an open circuit breaker, Ollama being down, stops the ingestion.
+        """
+        try:
+            embeddings = ollama.embed(texts)
+        except OllamaUnavailable:
+            raise
+        except OllamaError as exc:
+            Utils.logger.warning("Batched embed failed, embedding one by one: %s", exc)
+            embeddings = []
+        if len(embeddings) == len(texts):
+            return embeddings
+        Utils.logger.warning(
+            "Batched embed returned %s vectors for %s inputs, embedding one by one.",
+            len(embeddings),
+            len(texts),
+        )
+        embeddings = []
+        for text in texts:
+            try:
+                single = ollama.embed(text)
+            except OllamaUnavailable:
+                raise
+            except OllamaError as exc:
+                Utils.logger.warning("Skipping a chunk that failed to embed: %s", exc)
+                single = []
+            embeddings.append(single[0] if single else [])
+        return embeddings
+
+    def _store_chunks(
+        self,
+        chunks: List[dict],
+        embeddings: List[list],
+        batch: dict,
+        index_builder: IndexBuilder,
+    ) -> dict:
+        """Adds embedded chunks to the chromadb batch, flushing every full batch."""
+        for chunk, embedding in zip(chunks, embeddings):
+            if not embedding:
                 Utils.logger.warning(
                     "Skipping empty embedding for level: %s, page: %s, textln: %s",
-                    level,
-                    page,
-                    len(text),
+                    chunk["level"],
+                    chunk["page"],
+                    len(chunk["text"]),
                 )
                 continue
-            index_builder.add_segment(toc_index, text, summary=summary, topics=topics)
+            index_builder.add_segment(
+                chunk["toc_index"],
+                chunk["text"],
+                summary=chunk["summary"],
+                topics=chunk["topics"],
+            )
             Utils.logger.info(
                 "Adding embeddings for level:   %s, page:  %s, textln:   %s",
-                level,
-                page,
-                len(text),
+                chunk["level"],
+                chunk["page"],
+                len(chunk["text"]),
             )
-            batch["ids"].append(str(idx))
-            batch["embeddings"].extend(embeddings)
-            batch["metadatas"].append({"level": level, "title": title, "page": page})
-            batch["documents"].append(text)
+            batch["ids"].append(self.chunk_id(chunk["page"], chunk["segment"]))
+            batch["embeddings"].append(embedding)
+            batch["metadatas"].append(
+                {
+                    "level": chunk["level"],
+                    "title": chunk["title"],
+                    "page": chunk["page"],
+                    "segment": chunk["segment"],
+                    "toc_index": chunk["toc_index"],
+                    "summary": chunk["summary"],
+                    "topics": ", ".join(chunk["topics"]),
+                    "enriched": chunk["enriched"],
+                }
+            )
+            batch["documents"].append(chunk["text"])
             batch["positions"].append(
-                {"page": page, "segment": segment_index, "toc_index": toc_index}
+                {
+                    "page": chunk["page"],
+                    "segment": chunk["segment"],
+                    "toc_index": chunk["toc_index"],
+                    "idx": chunk["idx"],
+                }
             )
-            if len(batch["ids"]) == batch_size:
+            if len(batch["ids"]) == self.batch_size:
                 Utils.logger.info("Saving a batch to chromadb....")
-                collection.add(
-                    ids=batch["ids"],
-                    embeddings=batch["embeddings"],
-                    metadatas=batch["metadatas"],
-                    documents=batch["documents"],
+                self._flush_batch(batch, index_builder)
+                batch = self._empty_batch()
+        return batch
+
+    def _flush_batch(self, batch: dict, index_builder: IndexBuilder) -> None:
+        """Persists a batch to chromadb and checkpoints its last position."""
+        self.collection.upsert(
+            ids=batch["ids"],
+            embeddings=batch["embeddings"],
+            metadatas=batch["metadatas"],
+            documents=batch["documents"],
+        )
+        index_builder.write_journal()
+        last_position = batch["positions"][-1]
+        self._save_checkpoint(last_position, last_position["idx"])
+
+    @staticmethod
+    def chunk_id(page: int, segment: int) -> str:
+        """Deterministic chromadb id of a chunk, so a page's rows can be targeted."""
+        return f"{page}-{segment}"
+
+    def compute_page_hashes(self) -> dict:
+        """
+        Hashes the text of every page and the table of contents of the book. The same
+        pass writes the page text store read by the assistant and the exam generator.
+
+        Returns:
+        dict: The "toc" hash and the list of "pages" hashes, indexed by page number.
+        """
+        pages = []
+
+        def page_texts(book, header_filter):
+            for page in range(book.page_count):
+                pdf_page = book.load_page(page)
+                text = pdf_page.get_text()
+                pages.append(
+                    hashlib.sha256(text.encode("utf-8", "replace")).hexdigest()
                 )
-                index_builder.write_json_index()
-                index_builder.write_text_index()
-                self._save_checkpoint(batch["positions"][-1], idx)
-                batch = {
-                    "ids": [],
-                    "embeddings": [],
-                    "metadatas": [],
-                    "documents": [],
-                    "positions": [],
-                }
-        # Save remaining embeddings that didnt filled a entire batch
-        if batch["ids"]:
-            Utils.logger.info("Saving remaining embeddings to chromadb....")
-            collection.add(
-                ids=batch["ids"],
-                embeddings=batch["embeddings"],
-                metadatas=batch["metadatas"],
-                documents=batch["documents"],
+                yield (
+                    header_filter.page_text(pdf_page)
+                    if header_filter.signatures
+                    else text
+                )
+
+        with pymupdf.open(f"{Utils.get_data_path()}/{self.book_filename}") as book:
+            toc = self.get_toc(book)
+            header_filter = HeaderFooterFilter(self.book_filename)
+            header_filter.load(book)
+            PageTextStore.write(
+                self.book_filename, page_texts(book, header_filter), book.metadata
+            )
+        toc_hash = hashlib.sha256(json.dumps(toc).encode("utf-8")).hexdigest()
+        return {"toc": toc_hash, "pages": pages}
+
+    @staticmethod
+    def _get_duplicate_pages(collection, pages: Set[int]) -> Set[int]:
+        """
+        Finds the pages whose chunks were skipped as duplicates of chunks stored on the
+        given pages, their text is lost when those pages are deleted so they must be
+        parsed again.
+
+        Args:
+        collection: The vector store of the book.
+        pages (Set[int]): The pages about to be deleted.
+        Returns:
+        Set[int]: The other pages that only had their text through the deleted chunks.
+        """
+        found: Set[int] = set()
+        pending = set(pages)
+        while pending:
+            records = collection.get(
+                where={"page": {"$in": sorted(pending)}}, include=["metadatas"]
+            )
+            duplicates = {
+                int(page)
+                for metadata in records["metadatas"]
+                if metadata and metadata.get("duplicate_pages")
+                for page in str(metadata["duplicate_pages"]).split(",")
+            }
+            pending = duplicates - pages - found
+            found |= pending
+        return found
+
+    def _get_changed_pages(self, page_hashes: dict) -> Optional[Set[int]]:
+        """
+        Diffs the current page hashes against the ones stored by the last ingestion.
+
+        Args:
+        page_hashes (dict): The current hashes as returned by compute_page_hashes.
+        Returns:
+        Optional[Set[int]]: The pages added, removed or modified, None if a full rebuild
+            is needed because there are no stored hashes or the table of contents
+            changed.
+        """
+        stored = self._load_page_hashes()
+        if not stored:
+            Utils.logger.warning("No stored page hashes found. Running a full rebuild.")
+            return None
+        if stored.get("toc") != page_hashes["toc"]:
+            Utils.logger.warning(
+                "The table of contents changed. Running a full rebuild."
             )
-            index_builder.write_json_index()
-            index_builder.write_text_index()
-            self._save_checkpoint(batch["positions"][-1], idx)
-        index_builder.write_json_index()
-        index_builder.write_text_index()
-        self._clear_checkpoint()
-        if stream:
-            yield f"data: {json.dumps({'progress': 'done'})}\n\n"
             return None
-        return collection
+        old_pages, new_pages = stored.get("pages", []), page_hashes["pages"]
+        return {
+            page
+            for page in range(max(len(old_pages), len(new_pages)))
+            if page >= len(old_pages)
+            or page >= len(new_pages)
+            or old_pages[page] != new_pages[page]
+        }
+
+    def _rebuild_index_nodes(
+        self, index_builder: IndexBuilder, changed_pages: Set[int]
+    ) -> None:
+        """
+        Recomputes the summaries and topics of the index nodes that own changed pages
+        and of the chapters above them, replaying the per chunk summaries stored in the
+        collection metadata in page order. The chapters get their rollups again
+        afterwards.
+        """
+        affected = index_builder.with_ancestors(
+            [self.page_toc[page] for page in changed_pages if page < len(self.page_toc)]
+        )
+        if not affected:
+            return
+        records = self.collection.get(
+            where={"toc_index": {"$in": affected}},
+            include=["documents", "metadatas"],
+        )
+        index_builder.reset_nodes(affected)
+        rows = sorted(
+            zip(records.get("documents") or [], records.get("metadatas") or []),
+            key=lambda row: (row[1].get("page", 0), row[1].get("segment", 0)),
+        )
+        for document, metadata in rows:
+            topics = str(metadata.get("topics", ""))
+            index_builder.add_segment(
+                int(metadata["toc_index"]),
+                document,
+                summary=str(metadata.get("summary", "")),
+                topics=[topic for topic in topics.split(", ") if topic],
+            )
+
+    def _enrichment_state_path(self):
+        output_path = Utils.get_output_path(self.output_folder, create=True)
+        return output_path / "enrichment.json"
+
+    def _load_enrichment_state(self) -> dict:
+        state_path = self._enrichment_state_path()
+        if not state_path.exists():
+            return {}
+        try:
+            with open(state_path, "r", encoding="utf-8") as handle:
+                return json.load(handle)
+        except Exception as exc:
+            Utils.logger.warning("Failed to load enrichment state: %s", exc)
+            return {}
+
+    def _save_enrichment_state(self, status: str, enriched: int, total: int) -> None:
+        payload = {"status": status, "enriched": enriched, "total": total}
+        try:
+            with open(self._enrichment_state_path(), "w", encoding="utf-8") as handle:
+                json.dump(payload, handle, indent=2)
+                handle.write("\n")
+        except Exception as exc:
+            Utils.logger.warning("Failed to save enrichment state: %s", exc)
+
+    def _clear_enrichment_state(self) -> None:
+        state_path = self._enrichment_state_path()
+        try:
+            if state_path.exists():
+                state_path.unlink()
+        except Exception as exc:
+            Utils.logger.warning("Failed to clear enrichment state: %s", exc)
+
+    def _page_hashes_path(self, pending: bool = False):
+        output_path = Utils.get_output_path(self.output_folder, create=True)
+        if pending:
+            return output_path / "page_hashes.pending.json"
+        return output_path / "page_hashes.json"
+
+    def _load_page_hashes(self, pending: bool = False) -> dict:
+        page_hashes_path = self._page_hashes_path(pending)
+        if not page_hashes_path.exists():
+            return {}
+        try:
+            with open(page_hashes_path, "r", encoding="utf-8") as handle:
+                return json.load(handle)
+        except Exception as exc:
+            Utils.logger.warning("Failed to load page hashes: %s", exc)
+            return {}
+
+    def _save_page_hashes(self, page_hashes: dict, pending: bool = False) -> None:
+        try:
+            with open(self._page_hashes_path(pending), "w", encoding="utf-8") as handle:
+                json.dump(page_hashes, handle, indent=2)
+                handle.write("\n")
+        except Exception as exc:
+            Utils.logger.warning("Failed to save page hashes: %s", exc)
 
     def _checkpoint_path(self):
         output_path = Utils.get_output_path(self.output_folder, create=True)
@@ -290,10 +1225,13 @@ class EmbeddingsGenerator:
             Utils.logger.warning("Failed to save checkpoint: %s", exc)
 
     def _clear_checkpoint(self) -> None:
-        checkpoint_path = self._checkpoint_path()
         try:
-            if checkpoint_path.exists():
-                checkpoint_path.unlink()
+            for checkpoint_path in (
+                self._checkpoint_path(),
+                self._page_hashes_path(pending=True),
+            ):
+                if checkpoint_path.exists():
+                    checkpoint_path.unlink()
         except Exception as exc:
             Utils.logger.warning("Failed to clear checkpoint: %s", exc)
 
@@ -301,8 +1239,14 @@ class EmbeddingsGenerator:
         checkpoint = self._load_checkpoint()
         page_count = 0
         try:
-            with pymupdf.open(f"{Utils.get_data_path()}/{self.book_filename}") as book:
-                page_count = book.page_count
+            if PageTextStore.exists(self.book_filename):
+                with resource_pool.lease(self.output_folder):
+                    page_count = len(resource_pool.pages(self.book_filename))
+            else:
+                with pymupdf.open(
+                    f"{Utils.get_data_path()}/{self.book_filename}"
+                ) as book:
+                    page_count = book.page_count
         except Exception as exc:
             Utils.logger.warning("Failed to read page count: %s", exc)
 
@@ -322,4 +1266,5 @@ class EmbeddingsGenerator:
             "parsed_pages": parsed_pages,
             "has_checkpoint": has_checkpoint,
             "is_complete": is_complete,
+            "enrichment": self._load_enrichment_state(),
         }
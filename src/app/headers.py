@@ -0,0 +1,169 @@
+"""Detection of running headers and footers repeated across the pages of a book."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Set
+
+import pymupdf
+
+from .utils import Utils
+
+
+class HeaderFooterFilter:
+    """
+    Finds the text blocks that recur at the same height in the top or bottom margin of
+    many pages (page numbers, running chapter titles) and drops them from the page
+    blocks before they are segmented or pasted into prompts. Digits are masked so
+    "Page 12" and "Page 13" count as the same block. The detection runs once per book
+    file and is cached in its output folder, keyed by the hash of the file.
+    """
+
+    CACHE_FILENAME = "headers_footers.json"
+
+    def __init__(self, book_filename: str, signatures: Optional[Set[str]] = None):
+        self.book_filename = book_filename
+        self.output_folder = Utils.strip_extension(book_filename)
+        self.signatures: Set[str] = set(signatures or ())
+
+    def load(self, book: pymupdf.Document, detect: bool = True) -> Set[str]:
+        """
+        Loads the repeated block signatures of the book from the cache, detecting and
+        caching them first if needed.
+
+        Args:
+        book (pymupdf.Document): The opened book.
+        detect (bool): Whether to scan the book when there is no valid cache, if False
+            the filter is left empty instead.
+        Returns:
+        Set[str]: The signatures of the blocks to drop.
+        """
+        if Utils.HEADER_FOOTER_MIN_PAGES <= 0:
+            self.signatures = set()
+            return self.signatures
+        cache_path = (
+            Utils.get_output_path(self.output_folder, create=True) / self.CACHE_FILENAME
+        )
+        file_hash = self.file_hash(book)
+        min_pages = self.min_pages(book.page_count)
+        if cache_path.exists() and file_hash:
+            try:
+                with open(cache_path, "r", encoding="utf-8") as handle:
+                    cached = json.load(handle)
+                if (
+                    cached.get("file_hash") == file_hash
+                    and cached.get("min_pages") == min_pages
+                ):
+                    self.signatures = set(cached.get("signatures", []))
+                    return self.signatures
+            except Exception as exc:
+                Utils.logger.warning("Failed to load headers/footers cache: %s", exc)
+        if not detect:
+            self.signatures = set()
+            return self.signatures
+        self.signatures = self.detect(book)
+        Utils.logger.info(
+            "Detected %s repeated header/footer blocks in %s.",
+            len(self.signatures),
+            self.book_filename,
+        )
+        try:
+            with open(cache_path, "w", encoding="utf-8") as handle:
+                json.dump(
+                    {
+                        "file_hash": file_hash,
+                        "min_pages": min_pages,
+                        "signatures": sorted(self.signatures),
+                    },
+                    handle,
+                    indent=2,
+                )
+                handle.write("\n")
+        except Exception as exc:
+            Utils.logger.warning("Failed to save headers/footers cache: %s", exc)
+        return self.signatures
+
+    @staticmethod
+    def file_hash(book: pymupdf.Document) -> Optional[str]:
+        """Returns the sha256 of the book file, None for a book opened from memory."""
+        if not book.name:
+            return None
+        digest = hashlib.sha256()
+        with open(book.name, "rb") as handle:
+            for block in iter(lambda: handle.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def min_pages(page_count: int) -> int:
+        """
+        Returns on how many pages a margin block must recur to be dropped: the share
+        HEADER_FOOTER_MIN_SHARE of the pages, at least HEADER_FOOTER_MIN_PAGES, so a
+        heading repeated a few times in a long book is kept.
+        """
+        return max(
+            Utils.HEADER_FOOTER_MIN_PAGES,
+            math.ceil(page_count * Utils.HEADER_FOOTER_MIN_SHARE),
+        )
+
+    @classmethod
+    def detect(cls, book: pymupdf.Document) -> Set[str]:
+        """Returns the margin block signatures found on at least min_pages pages."""
+        counts = Counter()
+        for page in book:
+            height = page.rect.height
+            counts.update(
+                {
+                    signature
+                    for signature in (
+                        cls.signature(block, height)
+                        for block in page.get_text("blocks") or []
+                    )
+                    if signature
+                }
+            )
+        min_pages = cls.min_pages(book.page_count)
+        return {signature for signature, pages in counts.items() if pages >= min_pages}
+
+    @staticmethod
+    def signature(block: tuple, page_height: float) -> Optional[str]:
+        """
+        Returns the signature of a short text block in the top or bottom margin: the
+        margin, its 2% height band and the text with digits masked. None for any other
+        block.
+        """
+        if len(block) > 6 and block[6] != 0:  # Image block
+            return None
+        text = re.sub(r"\s+", " ", str(block[4])).strip().lower()
+        if not text or len(text) > 200 or not page_height:
+            return None
+        margin = page_height * Utils.HEADER_FOOTER_MARGIN
+        if block[3] <= margin:
+            zone = "top"
+        elif block[1] >= page_height - margin:
+            zone = "bottom"
+        else:
+            return None
+        band = int(block[1] / page_height * 50)
+        return f"{zone}:{band}:{re.sub(r'[0-9]+', '#', text)}"
+
+    def filter_blocks(self, blocks: Iterable[tuple], page_height: float) -> List[tuple]:
+        """Drops the repeated header/footer blocks from the blocks of a page."""
+        if not self.signatures:
+            return list(blocks)
+        return [
+            block
+            for block in blocks
+            if self.signature(block, page_height) not in self.signatures
+        ]
+
+    def page_text(self, page: pymupdf.Page) -> str:
+        """Returns the text of a page without its repeated header/footer blocks."""
+        if not self.signatures:
+            return page.get_text()
+        blocks = self.filter_blocks(page.get_text("blocks") or [], page.rect.height)
+        return "\n".join(str(block[4]).strip() for block in blocks)
@@ -0,0 +1,252 @@
+"""Approximate nearest neighbour store built directly on hnswlib."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Union
+
+import hnswlib
+import numpy as np
+
+from .flat_store import FlatVectorStore
+from .utils import Utils
+
+
+class HnswVectorStore(FlatVectorStore):
+    """
+    Flat store with an hnswlib graph on top: the memory-mapped vectors and the sqlite
+    sidecar stay the source of truth, searches walk the graph instead of scanning every
+    row. The graph is saved next to the vectors and rebuilt from them when it is missing
+    or was not saved after the last change, so an interrupted ingestion never leaves a
+    stale index behind. Distances follow the graph space: cosine, inner product or
+    squared L2 of the unit vectors.
+
+    hnswlib keeps its own float32 copy of every vector in the graph, so quantization
+    would not reduce resident memory here: the store always runs unquantized, use the
+    flat backend to quantize a book.
+    """
+
+    INDEX_FILENAME = "vectors.hnsw"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        name: str = "embeddings",
+        space: str = "cosine",
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        quantization: Optional[str] = None,
+        rescore: int = 4,
+    ):
+        self.space = space
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index: Optional[hnswlib.Index] = None
+        super().__init__(path, name=name, quantization="none", rescore=rescore)
+        # Stores quantized before the setting was ignored drop their compressed copy
+        super().quantize("none")
+        self.quantize(quantization or "none")
+
+    def quantize(self, quantization: str) -> None:
+        """Ignores quantization, the hnswlib graph holds float32 vectors anyway."""
+        if quantization.lower() != "none":
+            Utils.logger.warning(
+                "The hnsw store does not support %s quantization, keeping float32.",
+                quantization,
+            )
+
+    @classmethod
+    def remove(cls, path: Union[str, Path]) -> None:
+        """Deletes the store files and the graph from the folder."""
+        super().remove(path)
+        index_path = Path(path) / cls.INDEX_FILENAME
+        if index_path.exists():
+            index_path.unlink()
+
+    def _load(self) -> None:
+        super()._load()
+        self._index = None
+        index_path = self.path / self.INDEX_FILENAME
+        if not self.dim:
+            return
+        if (
+            index_path.exists()
+            and self._setting("hnsw_dirty") == "0"
+            and self._setting("hnsw_params") == self._params()
+        ):
+            index = hnswlib.Index(space=self.space, dim=self.dim)
+            index.load_index(str(index_path), max_elements=max(self.total_rows, 16))
+            if index.get_current_count() == self.total_rows:
+                index.set_ef(self.ef_search)
+                self._index = index
+                return
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """Builds the graph again from the stored vectors of the live records."""
+        with self._lock:
+            index = hnswlib.Index(space=self.space, dim=self.dim)
+            index.init_index(
+                max_elements=max(self.total_rows, 16),
+                M=self.m,
+                ef_construction=self.ef_construction,
+            )
+            rows = sorted(self._ids)
+            if rows:
+                index.add_items(np.asarray(self._matrix[rows]), rows)
+            index.set_ef(self.ef_search)
+            self._index = index
+            self._mark_dirty()
+            self._set_setting("hnsw_params", self._params())
+
+    def persist(self) -> None:
+        """Saves the graph so the next open does not rebuild it."""
+        with self._lock:
+            if self._index is None:
+                return
+            self._index.save_index(str(self.path / self.INDEX_FILENAME))
+            self._set_setting("hnsw_dirty", "0")
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings,
+        metadatas: Optional[Sequence[dict]] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Inserts or replaces the records and adds their vectors to the graph."""
+        with self._lock:
+            super().upsert(ids, embeddings, metadatas=metadatas, documents=documents)
+            self._index_rows([self._rows[record_id] for record_id in ids])
+
+    def update(
+        self,
+        ids: Sequence[str],
+        embeddings=None,
+        metadatas: Optional[Sequence[dict]] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Updates stored records, moving their graph nodes when the vectors change."""
+        with self._lock:
+            super().update(
+                ids, embeddings=embeddings, metadatas=metadatas, documents=documents
+            )
+            if embeddings is not None:
+                self._index_rows(
+                    [
+                        self._rows[record_id]
+                        for record_id in ids
+                        if record_id in self._rows
+                    ]
+                )
+
+    def delete(
+        self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None
+    ) -> None:
+        """Deletes records, their graph nodes are marked deleted until compact."""
+        with self._lock:
+            before = set(self._ids)
+            super().delete(ids=ids, where=where)
+            removed = before - set(self._ids)
+            if self._index is not None and removed:
+                for record_row in removed:
+                    self._index.mark_deleted(record_row)
+                self._mark_dirty()
+
+    def compact(self) -> None:
+        """Drops the deleted rows, rebuilding the graph if any, and saves it."""
+        with self._lock:
+            compacted = len(self._ids) != self.total_rows
+            super().compact()
+            if not compacted and self._index is None and self.dim:
+                self.rebuild()
+            self.persist()
+
+    def close(self) -> None:
+        """Saves the graph and closes the sidecar connection."""
+        with self._lock:
+            if self._setting("hnsw_dirty") != "0":
+                self.persist()
+        super().close()
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Iterable[str] = ("metadatas", "documents", "distances"),
+    ) -> dict:
+        """
+        Approximate top n_results search for one or several query vectors at once, falls
+        back to the exact search when the graph cannot return enough neighbours.
+        """
+        include = list(include)
+        queries = self._normalize(query_embeddings)
+        with self._lock:
+            if where is None:
+                allowed = None
+                candidates = len(self._ids)
+            else:
+                allowed = set(np.flatnonzero(self._where_mask(where)).tolist())
+                candidates = len(allowed)
+            top_k = min(n_results, candidates)
+            if self._index is None or not top_k:
+                return super().query(queries, n_results, where, include)
+            self._index.set_ef(max(self.ef_search, top_k))
+            try:
+                labels, distances = self._index.knn_query(
+                    queries,
+                    k=top_k,
+                    filter=None if allowed is None else allowed.__contains__,
+                )
+            except RuntimeError:
+                return super().query(queries, n_results, where, include)
+            finally:
+                self._index.set_ef(self.ef_search)
+            results = {"ids": []}
+            for field in include:
+                results[field] = []
+            for rows, row_distances in zip(labels.tolist(), distances.tolist()):
+                records = self._records(rows, include)
+                results["ids"].append(records["ids"])
+                for field in include:
+                    results[field].append(
+                        [float(value) for value in row_distances]
+                        if field == "distances"
+                        else records[field]
+                    )
+            return results
+
+    def _index_rows(self, rows: Sequence[int]) -> None:
+        if not rows:
+            return
+        if self._index is None:
+            self.rebuild()
+            return
+        if self.total_rows > self._index.get_max_elements():
+            self._index.resize_index(
+                max(self.total_rows, 2 * self._index.get_max_elements())
+            )
+        self._index.add_items(np.asarray(self._matrix[list(rows)]), list(rows))
+        self._mark_dirty()
+
+    def _params(self) -> str:
+        return f"{self.space}:{self.m}:{self.ef_construction}"
+
+    def _mark_dirty(self) -> None:
+        if self._setting("hnsw_dirty") != "1":
+            self._set_setting("hnsw_dirty", "1")
+
+    def _setting(self, key: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT value FROM settings WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, key: str, value: str) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value)
+        )
+        self._connection.commit()
@@ -0,0 +1,108 @@
+"""Per-book approximate nearest neighbour index settings."""
+
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Optional, Union
+
+from .flat_store import QUANTIZATIONS
+from .utils import Utils
+
+SPACES = ("cosine", "ip", "l2")
+
+
+@dataclass(frozen=True)
+class IndexSettings:
+    """
+    HNSW settings of a book: the distance space (None keeps the backend default, l2 for
+    Chroma and cosine for hnsw), the graph degree M, and the candidate list sizes used
+    while building (ef_construction) and searching (ef_search). Higher values buy recall
+    with memory, build time and latency. The flat backend also keeps the vector
+    quantization here, hnsw ignores it. They live in the book output folder so every
+    book can be tuned and reindexed on its own.
+    """
+
+    FILENAME = "index_settings.json"
+
+    space: Optional[str] = None
+    m: int = 16
+    ef_construction: int = 200
+    ef_search: int = 64
+    quantization: str = "none"
+
+    def __post_init__(self):
+        if self.space is not None and self.space not in SPACES:
+            raise ValueError(
+                f"Unknown index space '{self.space}', "
+                f"valid values = {', '.join(SPACES)}"
+            )
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization '{self.quantization}', "
+                f"valid values = {', '.join(QUANTIZATIONS)}"
+            )
+        if min(self.m, self.ef_construction, self.ef_search) < 1:
+            raise ValueError("M, ef_construction and ef_search must be positive")
+
+    @classmethod
+    def defaults(cls) -> "IndexSettings":
+        """Returns the settings from the HNSW_* and VECTOR_QUANTIZATION variables."""
+        return cls(
+            space=Utils.HNSW_SPACE,
+            m=Utils.HNSW_M,
+            ef_construction=Utils.HNSW_EF_CONSTRUCTION,
+            ef_search=Utils.HNSW_EF_SEARCH,
+            quantization=Utils.VECTOR_QUANTIZATION,
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "IndexSettings":
+        """Loads the settings saved in the book folder, the defaults if none."""
+        settings_path = Path(path) / cls.FILENAME
+        if settings_path.exists():
+            try:
+                with open(settings_path, "r", encoding="utf-8") as handle:
+                    return replace(cls.defaults(), **json.load(handle))
+            except (OSError, TypeError, ValueError) as exc:
+                Utils.logger.warning("Failed to load index settings: %s", exc)
+        return cls.defaults()
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Saves the settings to the book folder."""
+        Path(path).mkdir(parents=True, exist_ok=True)
+        with open(Path(path) / self.FILENAME, "w", encoding="utf-8") as handle:
+            json.dump(asdict(self), handle, indent=2)
+            handle.write("\n")
+
+    def update(
+        self,
+        space: Optional[str] = None,
+        m: Optional[int] = None,
+        ef_construction: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        quantization: Optional[str] = None,
+    ) -> "IndexSettings":
+        """Returns a copy with the given values changed, None keeps a value."""
+        changes = {
+            "space": space,
+            "m": m,
+            "ef_construction": ef_construction,
+            "ef_search": ef_search,
+            "quantization": quantization,
+        }
+        return replace(
+            self, **{key: value for key, value in changes.items() if value is not None}
+        )
+
+    def chroma_metadata(self) -> dict:
+        """Returns the settings as Chroma collection metadata."""
+        metadata = {
+            "hnsw:M": self.m,
+            "hnsw:construction_ef": self.ef_construction,
+            "hnsw:search_ef": self.ef_search,
+        }
+        if self.space is not None:
+            metadata["hnsw:space"] = self.space
+        return metadata
@@ -8,8 +8,8 @@ from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Set, Tuple
 
 import pymupdf
-import requests
 
+from .ollama_client import ollama
 from .utils import Utils
 
 
@@ -55,6 +55,7 @@ class IndexBuilder:
         self.output_folder = Utils.strip_extension(book_filename)
         self.nodes: List[IndexNode] = []
         self.root_nodes: List[IndexNode] = []
+        self._dirty: Set[int] = set()
         self._build_nodes_from_toc()
 
     def _build_nodes_from_toc(self) -> None:
@@ -120,11 +121,94 @@ class IndexBuilder:
         node = self.nodes[toc_index]
         node.add_summary(summary)
         node.add_topics(topics)
+        self._dirty.add(toc_index)
+
+    def reset_nodes(self, toc_indexes: List[int]) -> None:
+        """Clears the summary and topics of the given nodes so they can be rebuilt."""
+        for toc_index in toc_indexes:
+            if 0 <= toc_index < len(self.nodes):
+                self.nodes[toc_index].summary_lines = []
+                self.nodes[toc_index].topics = set()
+                self._dirty.add(toc_index)
+
+    def with_ancestors(self, toc_indexes: List[int]) -> List[int]:
+        """
+        Returns the given nodes and every chapter above them, the nodes whose summary
+        and topics change when the text of the given nodes does.
+        """
+        parents: Dict[int, IndexNode] = {}
+        for node in self.nodes:
+            for child in node.children:
+                parents[child.index] = node
+        found: Set[int] = set()
+        for toc_index in toc_indexes:
+            if not 0 <= toc_index < len(self.nodes):
+                continue
+            found.add(toc_index)
+            parent = parents.get(toc_index)
+            while parent is not None:
+                found.add(parent.index)
+                parent = parents.get(parent.index)
+        return sorted(found)
 
     def summarize_segment(self, segment_text: str) -> Tuple[str, List[str]]:
         """Expose summarization for embedding hints."""
         return self._summarize_segment(segment_text)
 
+    def summarize_section(self, texts: List[str]) -> Tuple[str, List[str]]:
+        """
+        Summarizes several consecutive chunks of the same TOC node with a single chat
+        call.
+
+        Args:
+        texts (List[str]): The chunk texts, in reading order.
+        Returns:
+        Tuple[str, List[str]]: The summary and topics of the whole section.
+        """
+        return self._request_summary(
+            "Summarize the book section in 1 short sentence and list 3-8 topic "
+            "keywords.",
+            "Section",
+            "\n\n".join(texts),
+        )
+
+    def rollup_summaries(self, toc_indexes: Optional[List[int]] = None) -> None:
+        """
+        Rolls the summaries and topics of the subchapters up to their parents, deepest
+        first, so every chapter gets an overview without summarizing its text a second
+        time.
+
+        Args:
+        toc_indexes (List[int], optional): Only roll up to these nodes and their
+            ancestors, defaults to every node with children. Their own summaries and
+            topics must have been reset and replayed first, see with_ancestors, so the
+            rollups describe the current text of their subchapters.
+        """
+        targets = None
+        if toc_indexes is not None:
+            targets = set(self.with_ancestors(toc_indexes))
+        for node in sorted(self.nodes, key=lambda item: -item.level):
+            if not node.children or (targets is not None and node.index not in targets):
+                continue
+            for child in node.children:
+                node.add_topics(sorted(child.topics))
+            self._dirty.add(node.index)
+            child_summaries = [
+                f"- {child.title}: {' '.join(child.summary_lines)}"
+                for child in node.children
+                if child.summary_lines
+            ]
+            if not child_summaries or len(node.summary_lines) >= 4:
+                continue
+            summary, topics = self._request_summary(
+                "Summarize the chapter in 1 short sentence from the summaries of its "
+                "sections and list 3-8 topic keywords.",
+                f"Chapter {node.title}",
+                "\n".join(child_summaries),
+            )
+            node.add_summary(summary)
+            node.add_topics(topics)
+
     def write_text_index(self, file_name: str = "topics_index.txt") -> None:
         output_path = Utils.get_output_path(self.output_folder, create=True)
         file_path = output_path / file_name
@@ -151,42 +235,99 @@ class IndexBuilder:
             json.dump(payload, handle, indent=2, ensure_ascii=True)
             handle.write("\n")
 
-    def load_json_index(self, file_name: str = "topics_index.json") -> bool:
+    def write_journal(self, file_name: str = "topics_index.journal.jsonl") -> None:
+        """
+        Appends the nodes changed since the last write to the index journal, one JSON
+        line per node, so periodic saves during ingestion cost the size of the changes
+        instead of the whole tree. compact_index folds the journal back into the json
+        and text indexes.
+        """
+        if not self._dirty:
+            return
+        output_path = Utils.get_output_path(self.output_folder, create=True)
+        with open(output_path / file_name, "a", encoding="utf-8") as handle:
+            for toc_index in sorted(self._dirty):
+                entry = self._node_to_dict(self.nodes[toc_index])
+                entry.pop("children")
+                handle.write(json.dumps(entry, ensure_ascii=True) + "\n")
+        self._dirty.clear()
+
+    def compact_index(self, file_name: str = "topics_index.journal.jsonl") -> None:
+        """Writes the full json and text indexes and drops the folded journal."""
+        self.write_json_index()
+        self.write_text_index()
+        self.discard_journal(file_name)
+
+    def discard_journal(self, file_name: str = "topics_index.journal.jsonl") -> None:
+        output_path = Utils.get_output_path(self.output_folder, create=True)
+        journal_path = output_path / file_name
+        if journal_path.exists():
+            journal_path.unlink()
+        self._dirty.clear()
+
+    def load_json_index(
+        self,
+        file_name: str = "topics_index.json",
+        journal_name: str = "topics_index.journal.jsonl",
+    ) -> bool:
         output_path = Utils.get_output_path(self.output_folder, create=True)
         file_path = output_path / file_name
-        if not file_path.exists():
-            return False
-        try:
-            with open(file_path, "r", encoding="utf-8") as handle:
-                payload = json.load(handle)
-        except Exception as exc:
-            Utils.logger.warning("Failed to load index json: %s", exc)
-            return False
-        entries = payload.get("entries", [])
-        if not isinstance(entries, list):
+        loaded = False
+        if file_path.exists():
+            try:
+                with open(file_path, "r", encoding="utf-8") as handle:
+                    payload = json.load(handle)
+            except Exception as exc:
+                Utils.logger.warning("Failed to load index json: %s", exc)
+                payload = {}
+            entries = payload.get("entries", [])
+            if isinstance(entries, list):
+                flattened: Dict[Tuple[str, str, int, int, int], Dict[str, object]] = {}
+                stack = list(entries)
+                while stack:
+                    entry = stack.pop()
+                    if not isinstance(entry, dict):
+                        continue
+                    flattened[self._entry_key(entry)] = entry
+                    children = entry.get("children", [])
+                    if isinstance(children, list):
+                        stack.extend(children)
+                self._apply_entries(flattened)
+                loaded = True
+        return self._replay_journal(output_path / journal_name) or loaded
+
+    def _replay_journal(self, journal_path) -> bool:
+        """Applies the journal entries in order, the last entry of a node wins."""
+        if not journal_path.exists():
             return False
+        latest: Dict[Tuple[str, str, int, int, int], Dict[str, object]] = {}
+        with open(journal_path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Line cut short by an interrupted write
+                if isinstance(entry, dict):
+                    latest[self._entry_key(entry)] = entry
+        self._apply_entries(latest)
+        return bool(latest)
 
-        flattened: Dict[Tuple[str, str, int, int, int], Dict[str, object]] = {}
-        stack = list(entries)
-        while stack:
-            entry = stack.pop()
-            if not isinstance(entry, dict):
-                continue
-            key = (
-                str(entry.get("number", "")),
-                str(entry.get("title", "")),
-                int(entry.get("page_start", 0)),
-                int(entry.get("page_end", 0)),
-                int(entry.get("level", 0)),
-            )
-            flattened[key] = entry
-            children = entry.get("children", [])
-            if isinstance(children, list):
-                stack.extend(children)
+    @staticmethod
+    def _entry_key(entry: Dict[str, object]) -> Tuple[str, str, int, int, int]:
+        return (
+            str(entry.get("number", "")),
+            str(entry.get("title", "")),
+            int(entry.get("page_start", 0)),
+            int(entry.get("page_end", 0)),
+            int(entry.get("level", 0)),
+        )
 
+    def _apply_entries(
+        self, entries: Dict[Tuple[str, str, int, int, int], Dict[str, object]]
+    ) -> None:
         for node in self.nodes:
             key = (node.number, node.title, node.page_start, node.page_end, node.level)
-            entry = flattened.get(key)
+            entry = entries.get(key)
             if not entry:
                 continue
             summary_lines = entry.get("summary_lines")
@@ -198,7 +339,6 @@ class IndexBuilder:
             topics = entry.get("topics", [])
             if isinstance(topics, list):
                 node.topics = {str(topic) for topic in topics if str(topic)}
-        return True
 
     def _render_node(self, node: IndexNode, lines: List[str], indent: int) -> None:
         pad = " " * indent
@@ -228,26 +368,28 @@ class IndexBuilder:
         }
 
     def _summarize_segment(self, segment_text: str) -> Tuple[str, List[str]]:
+        return self._request_summary(
+            "Summarize the segment in 1 short sentence and list 3-8 topic keywords.",
+            "Segment",
+            segment_text,
+        )
+
+    def _request_summary(
+        self, instruction: str, label: str, text: str
+    ) -> Tuple[str, List[str]]:
         if not Utils.CHAT_MODEL:
             return "", []
         prompt = (
-            "Summarize the segment in 1 short sentence and list 3-8 topic keywords.\n"
+            f"{instruction}\n"
             "Return only JSON with keys: summary (string), topics (array of strings).\n"
-            "Segment:\n"
-            f"{segment_text}"
+            f"{label}:\n"
+            f"{text}"
         )
+        options = {"temperature": 0}
+        if Utils.SUMMARY_NUM_CTX > 0:
+            options["num_ctx"] = Utils.SUMMARY_NUM_CTX
         try:
-            response = requests.post(
-                Utils.OLLAMA_URL + "/generate",
-                json={
-                    "model": Utils.CHAT_MODEL,
-                    "options": {"temperature": 0},
-                    "stream": False,
-                    "prompt": prompt,
-                },
-                timeout=120,
-            )
-            raw = response.json().get("response", "").strip()
+            raw = ollama.generate(prompt, options, task="summary").strip()
             data = self._safe_json(raw)
             if not data:
                 return "", []
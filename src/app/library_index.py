@@ -0,0 +1,635 @@
+"""Library-wide IVF-PQ index over the embeddings of every ingested book."""
+
+import argparse
+import json
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.ollama_client import ollama
+from app.utils import Utils
+from app.vector_store import open_store, store_exists
+
+LIBRARY_FOLDER = "_library"
+_KMEANS_BLOCK_ROWS = 16384
+# Labels looked up per query, below the host parameter limit of older sqlite builds
+_ENTRIES_BATCH = 900
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd's k-means in NumPy, starting from k random points. Distances are computed in
+    blocks so large training sets never materialize an n x k float64 matrix, and
+    clusters that end up empty are reseeded with random points.
+
+    Args:
+    data (np.ndarray): The n x d training vectors.
+    k (int): The number of centroids, at most n.
+    iterations (int): The number of assignment/update rounds.
+    seed (int): The random seed.
+    Returns:
+    np.ndarray: The k x d centroids.
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign(data, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.add.reduceat(
+            data[np.argsort(assignments, kind="stable")], starts[filled], axis=0
+        )
+        centroids[filled] = sums / counts[filled, None]
+        if not filled.all():
+            centroids[~filled] = data[rng.choice(len(data), size=int((~filled).sum()))]
+    return centroids
+
+
+def assign(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Returns the index of the nearest centroid (L2) of every row."""
+    squared = (centroids.astype(np.float32) ** 2).sum(axis=1)
+    assignments = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), _KMEANS_BLOCK_ROWS):
+        block = data[start : start + _KMEANS_BLOCK_ROWS]
+        distances = squared[None, :] - 2 * (block @ centroids.T)
+        assignments[start : start + len(block)] = distances.argmin(axis=1)
+    return assignments
+
+
+class IVFPQIndex:
+    """
+    Inverted file index with product quantized residuals. A coarse k-means quantizer
+    splits the vectors into nlist lists, and every vector is stored in its list as m one
+    byte codes of its residual to the list centroid, one per sub-space of dim / m
+    dimensions. A search scans the nprobe lists closest to the query, scoring codes with
+    per sub-space lookup tables, so a million 1024-d vectors take about m MB and a query
+    touches a few thousand codes. Vectors are expected L2 normalized, distances are
+    returned as cosine distances.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        list_offsets: Optional[np.ndarray] = None,
+        codes: Optional[np.ndarray] = None,
+        labels: Optional[np.ndarray] = None,
+    ):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+        self.nlist = len(self.centroids)
+        self.m = len(self.codebooks)
+        self.dim = self.centroids.shape[1]
+        self.sub_dim = self.dim // self.m
+        self.list_offsets = (
+            list_offsets
+            if list_offsets is not None
+            else np.zeros(self.nlist + 1, dtype=np.int64)
+        )
+        self.codes = (
+            codes if codes is not None else np.zeros((0, self.m), dtype=np.uint8)
+        )
+        self.labels = labels if labels is not None else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def train(
+        cls,
+        sample: np.ndarray,
+        nlist: int,
+        m: int,
+        iterations: int = 20,
+        seed: int = 0,
+    ) -> "IVFPQIndex":
+        """
+        Trains the coarse quantizer and the residual codebooks on a sample of vectors.
+
+        Args:
+        sample (np.ndarray): The training vectors.
+        nlist (int): The number of inverted lists, capped at the sample size.
+        m (int): The number of sub-quantizers, lowered to the nearest divisor of the
+            dimension.
+        iterations (int): The k-means rounds.
+        seed (int): The random seed.
+        Returns:
+        IVFPQIndex: An empty trained index.
+        """
+        sample = np.asarray(sample, dtype=np.float32)
+        dim = sample.shape[1]
+        m = max(divisor for divisor in range(1, min(m, dim) + 1) if dim % divisor == 0)
+        centroids = kmeans(sample, min(nlist, len(sample)), iterations, seed)
+        residuals = sample - centroids[assign(sample, centroids)]
+        sub_dim = dim // m
+        codebooks = np.stack(
+            [
+                kmeans(
+                    residuals[:, part * sub_dim : (part + 1) * sub_dim],
+                    min(256, len(sample)),
+                    iterations,
+                    seed + part + 1,
+                )
+                for part in range(m)
+            ]
+        )
+        if codebooks.shape[1] < 256:
+            padding = np.full(
+                (m, 256 - codebooks.shape[1], sub_dim), np.inf, dtype=np.float32
+            )
+            codebooks = np.concatenate([codebooks, padding], axis=1)
+        return cls(centroids, codebooks)
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the list of every vector and the PQ codes of its residual."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        lists = assign(vectors, self.centroids)
+        residuals = vectors - self.centroids[lists]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for part in range(self.m):
+            codebook = self.codebooks[part]
+            finite = np.isfinite(codebook[:, 0])
+            codes[:, part] = assign(
+                residuals[:, part * self.sub_dim : (part + 1) * self.sub_dim],
+                codebook[finite],
+            )
+        return lists, codes
+
+    def add_encoded(
+        self, lists: np.ndarray, codes: np.ndarray, labels: np.ndarray
+    ) -> None:
+        """Adds already encoded vectors, keeping the codes grouped by list."""
+        all_lists = np.concatenate(
+            [np.repeat(np.arange(self.nlist), np.diff(self.list_offsets)), lists]
+        )
+        order = np.argsort(all_lists, kind="stable")
+        self.codes = np.concatenate([np.asarray(self.codes), codes])[order]
+        self.labels = np.concatenate([np.asarray(self.labels), labels])[order]
+        self.list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(all_lists, minlength=self.nlist))]
+        ).astype(np.int64)
+
+    def search(
+        self, queries: np.ndarray, k: int, nprobe: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate k nearest neighbours of every query.
+
+        Args:
+        queries (np.ndarray): The L2 normalized query vectors.
+        k (int): The number of neighbours per query.
+        nprobe (int): The number of inverted lists scanned per query.
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: The cosine distances and the labels, nq x k,
+            padded with inf and -1 when fewer than k vectors were scanned.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = max(1, min(nprobe, self.nlist))
+        coarse = (self.centroids**2).sum(axis=1)[None, :] - 2 * (
+            queries @ self.centroids.T
+        )
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        parts = np.arange(self.m)
+        for row, query in enumerate(queries):
+            probes = np.argpartition(coarse[row], nprobe - 1)[:nprobe]
+            found_distances = []
+            found_labels = []
+            for probe in probes:
+                start, end = self.list_offsets[probe], self.list_offsets[probe + 1]
+                if start == end:
+                    continue
+                residual = (query - self.centroids[probe]).reshape(self.m, 1, -1)
+                tables = ((self.codebooks - residual) ** 2).sum(axis=2)
+                codes = np.asarray(self.codes[start:end])
+                found_distances.append(tables[parts, codes].sum(axis=1))
+                found_labels.append(np.asarray(self.labels[start:end]))
+            if not found_distances:
+                continue
+            candidate_distances = np.concatenate(found_distances)
+            candidate_labels = np.concatenate(found_labels)
+            top = min(k, len(candidate_distances))
+            best = np.argpartition(candidate_distances, top - 1)[:top]
+            best = best[np.argsort(candidate_distances[best])]
+            # Squared L2 between unit vectors is 2 - 2 cos, so halving it gives 1 - cos
+            distances[row, :top] = candidate_distances[best] / 2
+            labels[row, :top] = candidate_labels[best]
+        return distances, labels
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Saves the index to a folder, the codes and labels as .npy files."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        # Written aside and moved in place, so the memory maps of a loaded index keep
+        # reading the old files. ivfpq.npz goes last as it marks a new build.
+        for file_name, array in (
+            ("codes.npy", self.codes),
+            ("labels.npy", self.labels),
+        ):
+            with open(path / f"{file_name}.tmp", "wb") as handle:
+                np.save(handle, np.asarray(array))
+        with open(path / "ivfpq.npz.tmp", "wb") as handle:
+            np.savez(
+                handle,
+                centroids=self.centroids,
+                codebooks=self.codebooks,
+                list_offsets=self.list_offsets,
+            )
+        for file_name in ("codes.npy", "labels.npy", "ivfpq.npz"):
+            (path / f"{file_name}.tmp").replace(path / file_name)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "IVFPQIndex":
+        """Loads an index, the codes and labels are memory-mapped."""
+        path = Path(path)
+        with np.load(path / "ivfpq.npz") as arrays:
+            return cls(
+                arrays["centroids"],
+                arrays["codebooks"],
+                arrays["list_offsets"],
+                np.load(path / "codes.npy", mmap_mode="r"),
+                np.load(path / "labels.npy", mmap_mode="r"),
+            )
+
+
+class LibraryIndex:
+    """
+    The IVF-PQ index of every ingested book, stored in output/_library/, plus a sqlite
+    table mapping every label to its book and chunk id. It is built offline from the
+    per-book stores, which stay the source of truth for documents and metadata. Every
+    build is written to a folder of its own and the CURRENT file names the live one, so
+    a reader never sees the index of one build with the entries of another.
+    """
+
+    ENTRIES_FILENAME = "entries.sqlite3"
+    CURRENT_FILENAME = "CURRENT"
+
+    def __init__(self, path: Union[None, str, Path] = None):
+        self.path = Path(path) if path else Utils.get_output_path(LIBRARY_FOLDER)
+        self.build_path = self.current_build(self.path)
+        self.index = IVFPQIndex.load(self.build_path)
+        self._connection = sqlite3.connect(
+            str(self.build_path / self.ENTRIES_FILENAME), check_same_thread=False
+        )
+
+    @classmethod
+    def current_build(cls, path: Union[str, Path]) -> Path:
+        """Returns the folder of the live build, the library folder for old ones."""
+        path = Path(path)
+        try:
+            return path / (path / cls.CURRENT_FILENAME).read_text("utf-8").strip()
+        except FileNotFoundError:
+            return path
+
+    @classmethod
+    def exists(cls, path: Union[None, str, Path] = None) -> bool:
+        """Checks if the library index was built."""
+        path = cls.current_build(
+            Path(path) if path else Utils.get_output_path(LIBRARY_FOLDER)
+        )
+        return (path / "ivfpq.npz").exists() and (path / cls.ENTRIES_FILENAME).exists()
+
+    @classmethod
+    def build(
+        cls,
+        books: Optional[List[str]] = None,
+        path: Union[None, str, Path] = None,
+        nlist: Optional[int] = None,
+        m: Optional[int] = None,
+        train_size: Optional[int] = None,
+        seed: int = 0,
+    ) -> "LibraryIndex":
+        """
+        Trains and fills the library index from the embeddings of the ingested books,
+        without calling Ollama. Books whose vectors have another dimension than the
+        first book (a different embeddings model) are skipped.
+
+        Args:
+        books (List[str], optional): The book file names, defaults to every book in
+            data/ with an embeddings database.
+        path (Union[str, Path], optional): The index folder, defaults to
+            output/_library/.
+        nlist (int, optional): The inverted lists, defaults to LIBRARY_NLIST or
+            4 * sqrt(n).
+        m (int, optional): The PQ sub-quantizers, defaults to LIBRARY_PQ_M.
+        train_size (int, optional): The vectors sampled for training, defaults to
+            LIBRARY_TRAIN_SIZE.
+        seed (int): The random seed of the sampling and of k-means.
+        Returns:
+        LibraryIndex: The built index.
+        """
+        path = Path(path) if path else Utils.get_output_path(LIBRARY_FOLDER)
+        books = books if books is not None else cls.ingested_books()
+        train_size = train_size or Utils.LIBRARY_TRAIN_SIZE
+        totals = {book: cls._open_book(book).count() for book in books}
+        total = sum(totals.values())
+        if not total:
+            raise ValueError("There are no embeddings to index")
+        rng = np.random.default_rng(seed)
+        probability = min(1.0, train_size / total)
+        dim = None
+        sample = []
+        for book in books:
+            for _ids, vectors in cls._iter_vectors(book):
+                if dim is None:
+                    dim = vectors.shape[1]
+                if vectors.shape[1] != dim:
+                    Utils.logger.warning(
+                        "Skipping %s, its embeddings are not %s-d.", book, dim
+                    )
+                    break
+                sample.append(vectors[rng.random(len(vectors)) < probability])
+        sample = np.concatenate(sample)
+        nlist = nlist or Utils.LIBRARY_NLIST or int(4 * np.sqrt(total))
+        Utils.logger.info(
+            "Training the library index on %s of %s vectors, %s lists.",
+            len(sample),
+            total,
+            nlist,
+        )
+        index = IVFPQIndex.train(sample, nlist, m or Utils.LIBRARY_PQ_M, seed=seed)
+        build_name = f"build-{time.time_ns()}"
+        build_path = path / build_name
+        build_path.mkdir(parents=True)
+        connection = sqlite3.connect(str(build_path / cls.ENTRIES_FILENAME))
+        connection.execute(
+            "CREATE TABLE entries (label INTEGER PRIMARY KEY, book TEXT NOT NULL, "
+            "id TEXT NOT NULL)"
+        )
+        next_label = 0
+        encoded = []
+        for book in books:
+            for ids, vectors in cls._iter_vectors(book):
+                if vectors.shape[1] != dim:
+                    break
+                labels = np.arange(next_label, next_label + len(ids), dtype=np.int64)
+                next_label += len(ids)
+                encoded.append((*index.encode(vectors), labels))
+                connection.executemany(
+                    "INSERT INTO entries (label, book, id) VALUES (?, ?, ?)",
+                    [
+                        (int(label), book, record_id)
+                        for label, record_id in zip(labels, ids)
+                    ],
+                )
+            connection.commit()
+            Utils.logger.info("Indexed %s for the library.", book)
+        connection.close()
+        index.add_encoded(
+            *(np.concatenate([batch[part] for batch in encoded]) for part in range(3))
+        )
+        index.save(build_path)
+        current_path = path / f"{cls.CURRENT_FILENAME}.tmp"
+        current_path.write_text(build_name, "utf-8")
+        current_path.replace(path / cls.CURRENT_FILENAME)
+        cls._remove_old_builds(path, build_name)
+        return cls(path)
+
+    @staticmethod
+    def _remove_old_builds(path: Path, build_name: str) -> None:
+        """
+        Deletes the replaced builds. Files still mapped by a loaded index cannot be
+        deleted on Windows, they are left for the next build.
+        """
+        for folder in path.glob("build-*"):
+            if folder.name != build_name:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    @staticmethod
+    def ingested_books() -> List[str]:
+        """Returns the books in data/ with an embeddings database."""
+        return sorted(
+            file.name
+            for file in Utils.get_data_path().iterdir()
+            if file.suffix.lower() == ".pdf"
+            and store_exists(Utils.get_output_path(Utils.strip_extension(file.name)))
+        )
+
+    @staticmethod
+    def _open_book(book: str):
+        return open_store(Utils.get_output_path(Utils.strip_extension(book)))
+
+    @classmethod
+    def _iter_vectors(
+        cls, book: str, batch_size: int = 2048
+    ) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """Yields the ids and L2 normalized vectors of a book, batch by batch."""
+        store = cls._open_book(book)
+        for offset in range(0, store.count(), batch_size):
+            records = store.get(include=["embeddings"], limit=batch_size, offset=offset)
+            if not len(records["ids"]):
+                break
+            vectors = np.asarray(records["embeddings"], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            yield list(records["ids"]), vectors / norms
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        nprobe: Optional[int] = None,
+        include: Iterable[str] = ("metadatas", "documents", "distances"),
+        rescore: Optional[int] = None,
+    ) -> dict:
+        """
+        Searches every book at once. The PQ distances only rank the candidates coarsely,
+        so rescore * n_results of them are ranked again by their exact vectors, read
+        from the per-book stores.
+
+        Args:
+        query_embeddings: A vector or a list of vectors.
+        n_results (int): The number of chunks to return per query.
+        nprobe (int, optional): The inverted lists scanned, defaults to LIBRARY_NPROBE.
+            Higher values raise recall and latency.
+        include (Iterable[str]): Fields to return, out of metadatas, documents and
+            distances. Metadatas and documents are read from the per-book stores.
+        rescore (int, optional): The shortlist factor, defaults to LIBRARY_RESCORE, 0
+            keeps the PQ ranking.
+        Returns:
+        dict: Chroma style results with a "books" list, one list per query for every
+            field.
+        """
+        include = list(include)
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+        rescore = Utils.LIBRARY_RESCORE if rescore is None else rescore
+        distances, labels = self.index.search(
+            queries,
+            n_results * max(1, rescore),
+            nprobe or Utils.LIBRARY_NPROBE,
+        )
+        fields = include + ["embeddings"] if rescore > 0 else include
+        results = {"ids": [], "books": []}
+        for field in include:
+            results[field] = []
+        stores = {}
+        for query, row_distances, row_labels in zip(queries, distances, labels):
+            found = [int(label) for label in row_labels if label >= 0]
+            labels_entries = self._entries(found)
+            entries = [labels_entries[label] for label in found]
+            records = self._records(entries, fields, stores)
+            row_distances = row_distances[: len(found)]
+            if rescore > 0:
+                kept = [
+                    position
+                    for position, vector in enumerate(records["embeddings"])
+                    if vector is not None
+                ]
+                exact = np.zeros(0, dtype=np.float32)
+                if kept:
+                    vectors = np.asarray(
+                        [records["embeddings"][position] for position in kept],
+                        dtype=np.float32,
+                    )
+                    vectors /= np.maximum(
+                        np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+                    )
+                    exact = 1.0 - vectors @ query
+                order = [kept[position] for position in np.argsort(exact)]
+                row_distances = np.sort(exact)
+            else:
+                order = list(range(len(found)))
+            order = order[:n_results]
+            results["ids"].append([entries[position][1] for position in order])
+            results["books"].append([entries[position][0] for position in order])
+            for field in include:
+                if field == "distances":
+                    results[field].append(
+                        [float(value) for value in row_distances[: len(order)]]
+                    )
+                else:
+                    values = records.get(field, [])
+                    results[field].append([values[position] for position in order])
+        return results
+
+    def _entries(self, labels: List[int]) -> Dict[int, Tuple[str, str]]:
+        entries = {label: ("", "") for label in labels}
+        unique = list(entries)
+        for start in range(0, len(unique), _ENTRIES_BATCH):
+            batch = unique[start : start + _ENTRIES_BATCH]
+            rows = self._connection.execute(
+                "SELECT label, book, id FROM entries WHERE label IN "
+                f"({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for label, book, record_id in rows:
+                entries[label] = (book, record_id)
+        return entries
+
+    def _records(
+        self, entries: List[Tuple[str, str]], include: List[str], stores: dict
+    ) -> dict:
+        fields = [
+            field
+            for field in ("metadatas", "documents", "embeddings")
+            if field in include
+        ]
+        if not fields:
+            return {}
+        found = {}
+        for book in {book for book, _record_id in entries}:
+            if book not in stores:
+                stores[book] = self._open_book(book)
+            ids = [record_id for entry_book, record_id in entries if entry_book == book]
+            records = stores[book].get(ids=ids, include=fields)
+            for position, record_id in enumerate(records["ids"]):
+                found[(book, record_id)] = {
+                    field: records[field][position] for field in fields
+                }
+        return {
+            field: [found.get(entry, {}).get(field) for entry in entries]
+            for field in fields
+        }
+
+    def count(self) -> int:
+        """Returns the number of chunks in the index."""
+        return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self) -> None:
+        """Closes the entries connection."""
+        self._connection.close()
+
+
+_shared: Optional[LibraryIndex] = None
+_shared_version: Optional[Path] = None
+_shared_lock = threading.Lock()
+
+
+def shared_library() -> Optional[LibraryIndex]:
+    """
+    Returns the library index shared by the API routes, loaded again after a new build.
+    None if the library was never built.
+    """
+    global _shared, _shared_version
+    path = Utils.get_output_path(LIBRARY_FOLDER)
+    with _shared_lock:
+        if not LibraryIndex.exists(path):
+            return None
+        version = LibraryIndex.current_build(path)
+        if _shared is None or version != _shared_version:
+            replaced, _shared = _shared, LibraryIndex(path)
+            _shared_version = version
+            if replaced is not None:
+                replaced.close()
+        return _shared
+
+
+def build_library(nlist: Optional[int] = None, m: Optional[int] = None) -> int:
+    """Builds the library index of every ingested book, returns the chunks indexed."""
+    library = LibraryIndex.build(nlist=nlist, m=m)
+    try:
+        return library.count()
+    finally:
+        library.close()
+
+
+def embed_question(question: str) -> List[float]:
+    """Embeds a question with the embeddings model."""
+    embeddings = ollama.embed(question)
+    return embeddings[0] if embeddings else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Library-wide IVF-PQ index")
+    parser.add_argument(
+        "--build", action="store_true", help="Train and fill the index from every book."
+    )
+    parser.add_argument("--nlist", type=int, help="Inverted lists of a build.")
+    parser.add_argument("--m", type=int, help="PQ sub-quantizers of a build.")
+    parser.add_argument("--question", help="Question to search the library for.")
+    parser.add_argument("--nprobe", type=int, help="Inverted lists scanned per query.")
+    parser.add_argument(
+        "--n-results", type=int, default=10, help="Chunks returned per query."
+    )
+    args = parser.parse_args()
+    library = (
+        LibraryIndex.build(nlist=args.nlist, m=args.m) if args.build else LibraryIndex()
+    )
+    if args.question:
+        found = library.query(
+            [embed_question(args.question)],
+            n_results=args.n_results,
+            nprobe=args.nprobe,
+            include=["metadatas", "distances"],
+        )
+        print(
+            json.dumps(
+                [
+                    {"book": book, "id": record_id, "distance": distance, **metadata}
+                    for book, record_id, distance, metadata in zip(
+                        found["books"][0],
+                        found["ids"][0],
+                        found["distances"][0],
+                        found["metadatas"][0],
+                    )
+                ],
+                indent=2,
+            )
+        )
@@ -0,0 +1,481 @@
+"""Shared Ollama client with pooled connections, retries and a circuit breaker."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from .utils import Utils
+
+# Seconds to wait for the response of each kind of call, connecting is capped separately
+# by OLLAMA_CONNECT_TIMEOUT. Long generations get long timeouts, probes fail fast.
+TIMEOUTS = {
+    "status": 2,
+    "classify": 60,
+    "summary": 120,
+    "embed": 180,
+    "grade": 180,
+    "answer": 300,
+    "exam": 300,
+}
+_RETRY_STATUSES = {500, 502, 503, 504}
+_RETRY_ERRORS = (requests.ConnectionError, requests.exceptions.ChunkedEncodingError)
+_ASYNC_RETRY_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadError,
+    httpx.WriteError,
+    httpx.RemoteProtocolError,
+)
+_LATENCY_SAMPLES = 1000
+
+
+class OllamaError(Exception):
+    """Ollama could not be reached, timed out or kept failing after the retries."""
+
+
+class OllamaUnavailable(OllamaError):
+    """The circuit breaker is open, Ollama is not called at all."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed calls, so callers fail fast instead of
+    each one waiting for its own timeouts while Ollama is down. After reset_seconds a
+    single trial call is let through, its success closes the breaker and its failure
+    reopens it. A trial that ends with neither, e.g. cancelled, lets the next call be
+    the trial.
+    """
+
+    def __init__(
+        self, failures: Optional[int] = None, reset_seconds: Optional[float] = None
+    ):
+        self.failures = (
+            failures if failures is not None else Utils.OLLAMA_BREAKER_FAILURES
+        )
+        self.reset_seconds = (
+            reset_seconds
+            if reset_seconds is not None
+            else Utils.OLLAMA_BREAKER_RESET_SECONDS
+        )
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Returns closed, open or half_open."""
+        if self._opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Checks if a call may go through, claiming the trial call when half open."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        """Closes the breaker."""
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release_trial(self) -> None:
+        """Gives back the trial, for calls that ended without success or failure."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        """Counts a failed call, opening the breaker past the threshold."""
+        with self._lock:
+            self._consecutive += 1
+            self._trial = False
+            if self.failures > 0 and (
+                self._opened_at is not None or self._consecutive >= self.failures
+            ):
+                self._opened_at = time.monotonic()
+
+
+class OllamaClient:
+    """
+    The one client every Ollama call goes through. Synchronous callers (ingestion,
+    exams, the CLI) share a pooled requests session and the API a pooled httpx client,
+    both with keep-alive and at most OLLAMA_POOL_SIZE connections. Connection errors and
+    5xx answers are retried OLLAMA_RETRIES times with jittered exponential backoff,
+    timeouts are not since the call already waited its whole profile. Every call is
+    accounted per task: latency, failures, retries and the prompt/output tokens Ollama
+    reports.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.base_url = base_url or Utils.OLLAMA_URL
+        self.pool_size = pool_size if pool_size is not None else Utils.OLLAMA_POOL_SIZE
+        self.retries = retries if retries is not None else Utils.OLLAMA_RETRIES
+        self.backoff = backoff if backoff is not None else Utils.OLLAMA_RETRY_BACKOFF
+        self.breaker = breaker or CircuitBreaker()
+        self._requests_session: Optional[requests.Session] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._stats: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        with self._lock:
+            if self._requests_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=max(1, self.pool_size)
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._requests_session = session
+            return self._requests_session
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                )
+            )
+        return self._client
+
+    @staticmethod
+    def _timeout(task: str) -> float:
+        return float(TIMEOUTS.get(task, TIMEOUTS["answer"]))
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff * 2**attempt)  # nosec B311
+
+    def _task_stats(self, task: str) -> dict:
+        if task not in self._stats:
+            self._stats[task] = {
+                "calls": 0,
+                "failures": 0,
+                "retries": 0,
+                "prompt_tokens": 0,
+                "output_tokens": 0,
+                "latencies": deque(maxlen=_LATENCY_SAMPLES),
+            }
+        return self._stats[task]
+
+    def _check_breaker(self, task: str) -> None:
+        if not self.breaker.allow():
+            with self._lock:
+                self._task_stats(task)["failures"] += 1
+            raise OllamaUnavailable(
+                "Ollama is unavailable, the circuit breaker is open"
+            )
+
+    def _succeeded(self, task: str, data, started: float):
+        self.breaker.record_success()
+        with self._lock:
+            stats = self._task_stats(task)
+            stats["calls"] += 1
+            stats["latencies"].append(time.perf_counter() - started)
+            if isinstance(data, dict):
+                stats["prompt_tokens"] += int(data.get("prompt_eval_count") or 0)
+                stats["output_tokens"] += int(data.get("eval_count") or 0)
+        return data
+
+    def _failed(self, task: str, error: Exception, trip: bool = True) -> OllamaError:
+        """
+        Counts a failed call. Only Ollama being unreachable, slow or answering 5xx trips
+        the breaker, a request it rejected or an answer it garbled does not.
+        """
+        if trip:
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_trial()
+        with self._lock:
+            self._task_stats(task)["failures"] += 1
+        Utils.logger.warning("Ollama %s call failed: %s", task, error)
+        return OllamaError(f"Ollama {task} call failed: {error}")
+
+    def _rejected(self, task: str, status_code: int, body: str) -> OllamaError:
+        """Fails a call Ollama answered with a 4xx, the error message is in the body."""
+        try:
+            detail = json.loads(body).get("error") or body
+        except (ValueError, AttributeError):
+            detail = body
+        return self._failed(
+            task, OllamaError(f"HTTP {status_code}: {str(detail)[:200]}"), trip=False
+        )
+
+    def _retried(self, task: str) -> None:
+        with self._lock:
+            self._task_stats(task)["retries"] += 1
+
+    def _open(
+        self, path: str, payload: dict, task: str, stream: bool = False
+    ) -> Tuple[requests.Response, float]:
+        """
+        Sends a request if the breaker lets it through. A call cancelled or interrupted
+        before Ollama answered has no outcome and gives the trial call back.
+        """
+        self._check_breaker(task)
+        try:
+            return self._send(path, payload, task, stream)
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+    def _send(
+        self, path: str, payload: dict, task: str, stream: bool
+    ) -> Tuple[requests.Response, float]:
+        """
+        Sends a request, retrying until Ollama answers anything but a 5xx. A 4xx answer
+        fails the call without retrying, the request itself is wrong.
+        """
+        timeout = (Utils.OLLAMA_CONNECT_TIMEOUT, self._timeout(task))
+        error: Exception = OllamaError("no attempt")
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self._session().post(
+                    self.base_url + path, json=payload, timeout=timeout, stream=stream
+                )
+            except _RETRY_ERRORS as exc:
+                error = exc
+            except requests.RequestException as exc:
+                raise self._failed(task, exc) from exc
+            else:
+                if response.status_code < 400:
+                    return response, started
+                if response.status_code not in _RETRY_STATUSES:
+                    with response:
+                        raise self._rejected(task, response.status_code, response.text)
+                response.close()
+                error = OllamaError(f"HTTP {response.status_code}")
+            if attempt < self.retries:
+                self._retried(task)
+                time.sleep(self._delay(attempt))
+        raise self._failed(task, error) from error
+
+    async def _aopen(
+        self, path: str, payload: dict, task: str, stream: bool = False
+    ) -> Tuple[httpx.Response, float]:
+        """Same as _open, without blocking the event loop."""
+        self._check_breaker(task)
+        try:
+            return await self._asend(path, payload, task, stream)
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+    async def _asend(
+        self, path: str, payload: dict, task: str, stream: bool
+    ) -> Tuple[httpx.Response, float]:
+        """Same as _send, without blocking the event loop."""
+        timeout = httpx.Timeout(
+            self._timeout(task), connect=Utils.OLLAMA_CONNECT_TIMEOUT
+        )
+        error: Exception = OllamaError("no attempt")
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                request = self._http().build_request(
+                    "POST", self.base_url + path, json=payload, timeout=timeout
+                )
+                response = await self._http().send(request, stream=stream)
+            except _ASYNC_RETRY_ERRORS as exc:
+                error = exc
+            except httpx.HTTPError as exc:
+                raise self._failed(task, exc) from exc
+            else:
+                if response.status_code < 400:
+                    return response, started
+                if response.status_code not in _RETRY_STATUSES:
+                    body = await response.aread()
+                    await response.aclose()
+                    raise self._rejected(
+                        task, response.status_code, body.decode(errors="replace")
+                    )
+                await response.aclose()
+                error = OllamaError(f"HTTP {response.status_code}")
+            if attempt < self.retries:
+                self._retried(task)
+                await asyncio.sleep(self._delay(attempt))
+        raise self._failed(task, error) from error
+
+    def post(self, path: str, payload: dict, task: str = "answer") -> dict:
+        """
+        Posts a JSON payload to an Ollama endpoint.
+
+        Args:
+        path (str): The endpoint path, e.g. /generate.
+        payload (dict): The request body.
+        task (str): The kind of call, picks the timeout from TIMEOUTS and the stats
+            entry.
+        Returns:
+        dict: The decoded JSON response.
+        Raises:
+        OllamaError: Ollama could not be reached, timed out, kept answering 5xx,
+            rejected the request with a 4xx or answered something that is not JSON.
+        """
+        response, started = self._open(path, payload, task)
+        try:
+            data = response.json()
+        except ValueError as exc:
+            raise self._failed(task, exc, trip=False) from exc
+        return self._succeeded(task, data, started)
+
+    async def apost(self, path: str, payload: dict, task: str = "answer") -> dict:
+        """Same as post, without blocking the event loop."""
+        response, started = await self._aopen(path, payload, task)
+        try:
+            data = response.json()
+        except ValueError as exc:
+            raise self._failed(task, exc, trip=False) from exc
+        return self._succeeded(task, data, started)
+
+    def stream(self, path: str, payload: dict, task: str = "answer") -> Iterator[dict]:
+        """
+        Posts a JSON payload with streaming on, yielding the JSON lines Ollama sends as
+        they arrive, the last one has done set and the token counts. Only opening the
+        stream is retried, a stream broken half way raises OllamaError. Closing the
+        generator early closes the connection, which stops the generation in Ollama.
+        """
+        response, started = self._open(path, {**payload, "stream": True}, task, True)
+        # Ollama answered, the breaker must not wait for the end of a stream that the
+        # caller may abandon
+        self.breaker.record_success()
+        with response:
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("done"):
+                        self._succeeded(task, data, started)
+                    yield data
+            except requests.RequestException as exc:
+                raise self._failed(task, exc) from exc
+            except ValueError as exc:
+                raise self._failed(task, exc, trip=False) from exc
+
+    async def astream(
+        self, path: str, payload: dict, task: str = "answer"
+    ) -> AsyncIterator[dict]:
+        """Same as stream, without blocking the event loop."""
+        response, started = await self._aopen(
+            path, {**payload, "stream": True}, task, True
+        )
+        self.breaker.record_success()
+        try:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("done"):
+                    self._succeeded(task, data, started)
+                yield data
+        except httpx.HTTPError as exc:
+            raise self._failed(task, exc) from exc
+        except ValueError as exc:
+            raise self._failed(task, exc, trip=False) from exc
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    def generate_payload(prompt: str, options: Optional[dict] = None) -> dict:
+        """Returns the /generate payload of a prompt for the chat model."""
+        return {
+            "model": Utils.CHAT_MODEL,
+            "options": options or {},
+            "stream": False,
+            "prompt": prompt,
+        }
+
+    def embed(self, text: Union[str, List[str]], task: str = "embed") -> List[list]:
+        """Returns the embeddings of a text, or of a list of texts in order."""
+        data = self.post(
+            "/embed", {"model": Utils.EMBEDDINGS_MODEL, "input": text}, task=task
+        )
+        return data.get("embeddings", [])
+
+    async def aembed(self, text: str, task: str = "embed") -> List[list]:
+        """Same as embed, without blocking the event loop."""
+        data = await self.apost(
+            "/embed", {"model": Utils.EMBEDDINGS_MODEL, "input": text}, task=task
+        )
+        return data.get("embeddings", [])
+
+    def generate(
+        self, prompt: str, options: Optional[dict] = None, task: str = "answer"
+    ) -> str:
+        """Returns the whole answer of the chat model to a prompt, or empty."""
+        data = self.post("/generate", self.generate_payload(prompt, options), task)
+        return data.get("response", "")
+
+    async def models(self) -> List[str]:
+        """Returns the names of the models available in Ollama."""
+        self._check_breaker("status")
+        started = time.perf_counter()
+        try:
+            response = await self._http().get(
+                self.base_url + "/tags", timeout=self._timeout("status")
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            raise self._failed("status", exc) from exc
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        data = self._succeeded("status", response.json(), started)
+        return [model["name"] for model in data.get("models", [])]
+
+    def stats(self) -> dict:
+        """Returns the breaker state and, per task, the call counters and latencies."""
+        with self._lock:
+            tasks = {}
+            for task, stats in self._stats.items():
+                latencies = sorted(stats["latencies"])
+                tasks[task] = {
+                    key: value for key, value in stats.items() if key != "latencies"
+                }
+                if latencies:
+                    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                    tasks[task]["latency_p50_ms"] = round(
+                        latencies[len(latencies) // 2] * 1000, 1
+                    )
+                    tasks[task]["latency_p95_ms"] = round(p95 * 1000, 1)
+        return {"breaker": self.breaker.state, "tasks": tasks}
+
+    async def close(self) -> None:
+        """Closes the connection pools."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        with self._lock:
+            if self._requests_session is not None:
+                self._requests_session.close()
+                self._requests_session = None
+
+
+ollama = OllamaClient()
@@ -0,0 +1,163 @@
+"""Pre-extracted page text of a book, written once at ingestion."""
+
+import json
+import os
+import time
+import zlib
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pymupdf
+
+from .headers import HeaderFooterFilter
+from .utils import Utils
+
+
+class PageTextStore:
+    """
+    The text of every page of a book, without its repeated headers and footers, stored
+    in the book output folder as one zlib blob per page in pages-<version>.bin plus the
+    uint64 offsets of the blobs in pages-<version>.offsets, pages.json naming the
+    version. Both files are memory-mapped, so reading a page is two offset lookups and
+    one decompression, and answering questions or building exams never opens the PDF.
+    """
+
+    OFFSETS_FILENAME = "pages.offsets"
+    BLOBS_FILENAME = "pages.bin"
+    META_FILENAME = "pages.json"
+
+    def __init__(self, book_filename: str):
+        self.book_filename = book_filename
+        self.path = Utils.get_output_path(Utils.strip_extension(book_filename))
+        with open(self.path / self.META_FILENAME, "r", encoding="utf-8") as handle:
+            meta = json.load(handle)
+        self.page_count = int(meta["page_count"])
+        self.metadata = meta.get("metadata", {})
+        version = meta.get("version")
+        self._offsets = np.memmap(
+            self.path / self.versioned(self.OFFSETS_FILENAME, version),
+            dtype=np.uint64,
+            mode="r",
+            shape=(self.page_count + 1,),
+        )
+        blobs_path = self.path / self.versioned(self.BLOBS_FILENAME, version)
+        self._blobs = (
+            np.memmap(blobs_path, dtype=np.uint8, mode="r")
+            if blobs_path.stat().st_size
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    @staticmethod
+    def versioned(file_name: str, version: Optional[str]) -> str:
+        """Returns the file name of a version, older stores have no version."""
+        if not version:
+            return file_name
+        stem, suffix = file_name.split(".")
+        return f"{stem}-{version}.{suffix}"
+
+    @classmethod
+    def exists(cls, book_filename: str) -> bool:
+        """Checks if the page text of the book was stored."""
+        path = Utils.get_output_path(Utils.strip_extension(book_filename))
+        return (path / cls.META_FILENAME).exists()
+
+    @classmethod
+    def open(cls, book_filename: str) -> "PageTextStore":
+        """Opens the page text of the book, extracting it first if it is missing."""
+        if not cls.exists(book_filename):
+            cls.build(book_filename)
+        return cls(book_filename)
+
+    @classmethod
+    def build(cls, book_filename: str) -> None:
+        """Extracts the page text of the book from the PDF and stores it."""
+        with pymupdf.open(f"{Utils.get_data_path()}/{book_filename}") as book:
+            header_filter = HeaderFooterFilter(book_filename)
+            header_filter.load(book)
+            cls.write(
+                book_filename,
+                (
+                    header_filter.page_text(book.load_page(page))
+                    for page in range(book.page_count)
+                ),
+                book.metadata,
+            )
+
+    @classmethod
+    def write(
+        cls,
+        book_filename: str,
+        page_texts: Iterable[str],
+        metadata: Optional[dict] = None,
+    ) -> None:
+        """
+        Stores the page text of a book, replacing the previous one. The data files get a
+        new version in their names and pages.json, replaced last, switches the readers
+        to them, so no file a reader may still have memory-mapped is overwritten, which
+        Windows refuses. The files of the previous versions are then deleted when
+        nothing maps them.
+
+        Args:
+        book_filename (str): The book file name.
+        page_texts (Iterable[str]): The text of every page, in page order.
+        metadata (dict, optional): The PDF metadata, only title and author are kept.
+        """
+        path = Utils.get_output_path(Utils.strip_extension(book_filename), create=True)
+        version = f"{time.time_ns():x}"
+        offsets = [0]
+        blobs_path = path / cls.versioned(cls.BLOBS_FILENAME, version)
+        with open(blobs_path, "wb") as handle:
+            for text in page_texts:
+                blob = zlib.compress((text or "").encode("utf-8", "replace"))
+                handle.write(blob)
+                offsets.append(offsets[-1] + len(blob))
+        offsets_path = path / cls.versioned(cls.OFFSETS_FILENAME, version)
+        np.asarray(offsets, dtype=np.uint64).tofile(offsets_path)
+        meta_tmp = path / f"{cls.META_FILENAME}.tmp"
+        with open(meta_tmp, "w", encoding="utf-8") as handle:
+            json.dump(
+                {
+                    "page_count": len(offsets) - 1,
+                    "version": version,
+                    "metadata": {
+                        key: (metadata or {}).get(key) or ""
+                        for key in ("title", "author")
+                    },
+                },
+                handle,
+                indent=2,
+            )
+            handle.write("\n")
+        os.replace(meta_tmp, path / cls.META_FILENAME)
+        kept = {blobs_path.name, offsets_path.name}
+        for old_path in [*path.glob("pages*.bin"), *path.glob("pages*.offsets")]:
+            if old_path.name not in kept:
+                try:
+                    old_path.unlink()
+                except OSError as exc:
+                    # Still mapped by a reader on Windows, the next write retries
+                    Utils.logger.debug("Could not delete %s: %s", old_path, exc)
+
+    def close(self) -> None:
+        """Releases the memory maps."""
+        self._offsets = None
+        self._blobs = None
+
+    def __len__(self) -> int:
+        return self.page_count
+
+    def page_text(self, page: int) -> str:
+        """Returns the text of a page, raises IndexError for pages outside the book."""
+        if not 0 <= page < self.page_count:
+            raise IndexError(f"Page {page} is outside the book")
+        start, end = int(self._offsets[page]), int(self._offsets[page + 1])
+        return zlib.decompress(self._blobs[start:end].tobytes()).decode("utf-8")
+
+    def pages_text(self, page_start: int, page_end: int) -> List[str]:
+        """Returns the text of the pages from page_start to page_end, both included."""
+        return [
+            self.page_text(page)
+            for page in range(
+                max(0, page_start), min(page_end, self.page_count - 1) + 1
+            )
+        ]
@@ -0,0 +1,134 @@
+"""Staged streaming pipeline with bounded queues between stages."""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .utils import Utils
+
+_DONE = object()
+
+
+class _StageError:
+    """Carries an exception raised by a stage down to the consumer."""
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class PipelineStage:
+    """A named transform running in its own thread, with its queue and counters."""
+
+    def __init__(self, name: str, transform: Callable[[Iterable], Iterable]):
+        self.name = name
+        self.transform = transform
+        self.output: Optional[queue.Queue] = None
+        self.processed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def stats(self) -> dict:
+        """Returns the items produced, the throughput and the output queue depth."""
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "processed": self.processed,
+            "per_second": round(self.processed / elapsed, 2) if elapsed else 0.0,
+            "queue_depth": self.output.qsize() if self.output else 0,
+            "queue_size": self.output.maxsize if self.output else 0,
+        }
+
+
+class Pipeline:
+    """
+    Runs a source and a chain of stages concurrently, each one in its own thread,
+    connected by bounded queues so a slow stage applies backpressure to the ones before
+    it instead of letting work pile up in memory. Every stage is a transform from an
+    iterable of inputs to an iterable of outputs, so it may map, filter or regroup
+    items.
+    """
+
+    def __init__(
+        self, source: Iterable, name: str = "source", queue_size: Optional[int] = None
+    ):
+        self.queue_size = (
+            queue_size if queue_size is not None else Utils.PIPELINE_QUEUE_SIZE
+        )
+        self.stages: List[PipelineStage] = [PipelineStage(name, lambda _: source)]
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def add_stage(
+        self, name: str, transform: Callable[[Iterable], Iterable]
+    ) -> "Pipeline":
+        """Appends a stage fed by the output of the previous one."""
+        self.stages.append(PipelineStage(name, transform))
+        return self
+
+    def run(self) -> Iterator:
+        """Starts every stage and yields the outputs of the last one."""
+        self._stop.clear()
+        inbox: Optional[queue.Queue] = None
+        for stage in self.stages:
+            stage.output = queue.Queue(maxsize=max(1, self.queue_size))
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(stage, inbox),
+                name=f"pipeline-{stage.name}",
+                daemon=True,
+            )
+            self._threads.append(thread)
+            inbox = stage.output
+        for thread in self._threads:
+            thread.start()
+        try:
+            yield from self._drain(inbox)
+        finally:
+            self._stop.set()
+            for thread in self._threads:
+                thread.join(timeout=5)
+            self._threads = []
+
+    def stats(self) -> Dict[str, dict]:
+        """Returns the per stage counters, keyed by stage name."""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def _run_stage(self, stage: PipelineStage, inbox: Optional[queue.Queue]) -> None:
+        stage.started_at = time.monotonic()
+        try:
+            for item in stage.transform(self._drain(inbox) if inbox else None):
+                stage.processed += 1
+                if not self._put(stage.output, item):
+                    return
+            self._put(stage.output, _DONE)
+        except Exception as exc:
+            self._put(stage.output, _StageError(exc))
+        finally:
+            stage.finished_at = time.monotonic()
+
+    def _put(self, target: queue.Queue, item: object) -> bool:
+        """Blocks until the queue has room, gives up if the pipeline stopped."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, source: queue.Queue) -> Iterator:
+        """Yields the items of a queue until the upstream stage is done."""
+        while not self._stop.is_set():
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
@@ -0,0 +1,125 @@
+"""Cache of the embeddings of the questions asked to the assistant."""
+
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Union
+
+from .embeddings_cache import EmbeddingsCache
+from .utils import Utils
+
+
+class QueryEmbeddingsCache:
+    """
+    LRU of question vectors in front of the /embed call of the assistant, so questions
+    asked again skip the Ollama round trip. Questions are normalized (case, whitespace
+    and trailing punctuation) and scoped by the embeddings model. The max_entries most
+    recent ones are kept in memory and every one in a SQLite EmbeddingsCache file
+    bounded by max_bytes, which the API workers share.
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        path: Union[None, str, Path] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.model = model if model is not None else Utils.EMBEDDINGS_MODEL
+        self.max_entries = (
+            max_entries if max_entries is not None else Utils.QUERY_CACHE_SIZE
+        )
+        self.path = (
+            Path(path)
+            if path
+            else Utils.get_embeddings_cache_path(Utils.QUERY_CACHE_FILENAME)
+        )
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else Utils.QUERY_CACHE_MAX_MB * 1024 * 1024
+        )
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._shared: Optional[EmbeddingsCache] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Returns the question lowercased, without extra spaces or end punctuation."""
+        return re.sub(r"\s+", " ", question).strip().rstrip("?!.;: ").lower()
+
+    def _shared_cache(self) -> Optional[EmbeddingsCache]:
+        if self.max_bytes <= 0:
+            return None
+        if self._shared is None:
+            self._shared = EmbeddingsCache(
+                model=self.model, path=self.path, max_bytes=self.max_bytes
+            )
+        return self._shared
+
+    def get(self, question: str) -> Optional[List[float]]:
+        """Returns the cached vector of a question, None if it was not asked before."""
+        key = self.normalize(question)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            shared = self._shared_cache()
+            embedding = shared.get_many([key])[0] if shared else None
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += 1
+            self._remember(key, embedding)
+            return embedding
+
+    def put(self, question: str, embedding: List[float]) -> None:
+        """Stores the vector of a question, skipping empty vectors."""
+        if not embedding:
+            return
+        key = self.normalize(question)
+        with self._lock:
+            self._remember(key, embedding)
+            shared = self._shared_cache()
+            if shared:
+                shared.put_many([key], [embedding])
+
+    def _remember(self, key: str, embedding: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the number of questions in memory."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def close(self) -> None:
+        """Closes the shared cache file."""
+        with self._lock:
+            if self._shared is not None:
+                self._shared.close()
+                self._shared = None
+
+
+query_cache = QueryEmbeddingsCache()
@@ -0,0 +1,241 @@
+"""Process-wide pool of the open handles of the books."""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+from .page_store import PageTextStore
+from .utils import Utils
+from .vector_store import VectorStore, get_backend, open_store, store_exists
+
+
+class BookHandles:
+    """The open handles of one book, each one created on first use."""
+
+    def __init__(self):
+        self.client = None
+        self.store: Optional[VectorStore] = None
+        self.pages: Optional[PageTextStore] = None
+
+    def close(self) -> None:
+        """
+        Closes the store and the page text of the book and drops the Chroma client.
+        chromadb has no public close for a client, its system is shared by every client
+        of the folder and reused when the folder is opened again.
+        """
+        if self.store is not None and hasattr(self.store, "close"):
+            self.store.close()
+        if self.pages is not None:
+            self.pages.close()
+        self.client = self.store = self.pages = None
+
+
+class ResourcePool:
+    """
+    LRU pool of the Chroma clients, vector stores and page text stores of the most
+    recently used books, so requests reuse open handles instead of building clients and
+    opening files every time. A book evicted past max_books, or invalidated because it
+    was re-ingested or uploaded again, has its handles closed. Callers hold a lease on
+    the book while they use its handles: the handles of a leased book are only closed
+    once the last lease ends.
+    """
+
+    def __init__(self, max_books: Optional[int] = None):
+        self.max_books = (
+            max_books if max_books is not None else Utils.RESOURCE_POOL_BOOKS
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._books: "OrderedDict[str, BookHandles]" = OrderedDict()
+        self._leases: Dict[str, int] = {}
+        self._retired: Dict[str, List[BookHandles]] = {}
+        self._opening: Dict[str, threading.Lock] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(output_folder: str) -> str:
+        return str(Utils.get_output_path(output_folder))
+
+    def _handles(self, key: str) -> BookHandles:
+        handles = self._books.get(key)
+        if handles is None:
+            handles = self._books[key] = BookHandles()
+        self._books.move_to_end(key)
+        while len(self._books) > max(1, self.max_books):
+            evicted_key, evicted = self._books.popitem(last=False)
+            self._close(evicted_key, evicted)
+            self.evictions += 1
+        return handles
+
+    def _close(self, key: str, handles: BookHandles) -> None:
+        if key in self._leases:
+            self._retired.setdefault(key, []).append(handles)
+            return
+        try:
+            handles.close()
+        except Exception as exc:
+            Utils.logger.warning("Failed to close the handles of %s: %s", key, exc)
+
+    def chroma_client(self, output_folder: str):
+        """Returns the Chroma client of a book folder, opening it on first use."""
+        key = self._key(output_folder)
+        if self.max_books <= 0:
+            return Utils.get_chroma_client(key)
+        with self._lock:
+            handles = self._handles(key)
+            if handles.client is None:
+                self.misses += 1
+                handles.client = Utils.get_chroma_client(key)
+            else:
+                self.hits += 1
+            return handles.client
+
+    def store(self, output_folder: str) -> Union[None, VectorStore]:
+        """
+        Returns the vector store of a book in the VECTOR_STORE backend, opening it on
+        first use, or None if the book has no store yet.
+        """
+        key = self._key(output_folder)
+        chroma = get_backend() == "chroma"
+        if self.max_books <= 0:
+            if not store_exists(key):
+                return None
+            return open_store(key)
+        with self._lock:
+            handles = self._books.get(key)
+            if handles is not None and handles.store is not None:
+                self._books.move_to_end(key)
+                self.hits += 1
+                return handles.store
+            if not chroma and not store_exists(key):
+                return None
+            if chroma and not (Path(key) / Utils.DEFAULT_DB_FILENAME).exists():
+                return None
+            handles = self._handles(key)
+            if chroma and handles.client is None:
+                handles.client = Utils.get_chroma_client(key)
+            if not store_exists(key, client=handles.client):
+                return None
+            self.misses += 1
+            handles.store = open_store(key, client=handles.client)
+            return handles.store
+
+    def pages(self, book_filename: str) -> PageTextStore:
+        """
+        Returns the page text store of a book, opening it on first use. Opening may
+        extract the text of the whole book, so it runs outside the pool lock, one thread
+        per book.
+        """
+        if self.max_books <= 0:
+            return PageTextStore.open(book_filename)
+        key = self._key(Utils.strip_extension(book_filename))
+        with self._lock:
+            handles = self._handles(key)
+            if handles.pages is not None:
+                self.hits += 1
+                return handles.pages
+            opening = self._opening.setdefault(key, threading.Lock())
+        with opening:
+            while True:
+                with self._lock:
+                    handles = self._handles(key)
+                    if handles.pages is not None:
+                        self.hits += 1
+                        return handles.pages
+                    generation = self._generations.get(key, 0)
+                pages = PageTextStore.open(book_filename)
+                with self._lock:
+                    # Invalidated while opening: the text may predate the new ingestion.
+                    if self._generations.get(key, 0) != generation:
+                        pages.close()
+                        continue
+                    self.misses += 1
+                    handles = self._handles(key)
+                    handles.pages = pages
+                    return pages
+
+    def invalidate(self, output_folder: str) -> None:
+        """Closes the handles of a book, the next request opens them again."""
+        key = self._key(output_folder)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            handles = self._books.pop(key, None)
+            if handles is not None:
+                self._close(key, handles)
+                self.invalidations += 1
+
+    def acquire(self, output_folder: str) -> None:
+        """Leases the handles of a book, they stay open until the matching release."""
+        key = self._key(output_folder)
+        with self._lock:
+            self._leases[key] = self._leases.get(key, 0) + 1
+
+    def release(self, output_folder: str) -> None:
+        """Ends a lease, closing the handles evicted or invalidated meanwhile."""
+        key = self._key(output_folder)
+        with self._lock:
+            # close() drops the leases at shutdown, before the requests holding
+            # them end.
+            if key not in self._leases:
+                return
+            self._leases[key] -= 1
+            if self._leases[key]:
+                return
+            del self._leases[key]
+            retired = self._retired.pop(key, [])
+        for handles in retired:
+            self._close(key, handles)
+
+    @contextmanager
+    def lease(self, output_folder: str) -> Iterator[None]:
+        """Holds the handles of a book open for the duration of the block."""
+        self.acquire(output_folder)
+        try:
+            yield
+        finally:
+            self.release(output_folder)
+
+    def close(self) -> None:
+        """Closes the handles of every book, leased ones included, for the shutdown."""
+        with self._lock:
+            self._leases.clear()
+            retired = [
+                (key, handles)
+                for key, books in self._retired.items()
+                for handles in books
+            ]
+            self._retired.clear()
+            retired.extend(self._books.items())
+            self._books.clear()
+            for key, handles in retired:
+                self._close(key, handles)
+
+    def stats(self) -> dict:
+        """Returns the hit/miss/eviction counters and the open handles."""
+        with self._lock:
+            books = list(self._books.values())
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "books": len(books),
+                "max_books": self.max_books,
+                "open_clients": sum(handles.client is not None for handles in books),
+                "open_stores": sum(handles.store is not None for handles in books),
+                "open_pages": sum(handles.pages is not None for handles in books),
+                "leased": len(self._leases),
+                "retired": sum(len(books) for books in self._retired.values()),
+            }
+
+
+resource_pool = ResourcePool()
@@ -2,13 +2,16 @@
 
 import os
 from pathlib import Path
-from typing import Union
+from typing import TYPE_CHECKING, Union
 from chromadb import AdminClient, PersistentClient
 from chromadb.api.models.Collection import Collection
 from chromadb.config import DEFAULT_DATABASE, DEFAULT_TENANT, Settings
 from dotenv import load_dotenv
 from app.logging import setup_logging
 
+if TYPE_CHECKING:
+    from app.vector_store import VectorStore
+
 load_dotenv(dotenv_path=Path(__file__).resolve().parents[2] / ".env")
 
 
@@ -24,6 +27,12 @@ class Utils:
         os.getenv("API_RECOVERY_CODE_EXPIRE_MINUTES", "10")
     )
     API_DB_NAME = os.getenv("API_DB_NAME", "users.db")
+    API_MAX_INGESTION_JOBS = int(os.getenv("API_MAX_INGESTION_JOBS", "1"))
+    API_JOB_POLL_SECONDS = float(os.getenv("API_JOB_POLL_SECONDS", "1"))
+    API_JOB_HEARTBEAT_SECONDS = float(os.getenv("API_JOB_HEARTBEAT_SECONDS", "10"))
+    API_JOB_STALE_SECONDS = float(os.getenv("API_JOB_STALE_SECONDS", "60"))
+    API_PROCESS_WORKERS = int(os.getenv("API_PROCESS_WORKERS", "2"))
+    API_CODE_TIMEOUT_SECONDS = float(os.getenv("API_CODE_TIMEOUT_SECONDS", "10"))
 
     # Environment-specific
     OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
@@ -37,6 +46,52 @@ class Utils:
     EXAM_MAX_RESULTS_PER_TOPIC = int(os.getenv("EXAM_MAX_RESULTS_PER_TOPIC", "3"))
     EXAM_MAX_CONTEXT_PAGES = int(os.getenv("EXAM_MAX_CONTEXT_PAGES", "12"))
     EXAM_MAX_QUESTIONS = int(os.getenv("EXAM_MAX_QUESTIONS", "50"))
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+    EMBED_BATCH_CHARS = int(os.getenv("EMBED_BATCH_CHARS", "32000"))
+    OLLAMA_MAX_INFLIGHT = int(os.getenv("OLLAMA_MAX_INFLIGHT", "4"))
+    OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+    OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+    OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+    OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5"))
+    OLLAMA_BREAKER_FAILURES = int(os.getenv("OLLAMA_BREAKER_FAILURES", "5"))
+    OLLAMA_BREAKER_RESET_SECONDS = float(
+        os.getenv("OLLAMA_BREAKER_RESET_SECONDS", "30")
+    )
+    PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "1"))
+    EMBEDDINGS_CACHE_FILENAME = os.getenv(
+        "EMBEDDINGS_CACHE_FILENAME", "embeddings_cache.sqlite3"
+    )
+    EMBEDDINGS_CACHE_MAX_MB = int(os.getenv("EMBEDDINGS_CACHE_MAX_MB", "512"))
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    QUERY_CACHE_FILENAME = os.getenv("QUERY_CACHE_FILENAME", "query_cache.sqlite3")
+    QUERY_CACHE_MAX_MB = int(os.getenv("QUERY_CACHE_MAX_MB", "64"))
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+    ANSWER_CACHE_FILENAME = os.getenv("ANSWER_CACHE_FILENAME", "answer_cache.sqlite3")
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+    ENRICH_REEMBED = os.getenv("ENRICH_REEMBED", "true").lower() in ("1", "true", "yes")
+    SUMMARY_MODE = os.getenv("SUMMARY_MODE", "chapter").lower()
+    SUMMARY_WINDOW_CHARS = int(os.getenv("SUMMARY_WINDOW_CHARS", "16000"))
+    SUMMARY_NUM_CTX = int(os.getenv("SUMMARY_NUM_CTX", "8192"))
+    DEDUP_MODE = os.getenv("DEDUP_MODE", "off")
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+    HEADER_FOOTER_MIN_PAGES = int(os.getenv("HEADER_FOOTER_MIN_PAGES", "4"))
+    HEADER_FOOTER_MIN_SHARE = float(os.getenv("HEADER_FOOTER_MIN_SHARE", "0.3"))
+    HEADER_FOOTER_MARGIN = float(os.getenv("HEADER_FOOTER_MARGIN", "0.1"))
+    VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
+    HNSW_SPACE = os.getenv("HNSW_SPACE", "").lower() or None
+    HNSW_M = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+    QUANTIZATION_RESCORE = int(os.getenv("QUANTIZATION_RESCORE", "4"))
+    LIBRARY_NLIST = int(os.getenv("LIBRARY_NLIST", "0"))
+    LIBRARY_PQ_M = int(os.getenv("LIBRARY_PQ_M", "32"))
+    LIBRARY_NPROBE = int(os.getenv("LIBRARY_NPROBE", "16"))
+    LIBRARY_TRAIN_SIZE = int(os.getenv("LIBRARY_TRAIN_SIZE", "65536"))
+    LIBRARY_RESCORE = int(os.getenv("LIBRARY_RESCORE", "4"))
+    RESOURCE_POOL_BOOKS = int(os.getenv("RESOURCE_POOL_BOOKS", "8"))
 
     def __init__(self, output_folder_name):
         self.output_folder_name = output_folder_name
@@ -60,6 +115,19 @@ class Utils:
             Path(output_path).mkdir(exist_ok=True)
         return output_path
 
+    @staticmethod
+    def get_embeddings_cache_path(filename: Union[None, str] = None) -> Path:
+        """
+        Returns the absolute path of an embeddings cache, shared by all the books.
+
+        Args:
+        filename (str, optional): The cache file, EMBEDDINGS_CACHE_FILENAME by default.
+        Returns:
+        Path: the absolute path to the cache file inside the /output/ folder of the app
+        """
+        root_path = Path(__file__).resolve().parents[2]
+        return root_path / "output" / (filename or Utils.EMBEDDINGS_CACHE_FILENAME)
+
     @staticmethod
     def get_data_path() -> Path:
         """
@@ -117,28 +185,29 @@ class Utils:
         return cleaned
 
     @staticmethod
-    def get_embeddings_db(output_folder: str) -> Union[None, Collection]:
+    def get_embeddings_db(
+        output_folder: str,
+    ) -> Union[None, Collection, "VectorStore"]:
         """
         Checks if a chromadb embeddings vector database exists within the specifief output folder
         If the database exists, the function checks from the embeddings collection and lastly, the
         collection exists, the function checks for the amount of records, if there are no records or
         either the collection or the database doesn't exist it returns None, otherwise returns the collection.
+        The store is opened with the VECTOR_STORE backend, Chroma by default, and kept
+        open in the resource pool for the next calls.
 
         Args:
         output_folder (str): The output folder where the database file should be
 
         Returns:
-        Union[None, chromadb.api.models.Collection.Collection]: the collection
+        Union[None, chromadb.api.models.Collection.Collection, VectorStore]: the
+            collection
         """
-        output_path = Utils.get_output_path(output_folder)
-        if (Path(output_path) / Utils.DEFAULT_DB_FILENAME).exists():
-            client = Utils.get_chroma_client(str(output_path))
-            if Utils.COLLECTION_NAME in [c.name for c in client.list_collections()]:
-                collection = client.get_collection(name=Utils.COLLECTION_NAME)
-                if collection.count() > 0:
-                    return collection
-                return None
-            return None
+        from app.resource_pool import resource_pool
+
+        collection = resource_pool.store(output_folder)
+        if collection is not None and collection.count() > 0:
+            return collection
         return None
 
     @staticmethod
@@ -0,0 +1,239 @@
+"""Vector store interface and the factory for the configured backend."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Optional, Protocol, Sequence, Union, runtime_checkable
+
+from .flat_store import FlatVectorStore
+from .hnsw_store import HnswVectorStore
+from .index_settings import IndexSettings
+from .utils import Utils
+
+BACKENDS = ("chroma", "flat", "hnsw")
+_FILE_BACKENDS = {"flat": FlatVectorStore, "hnsw": HnswVectorStore}
+
+
+@runtime_checkable
+class VectorStore(Protocol):
+    """
+    The subset of chromadb's Collection the app relies on. Chroma collections satisfy it
+    as they are, FlatVectorStore and HnswVectorStore implement it over files in the book
+    folder.
+    """
+
+    name: str
+
+    def count(self) -> int: ...
+
+    def add(self, ids, embeddings, metadatas=None, documents=None) -> None: ...
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None) -> None: ...
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None) -> None: ...
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[dict] = None,
+        include: Iterable[str] = ...,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> dict: ...
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Iterable[str] = ...,
+    ) -> dict: ...
+
+    def delete(
+        self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None
+    ) -> None: ...
+
+
+def get_backend(backend: Optional[str] = None) -> str:
+    """Returns the given backend, or VECTOR_STORE, checking it is supported."""
+    name = (backend or Utils.VECTOR_STORE).lower()
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown vector store '{name}', valid values = {', '.join(BACKENDS)}"
+        )
+    return name
+
+
+def store_exists(
+    path: Union[str, Path], backend: Optional[str] = None, client=None
+) -> bool:
+    """
+    Checks if the folder holds a store of the backend.
+
+    Args:
+    path (Union[str, Path]): The book output folder.
+    backend (str, optional): The backend name, defaults to VECTOR_STORE.
+    client (chromadb.PersistentClient, optional): An open Chroma client for the folder.
+    Returns:
+    bool: Whether the store exists.
+    """
+    name = get_backend(backend)
+    if name in _FILE_BACKENDS:
+        return _FILE_BACKENDS[name].exists(path)
+    if client is None:
+        if not (Path(path) / Utils.DEFAULT_DB_FILENAME).exists():
+            return False
+        client = Utils.get_chroma_client(str(path))
+    names = [c.name for c in client.list_collections()]
+    return Utils.COLLECTION_NAME in names or _previous_name() in names
+
+
+def _previous_name() -> str:
+    """Name of the collection a Chroma reindex moves aside until the new one is live."""
+    return f"{Utils.COLLECTION_NAME}_previous"
+
+
+def open_store(
+    path: Union[str, Path], backend: Optional[str] = None, client=None
+) -> VectorStore:
+    """
+    Opens the existing store of the backend in the folder. While a Chroma reindex swaps
+    the collections, the previous collection is opened instead of the missing live one.
+    """
+    name = get_backend(backend)
+    if name == "hnsw":
+        return _open_hnsw(path, IndexSettings.load(path))
+    if name == "flat":
+        return FlatVectorStore(path, rescore=Utils.QUANTIZATION_RESCORE)
+    client = client or Utils.get_chroma_client(str(path))
+    names = [c.name for c in client.list_collections()]
+    if Utils.COLLECTION_NAME not in names and _previous_name() in names:
+        return client.get_collection(name=_previous_name())
+    return client.get_collection(name=Utils.COLLECTION_NAME)
+
+
+def create_store(
+    path: Union[str, Path],
+    backend: Optional[str] = None,
+    client=None,
+    replace: bool = False,
+) -> VectorStore:
+    """
+    Creates an empty store of the backend in the folder, built with the index settings
+    of the book.
+
+    Args:
+    path (Union[str, Path]): The book output folder.
+    backend (str, optional): The backend name, defaults to VECTOR_STORE.
+    client (chromadb.PersistentClient, optional): An open Chroma client for the folder.
+    replace (bool): Whether to delete the existing Chroma collection first, file
+        backends always start from empty files.
+    Returns:
+    VectorStore: The new store.
+    """
+    name = get_backend(backend)
+    settings = IndexSettings.load(path)
+    if name == "hnsw":
+        HnswVectorStore.remove(path)
+        return _open_hnsw(path, settings)
+    if name == "flat":
+        FlatVectorStore.remove(path)
+        return FlatVectorStore(
+            path,
+            quantization=settings.quantization,
+            rescore=Utils.QUANTIZATION_RESCORE,
+        )
+    client = client or Utils.get_chroma_client(str(path))
+    if replace:
+        client.delete_collection(Utils.COLLECTION_NAME)
+    return client.create_collection(
+        name=Utils.COLLECTION_NAME, metadata=settings.chroma_metadata()
+    )
+
+
+def reindex_store(
+    path: Union[str, Path],
+    settings: Optional[IndexSettings] = None,
+    backend: Optional[str] = None,
+    client=None,
+    batch_size: int = 1000,
+) -> VectorStore:
+    """
+    Rebuilds the nearest neighbour index of a book from its stored vectors, without
+    embedding anything again, and saves the settings used for later builds.
+
+    Args:
+    path (Union[str, Path]): The book output folder.
+    settings (IndexSettings, optional): The new settings, defaults to the saved ones.
+    backend (str, optional): The backend name, defaults to VECTOR_STORE.
+    client (chromadb.PersistentClient, optional): An open Chroma client for the folder.
+    batch_size (int): The records copied per call when rebuilding a Chroma collection.
+    Returns:
+    VectorStore: The reindexed store.
+    """
+    name = get_backend(backend)
+    settings = settings or IndexSettings.load(path)
+    settings.save(path)
+    if name == "hnsw":
+        (Path(path) / HnswVectorStore.INDEX_FILENAME).unlink(missing_ok=True)
+        store = _open_hnsw(path, settings)
+        store.quantize(settings.quantization)
+        store.compact()
+        return store
+    if name == "flat":
+        store = FlatVectorStore(path, rescore=Utils.QUANTIZATION_RESCORE)
+        store.quantize(settings.quantization)
+        store.compact()
+        return store
+    # Chroma fixes the HNSW settings of a collection when it is created, so the records
+    # are copied into a new collection that then takes the place of the old one.
+    client = client or Utils.get_chroma_client(str(path))
+    staging_name = f"{Utils.COLLECTION_NAME}_reindex"
+    names = [c.name for c in client.list_collections()]
+    if _previous_name() in names:
+        # A swap was interrupted, the previous collection is the last complete one
+        if Utils.COLLECTION_NAME in names:
+            client.delete_collection(_previous_name())
+        else:
+            client.get_collection(name=_previous_name()).modify(
+                name=Utils.COLLECTION_NAME
+            )
+    if staging_name in names:
+        client.delete_collection(staging_name)
+    source = client.get_collection(name=Utils.COLLECTION_NAME)
+    target = client.create_collection(
+        name=staging_name, metadata=settings.chroma_metadata()
+    )
+    for offset in range(0, source.count(), batch_size):
+        records = source.get(
+            include=["embeddings", "metadatas", "documents"],
+            limit=batch_size,
+            offset=offset,
+        )
+        target.add(
+            ids=records["ids"],
+            embeddings=records["embeddings"],
+            metadatas=records["metadatas"],
+            documents=records["documents"],
+        )
+    # The old collection is only deleted once the new one is live under its name
+    source.modify(name=_previous_name())
+    try:
+        target.modify(name=Utils.COLLECTION_NAME)
+    except Exception:
+        source.modify(name=Utils.COLLECTION_NAME)
+        raise
+    client.delete_collection(_previous_name())
+    return client.get_collection(name=Utils.COLLECTION_NAME)
+
+
+def _open_hnsw(path: Union[str, Path], settings: IndexSettings) -> HnswVectorStore:
+    return HnswVectorStore(
+        path,
+        space=settings.space or "cosine",
+        m=settings.m,
+        ef_construction=settings.ef_construction,
+        ef_search=settings.ef_search,
+        quantization=settings.quantization,
+        rescore=Utils.QUANTIZATION_RESCORE,
+    )
@@ -0,0 +1,56 @@
+"""Answer cache unit testing."""
+
+from unittest.mock import MagicMock, patch
+
+from app.answer_cache import AnswerCache
+from app.assistant import Assistant
+
+
+def test_close_questions_hit_until_invalidated(tmp_path):
+    """Tests the similarity threshold, the book scope, LRU eviction and invalidation."""
+    cache = AnswerCache(path=tmp_path / "answers.sqlite3", max_entries=2, threshold=0.9)
+    assert cache.get("Book", [1.0, 0.0]) is None
+    cache.put("Book", "What is a deadlock?", [1.0, 0.0], "A cycle.", [{"pages": [1]}])
+    cache.put("Book", "Explain backprop", [0.0, 1.0], "Gradients.", [])
+    assert cache.get("Book", [0.99, 0.05]) == {
+        "answer": "A cycle.",
+        "references": [{"pages": [1]}],
+    }
+    assert cache.get("Book", [0.7, 0.7]) is None
+    assert cache.get("Other", [1.0, 0.0]) is None
+    cache.put("Book", "What is a mutex?", [0.6, -0.8], "A lock.", [])
+    assert cache.get("Book", [0.0, 1.0]) is None
+    cache.invalidate("Book")
+    assert cache.get("Book", [1.0, 0.0]) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["evictions"], stats["entries"]) == (1, 1, 0)
+
+
+def test_expired_answers_are_not_returned(tmp_path):
+    """Tests that answers older than the TTL are ignored."""
+    cache = AnswerCache(path=tmp_path / "answers.sqlite3", ttl_seconds=60)
+    cache.put("Book", "Why?", [1.0], "Because.", [])
+    with patch("app.answer_cache.time.time", return_value=10**12):
+        assert cache.get("Book", [1.0]) is None
+
+
+@patch("app.assistant.ollama")
+@patch("app.assistant.resource_pool")
+def test_assistant_answers_close_questions_from_the_cache(
+    mock_pool, mock_ollama, tmp_path
+):
+    """Tests that only the first of two close questions calls /generate."""
+    mock_pool.pages.return_value = MagicMock(__len__=lambda _self: 1, metadata={})
+    mock_ollama.embed.side_effect = [[[1.0, 0.0]], [[0.99, 0.01]]]
+    mock_ollama.post.return_value = {"response": "A cycle."}
+    collection = MagicMock()
+    collection.query.return_value = {"metadatas": [[{"page": 0, "title": "Intro"}]]}
+    cache = AnswerCache(path=tmp_path / "answers.sqlite3")
+    with patch("app.assistant.answer_cache", cache), patch(
+        "app.assistant.query_cache", MagicMock(get=MagicMock(return_value=None))
+    ):
+        assistant = Assistant("book.pdf", collection)
+        first = assistant.ask("What is a deadlock?")
+        assert assistant.ask("what's a deadlock") == first
+    assert first["answer"] == "A cycle."
+    mock_ollama.post.assert_called_once()
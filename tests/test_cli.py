@@ -3,6 +3,7 @@
 import pytest
 from unittest.mock import patch
 from app.cli import AppCLI
+from app.ollama_client import OllamaError
 
 
 @patch("app.cli.AppCLI.generatedb")
@@ -14,3 +15,14 @@ def test_all_calls(mock_cli_generatedb, mock_cli_ask):
     cli.all()
     mock_cli_generatedb.assert_called_once()
     mock_cli_ask.assert_called_once()
+
+
+@patch("builtins.input", side_effect=["Why?", "exit"])
+@patch("app.cli.Assistant")
+def test_ask_reports_ollama_errors(mock_assistant, _mock_input, capsys):
+    """Tests that an unreachable Ollama is reported and the session goes on."""
+    mock_assistant.return_value.ask_stream.side_effect = OllamaError("down")
+    cli = AppCLI("book.pdf")
+    cli.embeddings_collection = object()
+    cli.ask()
+    assert "Error retrieving the LLM response: down" in capsys.readouterr().out
@@ -0,0 +1,162 @@
+"""Client routes unit testing."""
+
+import asyncio
+import contextlib
+import io
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+from api.routes.client import ask_question, stream_answer, upload_book
+from api.schemas.actions import AskSchema
+from app.answer_cache import AnswerCache
+from app.assistant import Assistant
+from app.query_cache import QueryEmbeddingsCache
+from app.resource_pool import ResourcePool
+
+
+class SlowOllama:
+    """Async Ollama stand-in that takes a while to answer."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def aembed(self, _text):
+        await asyncio.sleep(0.1)
+        return [[1.0, 0.0]]
+
+    async def apost(self, _path, _payload, task):
+        await asyncio.sleep(0.4)
+        return {"response": "answer"}
+
+    async def astream(self, _path, _payload, task):
+        try:
+            for token in ["an", "swer"]:
+                await asyncio.sleep(0.05)
+                yield {"response": token, "done": False}
+            yield {"response": "", "done": True, "eval_count": 2}
+        finally:
+            self.closed = True
+
+
+def slow_query(**_kwargs):
+    """Blocking vector store query."""
+    time.sleep(0.2)
+    return {"metadatas": [[{"page": 0, "title": "Intro"}]]}
+
+
+@patch("app.assistant.resource_pool")
+@patch("app.assistant.query_cache", QueryEmbeddingsCache(max_entries=0, max_bytes=0))
+@patch("app.assistant.answer_cache", AnswerCache(max_entries=0))
+@patch("app.assistant.ollama", SlowOllama())
+@patch("app.utils.Utils.get_embeddings_db")
+def test_concurrent_questions_do_not_serialize(mock_embeddings_db, mock_pool):
+    """Tests that five questions answered at once take about as long as one."""
+    mock_embeddings_db.return_value.query.side_effect = slow_query
+    mock_pool.pages.return_value = MagicMock(__len__=lambda _self: 1, metadata={})
+    mock_pool.pages.return_value.page_text.return_value = "Page text"
+
+    async def ask_many():
+        return await asyncio.gather(
+            *(
+                ask_question(AskSchema(book_filename="book.pdf", question="Why?"), None)
+                for _ in range(5)
+            )
+        )
+
+    started = time.perf_counter()
+    answers = asyncio.run(ask_many())
+    assert time.perf_counter() - started < 1.5
+    assert [answer["answer"] for answer in answers] == ["answer"] * 5
+    assert answers[0]["references"] == [{"section": "Intro", "pages": [-1, 0, 1]}]
+
+
+@patch("app.assistant.resource_pool")
+@patch("app.assistant.query_cache", QueryEmbeddingsCache(max_entries=0, max_bytes=0))
+@patch("app.assistant.answer_cache", AnswerCache(max_entries=0))
+def test_streamed_answer_sends_references_first_and_stops_upstream(mock_pool):
+    """Tests the server-sent events of a streamed answer and a client disconnecting."""
+    mock_pool.pages.return_value = MagicMock(__len__=lambda _self: 1, metadata={})
+    mock_pool.pages.return_value.page_text.return_value = "Page text"
+    collection = MagicMock()
+    collection.query.return_value = {"metadatas": [[{"page": 0, "title": "Intro"}]]}
+    assistant = Assistant("book.pdf", collection)
+
+    async def read(ollama: SlowOllama, disconnect_after: int):
+        events = []
+
+        async def consume():
+            async for event in stream_answer(assistant, "Why?"):
+                events.append(json.loads(event[len("data: ") :]))
+
+        task = asyncio.create_task(consume())
+        while not task.done() and len(events) < disconnect_after:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        return events, ollama.closed
+
+    ollama = SlowOllama()
+    with patch("app.assistant.ollama", ollama):
+        assert asyncio.run(read(ollama, 10)) == (
+            [
+                {"references": [{"section": "Intro", "pages": [-1, 0, 1]}]},
+                {"token": "an"},
+                {"token": "swer"},
+                {"done": True},
+            ],
+            True,
+        )
+    ollama = SlowOllama()
+    with patch("app.assistant.ollama", ollama):
+        events, closed = asyncio.run(read(ollama, 2))
+    assert len(events) == 2 and closed
+
+
+@patch("api.routes.client.answer_cache")
+@patch("api.routes.client.resource_pool")
+@patch("app.utils.Utils.get_data_path")
+def test_upload_invalidates_the_folder_the_readers_use(
+    mock_data_path, mock_pool, mock_answer_cache, tmp_path
+):
+    """Tests that uploading a multi-word book drops its folder handles and answers."""
+    mock_data_path.return_value = tmp_path
+    upload = MagicMock(filename="Deep Learning.pdf", file=io.BytesIO(b"%PDF"))
+    asyncio.run(upload_book(upload, None))
+    assert (tmp_path / "DeepLearning.pdf").read_bytes() == b"%PDF"
+    mock_pool.invalidate.assert_called_once_with("Deeplearning")
+    mock_answer_cache.invalidate.assert_called_once_with("Deeplearning")
+
+
+@patch("app.assistant.resource_pool")
+@patch("app.assistant.query_cache", QueryEmbeddingsCache(max_entries=0, max_bytes=0))
+@patch("app.assistant.answer_cache", AnswerCache(max_entries=0))
+@patch("app.assistant.ollama", SlowOllama())
+@patch("app.utils.Utils.get_embeddings_db")
+def test_streamed_answer_leases_the_book_while_it_streams(
+    mock_embeddings_db, mock_pool
+):
+    """Tests that an unsent streamed answer holds no lease and a sent one releases."""
+    mock_embeddings_db.return_value.query.return_value = {
+        "metadatas": [[{"page": 0, "title": "Intro"}]]
+    }
+    mock_pool.pages.return_value = MagicMock(__len__=lambda _self: 1, metadata={})
+    mock_pool.pages.return_value.page_text.return_value = "Page text"
+    pool = ResourcePool(max_books=4)
+    query = AskSchema(book_filename="book.pdf", question="Why?", stream=True)
+
+    async def stream(send: bool):
+        response = await ask_question(query, None)
+        if not send:
+            return []
+        leased = []
+        async for _event in response.body_iterator:
+            leased.append(pool.stats()["leased"])
+        return leased
+
+    with patch("api.routes.client.resource_pool", pool):
+        assert asyncio.run(stream(send=False)) == []
+        assert pool.stats()["leased"] == 0
+        assert set(asyncio.run(stream(send=True))) == {1}
+        assert pool.stats()["leased"] == 0
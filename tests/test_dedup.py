@@ -0,0 +1,33 @@
+"""Chunk deduplication unit testing."""
+
+from app.dedup import ChunkDeduplicator
+
+BODY = (
+    "Gradient descent updates the parameters of a model in the opposite direction "
+    "of the gradient of the loss, the learning rate controls the size of every step "
+    "and too large a rate makes the training diverge while a small one makes it slow "
+    "to converge."
+)
+
+
+def test_exact_duplicates_ignore_case_and_spacing():
+    """Tests that exact mode matches normalized copies and records the covered pages."""
+    deduplicator = ChunkDeduplicator(mode="exact")
+    assert deduplicator.find_duplicate("0-0", "Copyright 2024 Publisher.", 0) is None
+    assert deduplicator.find_duplicate("3-1", "copyright  2024\nPUBLISHER", 3) == "0-0"
+    assert deduplicator.find_duplicate("4-0", BODY, 4) is None
+    assert deduplicator.covered_pages == {"0-0": {3}}
+    assert deduplicator.skipped == 1
+
+
+def test_near_duplicates_match_above_threshold_only():
+    """Tests that near mode matches a lightly edited copy but not different text."""
+    deduplicator = ChunkDeduplicator(mode="near", threshold=0.7)
+    assert deduplicator.find_duplicate("1-0", BODY, 1) is None
+    edited = BODY.replace("slow to converge.", "slow to converge!  (see page 12)")
+    assert deduplicator.find_duplicate("9-2", edited, 9) == "1-0"
+    other = (
+        "Backpropagation applies the chain rule layer by layer to get every gradient."
+    )
+    assert deduplicator.find_duplicate("9-3", other, 9) is None
+    assert not ChunkDeduplicator(mode="off").enabled
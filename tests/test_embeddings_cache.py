@@ -0,0 +1,35 @@
+"""Embeddings cache unit testing."""
+
+from app.embeddings_cache import EmbeddingsCache
+
+
+def test_cache_roundtrip_and_counters(tmp_path):
+    """Tests that stored vectors come back for the same model and text only."""
+    cache = EmbeddingsCache(model="model-a", path=tmp_path / "cache.sqlite3")
+    assert cache.get_many(["hello", "world"]) == [None, None]
+    cache.put_many(["hello", "world"], [[0.5, 1.0], []])
+    assert cache.get_many(["hello", "world"]) == [[0.5, 1.0], None]
+    other_model = EmbeddingsCache(model="model-b", path=tmp_path / "cache.sqlite3")
+    assert other_model.get_many(["hello"]) == [None]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 1)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Tests that the oldest untouched rows are evicted past the size limit."""
+    cache = EmbeddingsCache(model="m", path=tmp_path / "cache.sqlite3", max_bytes=16)
+    cache.put_many(["a", "b"], [[1.0, 1.0], [2.0, 2.0]])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [[3.0, 3.0]])
+    assert cache.get_many(["a", "b", "c"]) == [[1.0, 1.0], None, [3.0, 3.0]]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_size_is_tracked_across_rewrites(tmp_path):
+    """Tests that rewriting a text does not count its size twice towards the limit."""
+    cache = EmbeddingsCache(model="m", path=tmp_path / "cache.sqlite3", max_bytes=16)
+    cache.put_many(["a", "a"], [[1.0, 1.0], [1.5, 1.5]])
+    cache.put_many(["a", "b"], [[1.0, 1.0], [2.0, 2.0]])
+    assert cache.stats()["evictions"] == 0
+    reopened = EmbeddingsCache(model="m", path=tmp_path / "cache.sqlite3", max_bytes=16)
+    assert reopened._size == cache._size == reopened.stats()["bytes"] == 16
@@ -0,0 +1,106 @@
+"""Flat vector store unit testing."""
+
+from app.flat_store import FlatVectorStore, matches_where
+
+
+def make_store(tmp_path):
+    """Flat store with four records on two pages."""
+    store = FlatVectorStore.create(tmp_path)
+    store.upsert(
+        ids=["a", "b", "c", "d"],
+        embeddings=[[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 0]],
+        metadatas=[{"page": 1}, {"page": 1}, {"page": 2}, {"page": 2}],
+        documents=["A", "B", "C", "D"],
+    )
+    return store
+
+
+def test_query_orders_by_cosine_distance_and_filters(tmp_path):
+    """Tests batched top-k queries, distances and where filters."""
+    store = make_store(tmp_path)
+    results = store.query(
+        query_embeddings=[[1, 0.1, 0], [0, 0.1, 2]],
+        n_results=2,
+        include=["documents", "distances"],
+    )
+    assert results["ids"] == [["a", "d"], ["c", "b"]]
+    assert results["documents"][0] == ["A", "D"]
+    assert results["distances"][1][0] < results["distances"][1][1]
+
+    filtered = store.query(
+        query_embeddings=[[1, 0, 0]], n_results=5, where={"page": {"$in": [2]}}
+    )
+    assert filtered["ids"] == [["d", "c"]]
+
+
+def test_delete_compact_and_reopen(tmp_path):
+    """Tests that compact drops deleted rows and the store reloads from disk."""
+    store = make_store(tmp_path)
+    store.delete(where={"page": 1})
+    store.update(ids=["c"], metadatas=[{"enriched": True}])
+    store.compact()
+    store.close()
+
+    reopened = FlatVectorStore(tmp_path)
+    assert reopened.count() == 2
+    records = reopened.get(include=["metadatas"])
+    assert sorted(records["ids"]) == ["c", "d"]
+    assert reopened.get(ids=["c"], include=["metadatas"])["metadatas"] == [
+        {"page": 2, "enriched": True}
+    ]
+    assert reopened.query(query_embeddings=[[0, 1, 0]], n_results=1)["ids"] == [["d"]]
+
+
+def test_quantized_store_rescores_to_exact_order(tmp_path):
+    """Tests that int8 and float16 stores return the exact neighbours and distances."""
+    exact = make_store(tmp_path / "exact")
+    queries = [[1, 0.2, 0.1], [0.1, 0.3, 1]]
+    expected = exact.query(query_embeddings=queries, n_results=3)
+
+    def assert_same_results(results):
+        assert results["ids"] == expected["ids"]
+        assert results["documents"] == expected["documents"]
+        for found, wanted in zip(results["distances"], expected["distances"]):
+            assert all(abs(a - b) < 1e-6 for a, b in zip(found, wanted))
+
+    store = FlatVectorStore.create(tmp_path / "int8", quantization="int8")
+    store.upsert(
+        ids=["a", "b", "c", "d"],
+        embeddings=[[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 0]],
+        metadatas=[{"page": 1}, {"page": 1}, {"page": 2}, {"page": 2}],
+        documents=["A", "B", "C", "D"],
+    )
+    assert_same_results(store.query(query_embeddings=queries, n_results=3))
+    assert (tmp_path / "int8" / FlatVectorStore.SCALES_FILENAME).stat().st_size == 16
+
+    store.quantize("float16")
+    reopened = FlatVectorStore(tmp_path / "int8")
+    assert reopened.quantization == "float16"
+    assert_same_results(reopened.query(query_embeddings=queries, n_results=3))
+
+
+def test_metadata_columns_follow_updates_and_deletes(tmp_path):
+    """Tests that the array filters agree with matches_where as the records change."""
+    store = make_store(tmp_path)
+    store.update(ids=["b"], metadatas=[{"page": 3, "enriched": True}])
+    store.delete(where={"page": {"$lte": 1}})
+    store.upsert(ids=["e"], embeddings=[[0, 1, 1]], metadatas=[{"page": 4}])
+    records = store.get(include=["metadatas"])
+    for where in [
+        None,
+        {"page": {"$in": [2, 4]}},
+        {"enriched": True},
+        {"enriched": {"$ne": True}},
+        {"$or": [{"page": {"$gt": 3}}, {"page": 2}]},
+        {"$and": [{"page": {"$gte": 2}}, {"page": {"$nin": [2]}}]},
+    ]:
+        expected = [
+            record_id
+            for record_id, metadata in zip(records["ids"], records["metadatas"])
+            if matches_where(metadata, where)
+        ]
+        assert store.get(where=where)["ids"] == expected
+        assert sorted(store.query([[1, 1, 1]], n_results=9, where=where)["ids"][0]) == (
+            sorted(expected)
+        )
+    assert store.get()["ids"] == ["b", "c", "d", "e"]
@@ -0,0 +1,347 @@
+"""Embeddings generation unit testing."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+import pymupdf
+from app.generate_embeddings import EmbeddingsGenerator, _ordered_map
+from app.ollama_client import OllamaError
+from app.utils import Utils
+
+
+def fake_embed(inputs, **_kwargs):
+    """Returns one vector per input encoding its length, so order can be checked."""
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return [[float(len(text))] for text in inputs]
+
+
+def fake_chunks(**_kwargs):
+    """Five parsed chunks spread over two pages."""
+    for page, segment_index, text in [
+        (0, 0, "a"),
+        (0, 1, "bb"),
+        (1, 0, "ccc"),
+        (1, 1, "dddd"),
+        (1, 2, "eeeee"),
+    ]:
+        yield (text, 1, "Chapter", page, 0, segment_index)
+
+
+@patch("app.generate_embeddings.IndexBuilder")
+@patch("app.generate_embeddings.ollama")
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_chroma_client")
+def test_generate_embeddings_batches_embed_calls(
+    mock_chroma_client, mock_output_path, mock_ollama, mock_index_builder, tmp_path
+):
+    """Tests that chunks are embedded in micro-batches and stored in parse order."""
+    mock_output_path.return_value = tmp_path
+    mock_chroma_client.return_value.list_collections.return_value = []
+    collection = mock_chroma_client.return_value.create_collection.return_value
+    mock_index_builder.return_value.summarize_section.return_value = ("", [])
+    mock_ollama.embed.side_effect = fake_embed
+
+    generator = EmbeddingsGenerator("book.pdf")
+    generator.compute_page_hashes = MagicMock(return_value={"toc": "", "pages": []})
+    with patch.object(generator, "parse_pdf", side_effect=fake_chunks), patch.object(
+        Utils, "EMBED_BATCH_SIZE", 2
+    ), patch.object(Utils, "EMBEDDINGS_CACHE_MAX_MB", 0):
+        assert generator.generate_embeddings() is collection
+
+    assert mock_ollama.embed.call_count == 3
+    kwargs = collection.upsert.call_args.kwargs
+    assert kwargs["ids"] == ["0-0", "0-1", "1-0", "1-1", "1-2"]
+    assert kwargs["embeddings"] == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert [meta["page"] for meta in kwargs["metadatas"]] == [0, 0, 1, 1, 1]
+
+
+@patch("app.generate_embeddings.ollama")
+@patch("app.utils.Utils.get_chroma_client")
+def test_embed_texts_falls_back_on_mismatch(_mock_chroma_client, mock_ollama):
+    """Tests that a short batched response is retried one chunk at a time."""
+    mock_ollama.embed.side_effect = [[[1.0]], fake_embed("xy"), [[1.0]]]
+    generator = EmbeddingsGenerator("book.pdf")
+    chunks = [{"embedding_text": "xy"}, {"embedding_text": "z"}]
+    assert generator._embed_texts(chunks) == [[2.0], [1.0]]
+    assert mock_ollama.embed.call_count == 3
+
+
+@patch("app.generate_embeddings.ollama")
+@patch("app.utils.Utils.get_chroma_client")
+def test_embed_texts_skips_chunks_that_fail(_mock_chroma_client, mock_ollama):
+    """Tests that a failed batch is retried chunk by chunk, skipping failures."""
+    mock_ollama.embed.side_effect = [
+        OllamaError("HTTP 400: input too long"),
+        OllamaError("HTTP 400: input too long"),
+        [[1.0]],
+    ]
+    generator = EmbeddingsGenerator("book.pdf")
+    chunks = [{"embedding_text": "xy" * 5000}, {"embedding_text": "z"}]
+    assert generator._embed_texts(chunks) == [[], [1.0]]
+    assert mock_ollama.embed.call_count == 3
+
+
+def test_ordered_map_keeps_order_and_bounds_inflight():
+    """Tests that slow early calls keep their order and the window caps calls."""
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def work(item):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.01 * (5 - item % 5))
+        with lock:
+            state["running"] -= 1
+        return item * 10
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(_ordered_map(executor, work, range(12), 3))
+    assert results == [item * 10 for item in range(12)]
+    assert state["peak"] <= 3
+
+
+def make_book(path, toc=None):
+    """Writes a small PDF with a TOC and a few paragraphs per page."""
+    doc = pymupdf.open()
+    for page_number in range(7):
+        page = doc.new_page()
+        for paragraph in range(3):
+            page.insert_text(
+                (72, 72 + paragraph * 120),
+                f"Page {page_number} paragraph {paragraph}. " * 3,
+            )
+    doc.set_toc(
+        toc or [[1, "Intro", 1], [1, "Chapter 1", 2], [2, "Part A", 4], [1, "End", 7]]
+    )
+    doc.save(path)
+    doc.close()
+
+
+@patch("app.generate_embeddings.PARSE_PAGES_PER_TASK", 2)
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_data_path")
+@patch("app.utils.Utils.get_chroma_client")
+def test_parse_pdf_parallel_matches_sequential(
+    _mock_chroma_client, mock_data_path, mock_output_path, tmp_path
+):
+    """Tests that the process pool parse matches the in-process one."""
+    mock_data_path.return_value = tmp_path
+    mock_output_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    generator = EmbeddingsGenerator("book.pdf")
+    sequential = list(generator.parse_pdf(char_limit=60, overlap=10, workers=1))
+    parallel = list(generator.parse_pdf(char_limit=60, overlap=10, workers=2))
+    assert sequential
+    assert parallel == sequential
+    assert [chunk[3] for chunk in sequential] == sorted(
+        chunk[3] for chunk in sequential
+    )
+
+
+@patch("app.generate_embeddings.IndexBuilder")
+@patch("app.generate_embeddings.ollama")
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_data_path")
+@patch("app.utils.Utils.get_chroma_client")
+def test_incremental_update_of_pages_after_the_last_toc_entry(
+    _mock_chroma_client,
+    mock_data_path,
+    mock_output_path,
+    mock_ollama,
+    mock_index_builder,
+    tmp_path,
+):
+    """Tests that editing a page past the start of the last TOC entry does not crash."""
+    mock_data_path.return_value = tmp_path
+    mock_output_path.return_value = tmp_path
+    make_book(
+        tmp_path / "book.pdf", [[1, "Intro", 1], [1, "Chapter 1", 2], [1, "End", 5]]
+    )
+    mock_ollama.embed.side_effect = fake_embed
+    mock_index_builder.return_value.summarize_section.return_value = ("", [])
+    generator = EmbeddingsGenerator("book.pdf")
+    generator.compute_page_hashes = MagicMock(return_value={"toc": "", "pages": []})
+    collection = MagicMock()
+    with patch.object(generator, "check_collection", return_value=True), patch.object(
+        generator, "_get_collection", return_value=collection
+    ), patch.object(generator, "_get_changed_pages", return_value={3, 6}), patch.object(
+        Utils, "SUMMARY_MODE", "chapter"
+    ), patch.object(
+        Utils, "EMBEDDINGS_CACHE_MAX_MB", 0
+    ):
+        assert generator.generate_embeddings(incremental=True) is collection
+    assert len(generator.page_toc) == 5
+    mock_index_builder.return_value.rollup_summaries.assert_called_once_with([1])
+
+
+@patch("app.utils.Utils.get_chroma_client")
+def test_get_changed_pages(_mock_chroma_client):
+    """Tests the page diff against the stored hashes of the last ingestion."""
+    generator = EmbeddingsGenerator("book.pdf")
+    stored = {"toc": "t", "pages": ["a", "b", "c", "d"]}
+    with patch.object(generator, "_load_page_hashes", return_value=stored):
+        assert generator._get_changed_pages({"toc": "t", "pages": ["a", "x", "c"]}) == {
+            1,
+            3,
+        }
+        assert generator._get_changed_pages({"toc": "t2", "pages": ["a"]}) is None
+    with patch.object(generator, "_load_page_hashes", return_value={}):
+        assert generator._get_changed_pages({"toc": "t", "pages": ["a"]}) is None
+
+
+@patch("app.generate_embeddings.IndexBuilder")
+@patch("app.generate_embeddings.ollama")
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_chroma_client")
+def test_enrich_embeddings_updates_raw_chunks(
+    mock_chroma_client, mock_output_path, mock_ollama, mock_index_builder, tmp_path
+):
+    """Tests that enrichment summarizes the raw chunks and re-embeds them in order."""
+    mock_output_path.return_value = tmp_path
+    collection = mock_chroma_client.return_value.get_collection.return_value
+    metadatas = {
+        "1-0": {"page": 1, "segment": 0, "toc_index": 0, "enriched": False},
+        "0-0": {"page": 0, "segment": 0, "toc_index": 0, "enriched": False},
+    }
+    documents = {"1-0": "ccc", "0-0": "a"}
+    collection.count.return_value = 3
+
+    def fake_get(ids=None, **_kwargs):
+        ids = ids or list(metadatas)
+        return {
+            "ids": ids,
+            "documents": [documents[record_id] for record_id in ids],
+            "metadatas": [metadatas[record_id] for record_id in ids],
+        }
+
+    collection.get.side_effect = fake_get
+    index_builder = mock_index_builder.return_value
+    index_builder.summarize_section.return_value = ("sum", ["topic"])
+    mock_ollama.embed.side_effect = fake_embed
+
+    generator = EmbeddingsGenerator("book.pdf")
+    with patch.object(generator, "check_collection", return_value=True), patch.object(
+        Utils, "EMBEDDINGS_CACHE_MAX_MB", 0
+    ), patch.object(Utils, "SUMMARY_MODE", "chapter"):
+        assert generator.enrich_embeddings(reembed=True) is collection
+
+    kwargs = collection.update.call_args.kwargs
+    assert kwargs["ids"] == ["0-0", "1-0"]
+    assert all(
+        meta["enriched"] and meta["summary"] == "sum" for meta in kwargs["metadatas"]
+    )
+    hinted = "\n\nSummary: sum\nTopics: topic"
+    assert kwargs["embeddings"] == [
+        [float(len("a" + hinted))],
+        [float(len("ccc" + hinted))],
+    ]
+    assert index_builder.add_segment.call_count == 2
+    index_builder.summarize_section.assert_called_once_with(["a", "ccc"])
+    index_builder.rollup_summaries.assert_called_once_with()
+    assert generator.get_progress()["enrichment"] == {
+        "status": "done",
+        "enriched": 3,
+        "total": 3,
+    }
+
+
+def test_section_windows_split_on_node_and_size():
+    """Tests that summary windows never mix nodes nor pass SUMMARY_WINDOW_CHARS."""
+    chunks = [
+        {"toc_index": toc_index, "text": text}
+        for toc_index, text in [
+            (0, "aaaa"),
+            (0, "bbbb"),
+            (0, "cc"),
+            (1, "dd"),
+            (2, "e"),
+        ]
+    ]
+    with patch.object(Utils, "SUMMARY_WINDOW_CHARS", 8):
+        windows = list(EmbeddingsGenerator._section_windows(chunks))
+    assert [[chunk["text"] for chunk in window] for window in windows] == [
+        ["aaaa", "bbbb"],
+        ["cc"],
+        ["dd"],
+        ["e"],
+    ]
+
+
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_data_path")
+@patch("app.utils.Utils.get_chroma_client")
+def test_parse_pdf_starts_at_resume_position(
+    _mock_chroma_client, mock_data_path, mock_output_path, tmp_path
+):
+    """Tests that a resumed parse skips the pages and segments before the checkpoint."""
+    mock_data_path.return_value = tmp_path
+    mock_output_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    generator = EmbeddingsGenerator("book.pdf")
+    full = list(generator.parse_pdf(char_limit=60, overlap=10, workers=1))
+    expected = [chunk for chunk in full if (chunk[3], chunk[5]) > (3, 0)]
+    for workers in (1, 2):
+        resumed = list(
+            generator.parse_pdf(
+                char_limit=60,
+                overlap=10,
+                workers=workers,
+                start_page=3,
+                start_segment=0,
+            )
+        )
+        assert resumed == expected
+
+
+@patch("app.generate_embeddings.IndexBuilder")
+@patch("app.generate_embeddings.ollama")
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_chroma_client")
+def test_generate_embeddings_skips_duplicated_chunks(
+    mock_chroma_client, mock_output_path, mock_ollama, mock_index_builder, tmp_path
+):
+    """Tests that repeated chunks are not embedded and their pages are recorded."""
+    mock_output_path.return_value = tmp_path
+    mock_chroma_client.return_value.list_collections.return_value = []
+    collection = mock_chroma_client.return_value.create_collection.return_value
+    collection.get.return_value = {"ids": ["0-0"], "metadatas": [{"page": 0}]}
+    mock_index_builder.return_value.summarize_section.return_value = ("", [])
+    mock_ollama.embed.side_effect = fake_embed
+
+    def repeated_chunks(**_kwargs):
+        for page, segment_index, text in [
+            (0, 0, "All rights reserved."),
+            (0, 1, "bb"),
+            (1, 0, "ALL RIGHTS  reserved"),
+            (2, 0, "all rights reserved."),
+        ]:
+            yield (text, 1, "Chapter", page, 0, segment_index)
+
+    generator = EmbeddingsGenerator("book.pdf")
+    generator.compute_page_hashes = MagicMock(return_value={"toc": "", "pages": []})
+    with patch.object(
+        generator, "parse_pdf", side_effect=repeated_chunks
+    ), patch.object(Utils, "EMBEDDINGS_CACHE_MAX_MB", 0), patch.object(
+        Utils, "DEDUP_MODE", "exact"
+    ):
+        generator.generate_embeddings()
+
+    assert collection.upsert.call_args.kwargs["ids"] == ["0-0", "0-1"]
+    collection.update.assert_called_once_with(
+        ids=["0-0"], metadatas=[{"page": 0, "duplicate_pages": "1, 2"}]
+    )
+
+
+def test_incremental_update_reparses_pages_of_deleted_duplicates():
+    """Tests that pages whose text was only stored as a duplicate are parsed again."""
+    collection = MagicMock()
+    collection.get.side_effect = [
+        {"metadatas": [{"page": 3, "duplicate_pages": "7, 9"}, {"page": 4}]},
+        {"metadatas": [{"page": 9, "duplicate_pages": "12"}]},
+        {"metadatas": []},
+    ]
+    assert EmbeddingsGenerator._get_duplicate_pages(collection, {3, 4}) == {7, 9, 12}
+    assert collection.get.call_args_list[1].kwargs["where"] == {"page": {"$in": [7, 9]}}
@@ -0,0 +1,87 @@
+"""Header/footer detection unit testing."""
+
+from unittest.mock import patch
+import pymupdf
+from app.headers import HeaderFooterFilter
+
+
+def make_book(path, pages=6):
+    """Writes a PDF with a running header, a page number footer and a distinct body."""
+    doc = pymupdf.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 40), "Deep Learning Fundamentals")
+        page.insert_text((72, 300), f"Body text of page {page_number}, unique content.")
+        page.insert_text((300, 820), f"Page {page_number + 1}")
+    doc.save(path)
+    doc.close()
+
+
+@patch("app.utils.Utils.get_output_path")
+def test_detects_and_strips_repeated_margin_blocks(mock_output_path, tmp_path):
+    """Tests that headers and numbered footers are dropped and the result cached."""
+    mock_output_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    with pymupdf.open(tmp_path / "book.pdf") as book:
+        header_filter = HeaderFooterFilter("book.pdf")
+        assert len(header_filter.load(book)) == 2
+        text = header_filter.page_text(book.load_page(2))
+        assert "Body text of page 2" in text
+        assert "Deep Learning" not in text and "Page 3" not in text
+
+        with patch.object(HeaderFooterFilter, "detect") as detect:
+            cached = HeaderFooterFilter("book.pdf")
+            assert cached.load(book) == header_filter.signatures
+            detect.assert_not_called()
+    assert (tmp_path / "headers_footers.json").exists()
+
+
+@patch("app.utils.Utils.get_output_path")
+def test_rare_margin_blocks_are_kept(mock_output_path, tmp_path):
+    """Tests that blocks on fewer than HEADER_FOOTER_MIN_PAGES pages are kept."""
+    mock_output_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf", pages=3)
+    with pymupdf.open(tmp_path / "book.pdf") as book:
+        header_filter = HeaderFooterFilter("book.pdf")
+        assert not header_filter.load(book)
+        assert "Deep Learning" in header_filter.page_text(book.load_page(0))
+
+
+@patch("app.utils.Utils.get_output_path")
+def test_revised_book_with_the_same_page_count_is_detected_again(
+    mock_output_path, tmp_path
+):
+    """Tests that the cache is keyed on the book file, not only its page count."""
+    mock_output_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    with pymupdf.open(tmp_path / "book.pdf") as book:
+        HeaderFooterFilter("book.pdf").load(book)
+    make_book(tmp_path / "book.pdf")
+    with pymupdf.open(tmp_path / "book.pdf") as book:
+        book.load_page(0).insert_text((72, 500), "Revised")
+        book.saveIncr()
+    with pymupdf.open(tmp_path / "book.pdf") as book:
+        with patch.object(HeaderFooterFilter, "detect", return_value=set()) as detect:
+            HeaderFooterFilter("book.pdf").load(book)
+            detect.assert_called_once()
+
+
+@patch("app.utils.Utils.get_output_path")
+def test_threshold_grows_with_the_page_count(mock_output_path, tmp_path):
+    """Tests that a block must recur on HEADER_FOOTER_MIN_SHARE of long books."""
+    mock_output_path.return_value = tmp_path
+    assert HeaderFooterFilter.min_pages(6) == 4
+    assert HeaderFooterFilter.min_pages(600) == 180
+    doc = pymupdf.open()
+    for page_number in range(20):
+        page = doc.new_page()
+        if page_number < 5:
+            page.insert_text((72, 40), "Chapter 1")
+        page.insert_text((72, 300), f"Body text of page {page_number}.")
+        page.insert_text((300, 820), f"Page {page_number + 1}")
+    doc.save(tmp_path / "book.pdf")
+    doc.close()
+    with pymupdf.open(tmp_path / "book.pdf") as book:
+        header_filter = HeaderFooterFilter("book.pdf")
+        assert len(header_filter.load(book)) == 1
+        assert "Chapter 1" in header_filter.page_text(book.load_page(0))
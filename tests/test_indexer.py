@@ -0,0 +1,103 @@
+"""Index builder unit testing."""
+
+from unittest.mock import patch
+import pymupdf
+from app.indexer import IndexBuilder
+
+
+def make_book(path):
+    """Writes a PDF with a chapter split in two sections and a second chapter."""
+    doc = pymupdf.open()
+    for _page in range(4):
+        doc.new_page()
+    doc.set_toc(
+        [
+            [1, "Chapter 1", 1],
+            [2, "Section A", 1],
+            [2, "Section B", 2],
+            [1, "Chapter 2", 4],
+        ]
+    )
+    doc.save(path)
+    doc.close()
+
+
+@patch("app.utils.Utils.get_data_path")
+def test_rollup_summaries_to_parents(mock_data_path, tmp_path):
+    """Tests that parents get one summary call over their children and their topics."""
+    mock_data_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    builder = IndexBuilder("book.pdf")
+    builder.add_segment(1, "a", summary="About A.", topics=["alpha"])
+    builder.add_segment(2, "b", summary="About B.", topics=["beta"])
+    with patch.object(
+        builder, "_request_summary", return_value=("About A and B.", ["gamma"])
+    ) as request_summary:
+        builder.rollup_summaries()
+    request_summary.assert_called_once()
+    assert "- Section A: About A." in request_summary.call_args.args[2]
+    chapter = builder.nodes[0]
+    assert chapter.summary_lines == ["About A and B."]
+    assert chapter.topics == {"alpha", "beta", "gamma"}
+    assert not builder.nodes[3].summary_lines
+
+    with patch.object(builder, "_request_summary") as request_summary:
+        builder.rollup_summaries([3])
+    request_summary.assert_not_called()
+
+
+@patch("app.utils.Utils.get_data_path")
+def test_rollup_after_a_revised_section_replaces_the_chapter_summary(
+    mock_data_path, tmp_path
+):
+    """Tests that resetting a section and its chapter rolls up the new text only."""
+    mock_data_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    builder = IndexBuilder("book.pdf")
+    builder.add_segment(1, "a", summary="About A.", topics=["alpha"])
+    builder.add_segment(2, "b", summary="About B.", topics=["beta"])
+    with patch.object(builder, "_request_summary", return_value=("Old.", ["old"])):
+        builder.rollup_summaries()
+
+    assert builder.with_ancestors([2, 9]) == [0, 2]
+    builder.reset_nodes(builder.with_ancestors([2]))
+    builder.add_segment(2, "b", summary="About C.", topics=["delta"])
+    with patch.object(
+        builder, "_request_summary", return_value=("New.", ["new"])
+    ) as request_summary:
+        builder.rollup_summaries([2])
+    assert "- Section B: About C." in request_summary.call_args.args[2]
+    chapter = builder.nodes[0]
+    assert chapter.summary_lines == ["New."]
+    assert chapter.topics == {"alpha", "delta", "new"}
+
+
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_data_path")
+def test_journal_replay_and_compaction(mock_data_path, mock_output_path, tmp_path):
+    """Tests that journaled deltas are replayed on load and folded by compaction."""
+    mock_data_path.return_value = tmp_path
+    mock_output_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    builder = IndexBuilder("book.pdf")
+    builder.add_segment(1, "a", summary="First.", topics=["alpha"])
+    builder.write_journal()
+    builder.add_segment(1, "a", summary="Second.", topics=["beta"])
+    builder.add_segment(3, "c", summary="Other.", topics=["gamma"])
+    builder.write_journal()
+    journal = tmp_path / "topics_index.journal.jsonl"
+    assert len(journal.read_text(encoding="utf-8").splitlines()) == 3
+    with open(journal, "a", encoding="utf-8") as handle:
+        handle.write('{"number": "1.1", "summary_lin')
+
+    resumed = IndexBuilder("book.pdf")
+    assert resumed.load_json_index()
+    assert resumed.nodes[1].summary_lines == ["First.", "Second."]
+    assert resumed.nodes[1].topics == {"alpha", "beta"}
+    assert resumed.nodes[3].summary_lines == ["Other."]
+
+    resumed.compact_index()
+    assert not journal.exists()
+    reloaded = IndexBuilder("book.pdf")
+    assert reloaded.load_json_index()
+    assert reloaded.nodes[3].topics == {"gamma"}
@@ -0,0 +1,89 @@
+"""Ingestion job queue unit testing."""
+
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from api.controllers.job import JobController
+from api.controllers.scheduler import IngestionScheduler
+from api.db import Database
+from api.routes.client import cancel_job, get_job, list_jobs
+
+
+def make_controller(tmp_path):
+    """Job controller on a throwaway sqlite database."""
+    return JobController(Database(f"sqlite:///{tmp_path / 'jobs.db'}"))
+
+
+def test_claim_order_and_concurrency_cap(tmp_path):
+    """Tests priority ordering, the server wide cap and one running job per book."""
+    controller = make_controller(tmp_path)
+    low = controller.enqueue("a.pdf")
+    high = controller.enqueue("b.pdf", priority=5)
+    same_book = controller.enqueue("b.pdf", action="enrich", priority=9)
+    assert controller.enqueue("a.pdf").idx == low.idx
+
+    assert controller.claim_next(1, "w1").idx == same_book.idx
+    assert controller.claim_next(1, "w2") is None
+    assert controller.claim_next(3, "w2").idx == low.idx
+    assert controller.claim_next(3, "w2") is None
+    controller.finish(same_book.idx, "done", owner="w1")
+    claimed = controller.claim_next(3, "w2")
+    assert claimed.idx == high.idx and claimed.owner == "w2" and claimed.heartbeat_at
+
+
+def test_cancel_and_requeue_interrupted(tmp_path):
+    """Tests that queued jobs cancel at once and orphaned running ones resume."""
+    controller = make_controller(tmp_path)
+    queued = controller.enqueue("a.pdf")
+    running = controller.enqueue("b.pdf")
+    cancelling = controller.enqueue("c.pdf")
+    controller.claim_next(1, "alive")
+    controller.claim_next(2, "dead")
+    controller.claim_next(3, "dead")
+    assert controller.cancel(cancelling.idx).cancel_requested
+    assert controller.requeue_interrupted(stale_seconds=60) == 0
+
+    with patch("api.controllers.job.datetime") as mock_datetime:
+        mock_datetime.utcnow.return_value = datetime.utcnow() + timedelta(minutes=2)
+        controller.heartbeat("alive")
+        assert controller.requeue_interrupted(stale_seconds=60) == 2
+    assert not controller.update_progress(queued.idx, "{}", "alive")
+    assert controller.update_progress(running.idx, "{}", "dead")
+    assert controller.get(cancelling.idx).status == "cancelled"
+    restarted = controller.get(running.idx)
+    assert restarted.status == "queued" and restarted.resume
+
+    other = controller.enqueue("d.pdf")
+    assert controller.cancel(other.idx).status == "cancelled"
+    assert controller.get(queued.idx).status == "running"
+
+
+@patch("api.controllers.scheduler.EmbeddingsGenerator")
+def test_scheduler_runs_job_and_queues_enrichment(mock_generator, tmp_path):
+    """Tests that a worker stores job progress and queues enriching fast jobs."""
+    controller = make_controller(tmp_path)
+    mock_generator.return_value.generate_embeddings.return_value = (
+        event
+        for event in ['data: {"progress": "1/2"}\n\n', 'data: {"progress": "done"}\n\n']
+    )
+    job = controller.enqueue("a.pdf", fast=True, priority=2)
+    scheduler = IngestionScheduler(workers=1)
+    scheduler._run(controller, controller.claim_next(1, scheduler.owner))
+
+    finished = controller.get(job.idx)
+    assert finished.status == "done"
+    assert finished.progress == '{"progress": "done"}'
+    enrich = controller.claim_next(1, scheduler.owner)
+    assert enrich.action == "enrich" and enrich.priority == 1
+
+
+def test_job_routes_share_one_controller(tmp_path):
+    """Tests that the job routes use the shared controller off the event loop."""
+    controller = make_controller(tmp_path)
+    with patch("api.controllers.job._shared", controller), patch(
+        "api.routes.client.scheduler"
+    ):
+        job = asyncio.run(get_job(controller.enqueue("a.pdf").idx, None))
+        assert job["status"] == "queued"
+        assert asyncio.run(cancel_job(job["idx"], None))["status"] == "cancelled"
+        assert [job["idx"] for job in asyncio.run(list_jobs(10, 0, None))] == [1]
@@ -0,0 +1,91 @@
+"""Library-wide IVF-PQ index unit testing."""
+
+import sqlite3
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from app.benchmark import exact_neighbours, make_queries, make_vectors
+from app.flat_store import FlatVectorStore
+from app.library_index import LIBRARY_FOLDER, IVFPQIndex, LibraryIndex, shared_library
+
+
+def test_ivfpq_search_and_reload(tmp_path):
+    """Tests that the PQ search finds most exact neighbours and survives a save/load."""
+    vectors = make_vectors(2000, 32)
+    queries = make_queries(vectors, 20)
+    index = IVFPQIndex.train(vectors, nlist=16, m=8, iterations=5)
+    index.add_encoded(*index.encode(vectors), np.arange(len(vectors)))
+    distances, labels = index.search(queries, k=10, nprobe=16)
+    truth = exact_neighbours(vectors, queries, 10)
+    hits = sum(len(expected & set(row)) for expected, row in zip(truth, labels))
+    assert hits / (10 * len(queries)) > 0.3
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+    index.save(tmp_path)
+    reloaded = IVFPQIndex.load(tmp_path)
+    assert (reloaded.search(queries, k=10, nprobe=16)[1] == labels).all()
+
+
+def test_library_build_and_rescored_query(tmp_path):
+    """Tests that a library of two books returns the exact top chunks of both."""
+    vectors = make_vectors(600, 16)
+    for book, rows in (("One", range(300)), ("Two", range(300, 600))):
+        store = FlatVectorStore.create(tmp_path / book)
+        store.upsert(
+            ids=[str(row) for row in rows],
+            embeddings=vectors[list(rows)].tolist(),
+            metadatas=[{"page": row} for row in rows],
+        )
+        store.compact()
+
+    def output_path(name, create=False):
+        return tmp_path / name
+
+    with patch(
+        "app.library_index.Utils.get_output_path", side_effect=output_path
+    ), patch("app.library_index.Utils.VECTOR_STORE", "flat"):
+        library = LibraryIndex.build(
+            books=["one.pdf", "two.pdf"], nlist=8, m=4, train_size=600
+        )
+        assert LibraryIndex.exists()
+        queries = make_queries(vectors, 5)
+        found = library.query(queries, n_results=3, nprobe=8, rescore=20)
+    truth = exact_neighbours(vectors, queries, 3)
+    for expected, ids, books, metadatas in zip(
+        truth, found["ids"], found["books"], found["metadatas"]
+    ):
+        assert {int(record_id) for record_id in ids} == expected
+        assert [meta["page"] for meta in metadatas] == [int(i) for i in ids]
+        assert all(
+            book == ("one.pdf" if int(i) < 300 else "two.pdf")
+            for book, i in zip(books, ids)
+        )
+    library.close()
+
+
+def test_library_query_of_deleted_chunks_and_rebuild(tmp_path):
+    """Tests that deleted chunks are dropped and a rebuild replaces the old build."""
+    vectors = make_vectors(200, 8)
+    store = FlatVectorStore.create(tmp_path / "One")
+    store.upsert(ids=[str(row) for row in range(200)], embeddings=vectors.tolist())
+
+    def output_path(name, create=False):
+        return tmp_path / name
+
+    with patch(
+        "app.library_index.Utils.get_output_path", side_effect=output_path
+    ), patch("app.library_index.Utils.VECTOR_STORE", "flat"):
+        LibraryIndex.build(books=["one.pdf"], nlist=4, m=2, train_size=200)
+        library = shared_library()
+        assert library.count() == 200 and shared_library() is library
+        store.delete(ids=[str(row) for row in range(200)])
+        found = library.query(vectors[:2], n_results=3, nprobe=4, rescore=2)
+        assert found["ids"] == [[], []] and found["distances"] == [[], []]
+
+        store.upsert(ids=["new"], embeddings=vectors[:1].tolist())
+        LibraryIndex.build(books=["one.pdf"], nlist=1, m=2, train_size=200)
+        assert shared_library().count() == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        library.count()
+    assert len(list((tmp_path / LIBRARY_FOLDER).glob("build-*"))) == 1
@@ -0,0 +1,110 @@
+"""Ollama client unit testing."""
+
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from app.ollama_client import (
+    CircuitBreaker,
+    OllamaClient,
+    OllamaError,
+    OllamaUnavailable,
+)
+
+
+def fake_response(status_code, data=None):
+    """Returns a response stand-in with a status and a JSON body."""
+    response = MagicMock(status_code=status_code, text=json.dumps(data or {}))
+    response.json.return_value = data or {}
+    return response
+
+
+@patch("app.ollama_client.time.sleep")
+def test_retries_server_errors_and_accounts_tokens(mock_sleep):
+    """Tests that a 503 and a connection reset are retried and counted."""
+    client = OllamaClient(base_url="http://ollama", retries=2, backoff=0.1)
+    session = MagicMock()
+    session.post.side_effect = [
+        fake_response(503),
+        requests.ConnectionError("reset"),
+        fake_response(200, {"response": "hi", "prompt_eval_count": 7, "eval_count": 3}),
+    ]
+    with patch.object(client, "_session", return_value=session):
+        assert client.generate("Hello?", task="summary") == "hi"
+    assert session.post.call_args.kwargs["timeout"][1] == 120
+    assert mock_sleep.call_count == 2
+    stats = client.stats()["tasks"]["summary"]
+    assert (stats["calls"], stats["retries"], stats["failures"]) == (1, 2, 0)
+    assert (stats["prompt_tokens"], stats["output_tokens"]) == (7, 3)
+
+
+@patch("app.ollama_client.time.sleep")
+def test_breaker_fails_fast_until_the_trial_call(_mock_sleep):
+    """Tests that the breaker opens after failures and closes after a success."""
+    breaker = CircuitBreaker(failures=2, reset_seconds=60)
+    client = OllamaClient(base_url="http://ollama", retries=0, breaker=breaker)
+    session = MagicMock()
+    session.post.side_effect = requests.ConnectionError("refused")
+    with patch.object(client, "_session", return_value=session):
+        for _ in range(2):
+            with pytest.raises(OllamaError):
+                client.embed("text")
+        with pytest.raises(OllamaUnavailable):
+            client.embed("text")
+        assert session.post.call_count == 2
+        assert breaker.state == "open"
+
+        session.post.side_effect = None
+        session.post.return_value = fake_response(200, {"embeddings": [[1.0]]})
+        breaker.reset_seconds = 0
+        assert client.embed("text") == [[1.0]]
+    assert breaker.state == "closed"
+    assert client.stats()["tasks"]["embed"]["failures"] == 3
+
+
+def test_read_timeouts_are_not_retried():
+    """Tests that a call that already waited its whole timeout fails right away."""
+    client = OllamaClient(base_url="http://ollama", retries=3)
+    session = MagicMock()
+    session.post.side_effect = requests.ReadTimeout("slow")
+    with patch.object(client, "_session", return_value=session), pytest.raises(
+        OllamaError
+    ):
+        client.post("/generate", {}, task="classify")
+    assert session.post.call_count == 1
+
+
+def test_client_errors_and_bad_json_fail_the_call():
+    """Tests that a 4xx and an unreadable body fail the call but not the breaker."""
+    breaker = CircuitBreaker(failures=2, reset_seconds=60)
+    client = OllamaClient(base_url="http://ollama", retries=3, breaker=breaker)
+    session = MagicMock()
+    session.post.return_value = fake_response(404, {"error": "model 'x' not found"})
+    with patch.object(client, "_session", return_value=session):
+        with pytest.raises(OllamaError, match="HTTP 404: model 'x' not found"):
+            client.embed("text")
+        assert session.post.call_count == 1
+
+        session.post.return_value = fake_response(200)
+        session.post.return_value.json.side_effect = ValueError("not JSON")
+        with pytest.raises(OllamaError, match="not JSON"):
+            client.generate("Hello?")
+    assert client.stats()["tasks"]["embed"]["failures"] == 1
+    assert client.stats()["tasks"]["answer"]["calls"] == 0
+    assert breaker.state == "closed"
+
+
+def test_cancelled_trial_call_gives_the_trial_back():
+    """Tests that a half open breaker allows a new trial after a cancelled one."""
+    breaker = CircuitBreaker(failures=1, reset_seconds=0)
+    client = OllamaClient(base_url="http://ollama", retries=0, breaker=breaker)
+    breaker.record_failure()
+    http = MagicMock()
+    http.send.side_effect = asyncio.CancelledError
+    with patch.object(client, "_http", return_value=http):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(client.aembed("text"))
+    assert breaker.allow()
@@ -0,0 +1,55 @@
+"""Page text store unit testing."""
+
+from unittest.mock import patch
+
+import pymupdf
+import pytest
+from app.exam import ExamGenerator
+from app.page_store import PageTextStore
+
+
+def make_book(path, pages=6):
+    """Writes a PDF with a running header and a distinct body per page."""
+    doc = pymupdf.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 40), "Deep Learning Fundamentals")
+        page.insert_text((72, 300), f"Body text of page {page_number}, é unique.")
+    doc.set_metadata({"title": "Fundamentals", "author": "Someone"})
+    doc.save(path)
+    doc.close()
+
+
+@patch("app.utils.Utils.get_output_path")
+@patch("app.utils.Utils.get_data_path")
+def test_pages_are_read_without_the_pdf(mock_data_path, mock_output_path, tmp_path):
+    """Tests that the store is extracted once and then serves pages on its own."""
+    mock_data_path.return_value = tmp_path
+    mock_output_path.return_value = tmp_path
+    make_book(tmp_path / "book.pdf")
+    pages = PageTextStore.open("book.pdf")
+    assert len(pages) == 6
+    assert pages.metadata == {"title": "Fundamentals", "author": "Someone"}
+    assert "Body text of page 3, é unique." in pages.page_text(3)
+    assert "Deep Learning" not in pages.page_text(3)
+    with pytest.raises(IndexError):
+        pages.page_text(6)
+
+    (tmp_path / "book.pdf").unlink()
+    with patch("app.page_store.pymupdf.open") as pdf_open:
+        chapter = ExamGenerator("book.pdf")._extract_chapter_text(4, 10)
+        pdf_open.assert_not_called()
+    assert "page 4" in chapter and "page 5" in chapter and "page 3" not in chapter
+
+
+@patch("app.utils.Utils.get_output_path")
+def test_rewrite_leaves_open_stores_readable(mock_output_path, tmp_path):
+    """Tests that a new write goes to new files instead of replacing the mapped ones."""
+    mock_output_path.return_value = tmp_path
+    PageTextStore.write("book.pdf", ["first", "second"])
+    pages = PageTextStore("book.pdf")
+    PageTextStore.write("book.pdf", ["revised"])
+    assert pages.page_text(1) == "second"
+    assert PageTextStore("book.pdf").pages_text(0, 5) == ["revised"]
+    assert len(list(tmp_path.glob("pages*.bin"))) == 1
+    pages.close()
@@ -0,0 +1,65 @@
+"""Ingestion pipeline unit testing."""
+
+import time
+import pytest
+from app.pipeline import Pipeline
+
+
+def regroup(items, size=3):
+    """Groups the items of a stream in lists of `size`."""
+    group = []
+    for item in items:
+        group.append(item)
+        if len(group) == size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def test_pipeline_keeps_order_and_counts():
+    """Tests that items flow through map and regroup stages in order with stats."""
+    pipeline = (
+        Pipeline(range(10), name="parse", queue_size=2)
+        .add_stage("double", lambda items: (item * 2 for item in items))
+        .add_stage("batch", regroup)
+    )
+    assert list(pipeline.run()) == [[0, 2, 4], [6, 8, 10], [12, 14, 16], [18]]
+    stats = pipeline.stats()
+    assert [stats[name]["processed"] for name in ("parse", "double", "batch")] == [
+        10,
+        10,
+        4,
+    ]
+    assert stats["parse"]["queue_size"] == 2
+
+
+def test_pipeline_propagates_stage_errors():
+    """Tests that an exception in a middle stage reaches the consumer."""
+
+    def explode(items):
+        for item in items:
+            if item == 3:
+                raise ValueError("bad chunk")
+            yield item
+
+    pipeline = Pipeline(range(10)).add_stage("explode", explode)
+    with pytest.raises(ValueError, match="bad chunk"):
+        list(pipeline.run())
+
+
+def test_pipeline_backpressure_bounds_source():
+    """Tests that a stalled consumer stops the source once the queues are full."""
+    produced = []
+
+    def source():
+        for item in range(1000):
+            produced.append(item)
+            yield item
+
+    pipeline = Pipeline(source(), queue_size=2).add_stage("copy", lambda items: items)
+    results = pipeline.run()
+    assert next(results) == 0
+    time.sleep(0.2)
+    assert len(produced) < 10
+    results.close()
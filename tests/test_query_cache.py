@@ -0,0 +1,36 @@
+"""Query embeddings cache unit testing."""
+
+from unittest.mock import patch
+
+from app.assistant import Assistant
+from app.query_cache import QueryEmbeddingsCache
+
+
+def test_normalized_questions_hit_per_model(tmp_path):
+    """Tests that rephrasings hit the same entry, per model and across instances."""
+    path = tmp_path / "query_cache.sqlite3"
+    cache = QueryEmbeddingsCache(model="model-a", max_entries=1, path=path)
+    assert cache.get("What is a deadlock?") is None
+    cache.put("What is a deadlock?", [0.5, 1.0])
+    assert cache.get("  what is a   DEADLOCK") == [0.5, 1.0]
+    cache.put("Explain backprop", [2.0])
+    assert cache.stats()["entries"] == 1
+    assert cache.get("what is a deadlock") == [0.5, 1.0]
+    assert (
+        QueryEmbeddingsCache(model="model-b", path=path).get("Explain backprop") is None
+    )
+    other_worker = QueryEmbeddingsCache(model="model-a", path=path)
+    assert other_worker.get("Explain backprop!") == [2.0]
+    stats = cache.stats()
+    assert (stats["hits"], stats["shared_hits"], stats["misses"]) == (2, 1, 1)
+
+
+@patch("app.assistant.ollama")
+def test_assistant_embeds_repeated_questions_once(mock_ollama, tmp_path):
+    """Tests that the assistant only calls /embed for questions not asked before."""
+    mock_ollama.embed.return_value = [[1.0, 0.0]]
+    cache = QueryEmbeddingsCache(model="m", path=tmp_path / "query_cache.sqlite3")
+    with patch("app.assistant.query_cache", cache):
+        assert Assistant.embed_question("Why?") == [[1.0, 0.0]]
+        assert Assistant.embed_question("why") == [[1.0, 0.0]]
+    mock_ollama.embed.assert_called_once_with("Why?")
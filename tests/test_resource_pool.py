@@ -0,0 +1,67 @@
+"""Resource pool unit testing."""
+
+from unittest.mock import MagicMock, patch
+
+from app.flat_store import FlatVectorStore
+from app.resource_pool import ResourcePool
+
+
+@patch("app.utils.Utils.VECTOR_STORE", "flat")
+@patch("app.utils.Utils.get_output_path")
+def test_lru_eviction_and_invalidation_close_handles(mock_output_path, tmp_path):
+    """Tests that stores are reused, closed when evicted or invalidated, and counted."""
+    mock_output_path.side_effect = lambda name, create=False: tmp_path / name
+    for book in ("One", "Two"):
+        FlatVectorStore.create(tmp_path / book).upsert(ids=["a"], embeddings=[[1.0]])
+    pool = ResourcePool(max_books=1)
+    assert pool.store("Missing") is None
+    one = pool.store("One")
+    assert pool.store("One") is one
+    with patch.object(FlatVectorStore, "close") as close:
+        assert pool.store("Two") is not one
+        close.assert_called_once()
+        pool.invalidate("Two")
+        assert close.call_count == 2
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["evictions"] == 1 and stats["invalidations"] == 1
+    assert stats["books"] == 0 and stats["open_stores"] == 0
+
+
+@patch("app.utils.Utils.VECTOR_STORE", "flat")
+@patch("app.utils.Utils.get_output_path")
+def test_leased_books_close_on_the_last_release(mock_output_path, tmp_path):
+    """Tests that handles dropped under a lease stay open until it ends."""
+    mock_output_path.side_effect = lambda name, create=False: tmp_path / name
+    for book in ("One", "Two"):
+        FlatVectorStore.create(tmp_path / book).upsert(ids=["a"], embeddings=[[1.0]])
+    pool = ResourcePool(max_books=1)
+    with patch.object(FlatVectorStore, "close") as close:
+        with pool.lease("One"):
+            one = pool.store("One")
+            with pool.lease("One"):
+                pool.invalidate("One")
+            pool.store("Two")
+            close.assert_not_called()
+            assert pool.stats()["retired"] == 1
+            assert one.count() == 1
+        close.assert_called_once()
+    assert pool.stats()["leased"] == 0 and pool.stats()["retired"] == 0
+
+
+@patch("app.utils.Utils.get_chroma_client")
+@patch("app.utils.Utils.get_output_path")
+def test_chroma_clients_are_reused(mock_output_path, mock_chroma_client, tmp_path):
+    """Tests that the pool shares one Chroma client per book until it is invalidated."""
+    mock_output_path.side_effect = lambda name, create=False: tmp_path / name
+    mock_chroma_client.side_effect = lambda path: MagicMock(name=path)
+    pool = ResourcePool(max_books=4)
+    client = pool.chroma_client("One")
+    assert pool.chroma_client("One") is client
+    pool.invalidate("One")
+    assert pool.chroma_client("One") is not client
+    pool.close()
+    assert pool.stats()["open_clients"] == 0
+    with patch("app.utils.Utils.VECTOR_STORE", "chroma"):
+        assert pool.store("Two") is None
+    assert mock_chroma_client.call_count == 2
@@ -0,0 +1,104 @@
+"""Vector store backends unit testing."""
+
+from unittest.mock import MagicMock
+from app.flat_store import FlatVectorStore
+from app.hnsw_store import HnswVectorStore
+from app.index_settings import IndexSettings
+from app.utils import Utils
+from app.vector_store import (
+    VectorStore,
+    create_store,
+    open_store,
+    reindex_store,
+    store_exists,
+)
+
+
+def test_hnsw_store_matches_flat_store_and_survives_reopen(tmp_path):
+    """Tests that the graph finds the exact neighbours and is rebuilt after a crash."""
+    vectors = [[float(row), float(row % 7), 1.0] for row in range(1, 60)]
+    ids = [str(row) for row in range(len(vectors))]
+    metadatas = [{"page": row % 3} for row in range(len(vectors))]
+    flat = FlatVectorStore.create(tmp_path / "flat")
+    flat.upsert(ids=ids, embeddings=vectors, metadatas=metadatas)
+    hnsw = HnswVectorStore.create(tmp_path / "hnsw")
+    hnsw.upsert(ids=ids, embeddings=vectors, metadatas=metadatas)
+    queries = [[3.0, 3.0, 1.0], [40.0, 1.0, 1.0]]
+    where = {"page": {"$ne": 1}}
+    expected = flat.query(query_embeddings=queries, n_results=5, where=where)
+    found = hnsw.query(query_embeddings=queries, n_results=5, where=where)
+    assert found["ids"] == expected["ids"]
+
+    hnsw.delete(ids=["2"])
+    hnsw._connection.close()  # Simulates a crash, the graph was never saved
+    reopened = HnswVectorStore(tmp_path / "hnsw")
+    assert reopened.count() == len(vectors) - 1
+    assert "2" not in reopened.query(query_embeddings=queries, n_results=5)["ids"][0]
+    reopened.close()
+    assert (tmp_path / "hnsw" / HnswVectorStore.INDEX_FILENAME).exists()
+
+
+def test_factory_selects_backend(tmp_path):
+    """Tests that the factory opens file backends and passes Chroma to the client."""
+    assert not store_exists(tmp_path, backend="hnsw")
+    store = create_store(tmp_path, backend="hnsw")
+    assert isinstance(store, VectorStore)
+    assert store_exists(tmp_path, backend="hnsw")
+    assert isinstance(open_store(tmp_path, backend="hnsw"), HnswVectorStore)
+
+    client = MagicMock()
+    assert (
+        create_store(tmp_path, backend="chroma", client=client, replace=True)
+        is client.create_collection.return_value
+    )
+    client.delete_collection.assert_called_once()
+
+
+def test_reindex_applies_new_settings_without_losing_records(tmp_path):
+    """Tests that reindexing rebuilds Chroma and hnsw stores with the saved settings."""
+    settings = IndexSettings(m=8, ef_construction=50, ef_search=100)
+    for backend in ("chroma", "hnsw"):
+        path = tmp_path / backend
+        store = create_store(path, backend=backend)
+        store.upsert(
+            ids=["a", "b", "c"],
+            embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+            metadatas=[{"page": 1}, {"page": 2}, {"page": 3}],
+            documents=["A", "B", "C"],
+        )
+        reindexed = reindex_store(path, settings, backend=backend)
+        assert reindexed.count() == 3
+        assert IndexSettings.load(path) == settings
+        found = reindexed.query(query_embeddings=[[1.0, 0.1]], n_results=1)
+        assert found["ids"] == [["a"]] and found["documents"] == [["A"]]
+    assert reindexed.m == 8 and reindexed.ef_search == 100
+    chroma = open_store(tmp_path / "chroma", backend="chroma")
+    assert chroma.metadata["hnsw:search_ef"] == 100
+    assert "hnsw:space" not in chroma.metadata
+
+
+def test_chroma_reindex_recovers_an_interrupted_swap(tmp_path):
+    """Tests that the old collection serves reads and is restored by a reindex."""
+    client = Utils.get_chroma_client(str(tmp_path))
+    store = create_store(tmp_path, backend="chroma", client=client)
+    store.add(ids=["a"], embeddings=[[1.0, 0.0]], documents=["A"])
+    store.modify(name=f"{Utils.COLLECTION_NAME}_previous")
+
+    assert store_exists(tmp_path, backend="chroma", client=client)
+    assert open_store(tmp_path, backend="chroma", client=client).get()["ids"] == ["a"]
+    reindexed = reindex_store(tmp_path, backend="chroma", client=client)
+    assert reindexed.name == Utils.COLLECTION_NAME and reindexed.count() == 1
+    assert [c.name for c in client.list_collections()] == [Utils.COLLECTION_NAME]
+
+
+def test_hnsw_store_ignores_quantization(tmp_path):
+    """Tests that hnsw stores keep float32 vectors only, the graph holds them anyway."""
+    store = FlatVectorStore.create(tmp_path, quantization="int8")
+    store.upsert(ids=["a"], embeddings=[[1.0, 0.0]])
+    store.close()
+    assert (tmp_path / FlatVectorStore.CODES_FILENAME).exists()
+
+    store = HnswVectorStore(tmp_path, quantization="float16")
+    assert store.quantization == "none"
+    assert not (tmp_path / FlatVectorStore.CODES_FILENAME).exists()
+    assert store.query(query_embeddings=[[1.0, 0.1]], n_results=1)["ids"] == [["a"]]